@@ -21,6 +21,7 @@ import logging
 import sys
 import os
 import pprint as pprint_module
+import time
 pp = pprint_module.PrettyPrinter(indent=4)
 pprint = pp.pprint
 
@@ -29,8 +30,14 @@ import cnucnu.errors as cc_errors
 from cnucnu.config import global_config
 from cnucnu.package_list import Repository, PackageList
 from cnucnu.checkshell import CheckShell
+from cnucnu.curl_pool import get_default_pool
+from cnucnu.host_policy import get_default_policy
 from cnucnu.bugzilla_reporter import BugzillaReporter
-from cnucnu.scm import SCM
+from cnucnu.fetcher import MultiFetcher
+from cnucnu.scheduler import Scheduler
+from cnucnu.scm import get_scm
+from cnucnu.shard import ShardResult, in_shard, merge_results, parse_shard
+from cnucnu.state_store import StateStore
 
 
 log = logging.getLogger('cnucnu')
@@ -39,39 +46,291 @@ log = logging.getLogger('cnucnu')
 class Actions(object):
     def action_report_outdated(self, args):
         """ file bugs for outdated packages """
+        self.check_packages(args)
+
+    def action_check(self, args):
+        """ check only the given packages and file bugs if they are outdated
+        """
+        # explicitly named packages are checked now, whatever their schedule,
+        # recent failures or state of the last run are
+        args.full_sweep = True
+        args.retry_failures = True
+        args.ignore_state = True
+        self.check_packages(args, package_names=args.packages)
+
+    def check_packages(self, args, package_names=None):
         br = BugzillaReporter(global_config.bugzilla_config)
-        repo = Repository(**global_config.config["repo"])
-        scm = SCM(**global_config.config["scm"])
+        repo = Repository(package_names=package_names,
+                          **global_config.config["repo"])
+        scm = get_scm(**global_config.config["scm"])
 
         pl = PackageList(repo=repo, scm=scm, br=br,
+                         package_names=package_names,
                          **global_config.config["package list"])
-        package_count = len(pl)
+        packages = [p for p in pl.packages if p.name >= args.start_with]
+        components = package_names
+        shard_result = None
+        if args.shard:
+            shard, shards = args.shard
+            packages = [p for p in packages if in_shard(p.name, shard, shards)]
+            components = sorted(set(p.name for p in packages))
+            shard_result = ShardResult(shard, shards)
+            log.info("Checking '%i' packages of shard '%i/%i'",
+                     len(packages), shard, shards)
+
+        # resolve the ignored owners while the upstream pages are fetched
+        pl.prefetch_ignore_packages()
+        # shards only plan their bug reports, they are sent by merge-shards
+        br.start_write_queue(dry_run=args.dry_run, plan=bool(args.shard))
+        self.load_bugs(args, br, components)
+        if package_names:
+            missing = set(package_names) - set(p.name for p in pl.packages)
+            for name in sorted(missing):
+                log.error("package '%s' not found in the package list", name)
+
+        state = StateStore(**global_config.config["state"])
+        try:
+            scheduler = Scheduler(state, **global_config.config["scheduler"])
+            packages = self.select_due(args, packages, state, scheduler)
+            if args.engine == "twisted":
+                from cnucnu.twisted_checker import TwistedChecker
+                checker = TwistedChecker(state=state, scheduler=scheduler,
+                                         **global_config.config["fetcher"])
+                reported = checker.run(packages, repo, dry_run=args.dry_run,
+                                       run_cache=pl.run_cache,
+                                       ignore_state=args.ignore_state)
+            else:
+                reported = self.check_serially(args, pl, packages, scm, state,
+                                               scheduler, shard_result)
+            results = self.close_write_queue(br)
+            # the bugs of shards are only sent when they are merged
+            if not args.dry_run and not args.shard:
+                self.record_reported(reported, results, state, scheduler)
+        finally:
+            state.close()
+        if state.enabled:
+            print "State: %s" % state.summary
+
+        print "Summary: %s" % pl.run_cache.summary
+        log.info("HTTP connections: %s", get_default_pool().summary)
+        log.info("Upstream hosts: %s", get_default_policy().summary)
+
+        if shard_result:
+            shard_result.plan = br.write_queue.operations
+            result_file = args.result_file or \
+                "cnucnu-shard-%i-of-%i.json" % args.shard
+            shard_result.save(result_file)
+            print "Shard result: %s" % result_file
+
+    def close_write_queue(self, br):
+        """ wait for the queued Bugzilla writes, print and return their
+        results
+        """
+        results = br.close_write_queue()
+        for result in results:
+            print result
+            if result.result:
+                print result.result
+        if br.write_queue:
+            print "Bugzilla: %s" % br.write_queue.summary
+        return results
+
+    def record_reported(self, packages, results, state, scheduler):
+        """ store the outdated `packages` as processed unless writing their
+        bug failed, so failed reports are retried in the next run
+        """
+        failed = set(name for result in results if result.error
+                     for name in result.names)
+        for package in packages:
+            if package.name in failed:
+                log.warning("Bug report of package '%s' failed, checking it "
+                            "again in the next run", package.name)
+                continue
+            state.record(package)
+            scheduler.reschedule(package)
+
+    def load_bugs(self, args, br, components=None):
+        """ load the bugs of `components` at once instead of querying them
+        per package
+        """
+        try:
+            if br.config.get("bug mirror"):
+                br.sync_mirror(full=args.full_bug_resync,
+                               components=components)
+            else:
+                br.prefetch_bugs(components=components)
+        except Exception, e:
+            log.warning("Cannot prefetch bugs, querying them per package "
+                        "instead (%s)", e)
+
+    def select_due(self, args, packages, state, scheduler):
+        """ Return the packages of `packages` that are due according to their
+        release history and did not fail recently, unless the arguments ask
+        to check them anyway
+        """
+        if not args.full_sweep:
+            packages = scheduler.due(packages)
+        if not args.retry_failures:
+            packages = self.skip_failing(packages, state)
+        return packages
+
+    def check_serially(self, args, pl, packages, scm, state, scheduler,
+                       shard_result=None):
+        """ prefetch upstream pages and check the packages one by one,
+        skipping packages that did not change since the last run
+
+        :return: outdated packages whose bug report was queued or not needed
+        """
+        package_count = len(packages)
+        fetcher = MultiFetcher(**global_config.config["fetcher"])
+        pl.prefetch_html(fetcher, packages)
+
+        outdated = []
+
+        def check(package):
+            if not args.ignore_state and state.restore_unchanged(package):
+                log.info("package '%s' unchanged since the last run",
+                         package.name)
+                scheduler.reschedule(package)
+                return
+            if package.upstream_newer:
+                print "package '%s' outdated (%s < %s)" % (
+                    package.name,
+                    package.repo_version,
+                    package.latest_upstream
+                )
+                outdated.append(package)
+            else:
+                state.record(package)
+                scheduler.reschedule(package)
+
         log.info("Checking '%i' packages", package_count)
-        for number, package in enumerate(pl, start=1):
-            if package.name >= args.start_with:
-                log.info("checking package '%s' (%i/%i)", package.name, number,
-                         package_count)
-                try:
-                    if package.upstream_newer:
-                        print "package '%s' outdated (%s < %s)" % (
-                            package.name,
-                            package.repo_version,
-                            package.latest_upstream
-                        )
-                        bug_url = package.report_outdated(dry_run=args.dry_run)
-                        if bug_url:
-                            print bug_url
-                except cc_errors.UpstreamVersionRetrievalError, e:
-                    log.error("Failed to fetch upstream information for "
-                              "package '%s' (%s)" % (package.name, e.message))
-                except cc_errors.PackageNotFoundError, e:
-                    log.error(e)
-                except Exception, e:
-                    log.exception("Exception occured while processing "
-                                  "package '%s':\n%s" % (package.name,
-                                                         pp.pformat(e)))
+        for number, package in enumerate(packages, start=1):
+            log.info("checking package '%s' (%i/%i)", package.name, number,
+                     package_count)
+            error = self.guarded(package, check)
+            if error is None:
+                state.clear_failure(package)
+            elif isinstance(error, cc_errors.UpstreamVersionRetrievalError) \
+                    and not isinstance(error, cc_errors.HostUnavailableError):
+                # unavailable hosts are handled by the host policy
+                state.record_failure(package, error)
+            if error is not None and shard_result:
+                shard_result.add_failure(package, error)
+        if shard_result:
+            shard_result.checked = package_count
+            for package in outdated:
+                shard_result.add_outdated(package)
+
+        # download the sources files of all outdated packages at once
+        try:
+            scm.prefetch_sources([p for p in outdated if p.nagging])
+        except Exception, e:
+            log.warning("Cannot prefetch sources files (%s)", e)
+
+        reported = []
+
+        def report(package):
+            bug_url = package.report_outdated(dry_run=args.dry_run)
+            if bug_url:
+                print bug_url
+            reported.append(package)
+
+        for package in outdated:
+            self.guarded(package, report)
+        return reported
+
+    def skip_failing(self, packages, state):
+        """ Return the packages of `packages` whose last failure is not in
+        its backoff time anymore
+        """
+        errors = state.backoff_errors()
+        remaining = []
+        for package in packages:
+            error = errors.get(state.key(package))
+            if error:
+                log.debug("Skipping package '%s' (%s)", package.name, error)
+            else:
+                remaining.append(package)
+        if len(remaining) < len(packages):
+            log.info("Skipping '%i' packages that failed recently",
+                     len(packages) - len(remaining))
+        return remaining
+
+    def guarded(self, package, function):
+        """ Call `function` with `package` and log all errors
+
+        :return: the logged exception or None
+        """
+        try:
+            function(package)
+        except cc_errors.UpstreamVersionRetrievalError, e:
+            log.error("Failed to fetch upstream information for "
+                      "package '%s' (%s)" % (package.name, e.message))
+            return e
+        except cc_errors.PackageNotFoundError, e:
+            log.error(e)
+            return e
+        except Exception, e:
+            log.exception("Exception occured while processing "
+                          "package '%s':\n%s" % (package.name,
+                                                 pp.pformat(e)))
+            return e
+        return None
+
+    def action_report_failures(self, args):
+        """ list packages whose upstream information could not be retrieved
+        for a long time
+        """
+        state = StateStore(**global_config.config["state"])
+        try:
+            failures = state.failures(min_age=args.min_days * 86400)
+        finally:
+            state.close()
+        for failure in failures:
+            print "%s: %s since %s, %i failures - %s" % (
+                failure["name"], failure["error_class"],
+                time.strftime("%Y-%m-%d",
+                              time.localtime(failure["first_failed"])),
+                failure["count"], failure["url"])
+            print "    %s" % failure["message"]
+        print "%i failing packages" % len(failures)
+
+    def action_merge_shards(self, args):
+        """ combine the result files of the shards of report-outdated and
+        file their bugs
+        """
+        merged, missing = merge_results([ShardResult.load(filename) for
+                                         filename in args.result_files])
+        for shard in missing:
+            log.warning("No result of shard '%i/%i'", shard, merged.shards)
+
+        for package in merged.outdated:
+            print "package '%(name)s' outdated (%(repo_version)s < " \
+                "%(latest_upstream)s)" % package
+        for package in merged.failed:
+            print "package '%(name)s' failed: %(message)s" % package
+        print "%i packages checked, %i outdated, %i failed" % (
+            merged.checked, len(merged.outdated), len(merged.failed))
+
+        br = BugzillaReporter(global_config.bugzilla_config)
+        if merged.plan:
+            # the bugs might have been filed since the shards looked for them
+            self.load_bugs(args, br, sorted(set(
+                name for (action, name, request) in merged.plan)))
+        br.start_write_queue(dry_run=args.dry_run)
+        for action, name, request in merged.plan:
+            summary = request["short_desc" if action == "create" else
+                              "summary"]
+            bug = br.find_bug(name, summary.split(" ")[0] + " ")
+            if bug:
+                log.info("already reported: %s %s", br.bug_url(bug),
+                         bug.bug_status)
+            elif action == "create":
+                br.write_queue.create(name, request)
             else:
-                log.info("skipping package '%s'", package.name)
+                br.write_queue.update(name, request)
+        self.close_write_queue(br)
 
     def action_dump_config(self, args):
         """ dump config to stdout """
@@ -111,6 +370,13 @@ class Actions(object):
 
 if __name__ == '__main__':
     import argparse
+
+    def shard_argument(text):
+        try:
+            return parse_shard(text)
+        except ValueError, e:
+            raise argparse.ArgumentTypeError(str(e))
+
     parser = argparse.ArgumentParser()
     actions = Actions()
 
@@ -124,6 +390,38 @@ if __name__ == '__main__':
                         choices=("DEBUG", "INFO", "WARNING", "ERROR",
                                  "CRITICAL"),
                         default="WARNING")
+    parser.add_argument("--engine", dest="engine",
+                        help="How to check packages: prefetch upstream pages "
+                        "with pycurl and check them one by one or check all "
+                        "of them as coroutines on the Twisted reactor, "
+                        "default: %(default)s",
+                        choices=("curlmulti", "twisted"),
+                        default="curlmulti")
+    parser.add_argument("--full-bug-resync", dest="full_bug_resync",
+                        help="Fetch all bugs again instead of only the ones "
+                        "changed since the last run",
+                        default=False, action="store_true")
+    parser.add_argument("--ignore-state", dest="ignore_state",
+                        help="Check all packages, even the ones that did not "
+                        "change since the last run",
+                        default=False, action="store_true")
+    parser.add_argument("--full-sweep", dest="full_sweep",
+                        help="Check all packages, not only the ones that are "
+                        "due according to their release history",
+                        default=False, action="store_true")
+    parser.add_argument("--retry-failures", dest="retry_failures",
+                        help="Check packages that failed recently before "
+                        "their backoff time passed",
+                        default=False, action="store_true")
+    parser.add_argument("--shard", dest="shard", type=shard_argument,
+                        help="Only check the packages whose name hashes to "
+                        "shard K of N and save the results and the planned "
+                        "bug reports for merge-shards instead of filing bugs",
+                        metavar="K/N", default=None)
+    parser.add_argument("--result-file", dest="result_file",
+                        help="File for the results of a shard, default: "
+                        "cnucnu-shard-K-of-N.json",
+                        metavar="FILE", default="")
     parser.add_argument("--start-with", dest="start_with",
                         help="Start with this package when reporting bugs",
                         metavar="PACKAGE", default="")
@@ -134,8 +432,24 @@ if __name__ == '__main__':
     possible_actions.sort()
     for action, help_text in possible_actions:
         command_parser = subparsers.add_parser(action, help=help_text)
+        if action == "check":
+            command_parser.add_argument("packages", nargs="+",
+                                        metavar="PACKAGE",
+                                        help="packages to check")
+        elif action == "merge-shards":
+            command_parser.add_argument("result_files", nargs="+",
+                                        metavar="FILE",
+                                        help="result files of the shards")
+        elif action == "report-failures":
+            command_parser.add_argument("--min-days", dest="min_days",
+                                        type=int, default=30,
+                                        help="Only list packages failing "
+                                        "for this many days, default: "
+                                        "%(default)s")
 
     args = parser.parse_args()
+    if args.shard and args.engine == "twisted":
+        parser.error("--shard is only supported with the curlmulti engine")
 
     logging.basicConfig(level=getattr(logging, args.loglevel.upper()))
 
@@ -0,0 +1,188 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8 foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+""" :author: Till Maas
+    :contact: opensource@till.name
+    :license: GPLv2+
+"""
+__docformat__ = "restructuredtext"
+
+import logging
+import os
+import sqlite3
+import xmlrpclib
+
+log = logging.getLogger('cnucnu.bug_mirror')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bugs (
+    id INTEGER PRIMARY KEY,
+    component TEXT,
+    status TEXT,
+    short_desc TEXT,
+    last_change_time TEXT
+);
+CREATE TABLE IF NOT EXISTS sync (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+FIELDS = ["id", "component", "status", "summary", "last_change_time"]
+
+
+class MirroredBug(object):
+    """ The fields of a bug needed by `BugzillaReporter`, named like the
+    attributes of python-bugzilla's Bug
+    """
+    def __init__(self, bug_id, component, bug_status, short_desc,
+                 last_change_time):
+        self.bug_id = bug_id
+        self.component = component
+        self.bug_status = bug_status
+        self.short_desc = short_desc
+        self.last_change_time = last_change_time
+
+    def __repr__(self):
+        return "<MirroredBug #%i %s: %s>" % (self.bug_id, self.bug_status,
+                                             self.short_desc)
+
+
+def _time_string(value):
+    """ Return the XML-RPC dateTime `value` as sortable string """
+    if isinstance(value, xmlrpclib.DateTime):
+        return value.value
+    return str(value)
+
+
+class BugMirror(object):
+    """ Local copy of all bugs matching a Bugzilla search, kept in an SQLite
+    database.
+
+    `sync` only asks Bugzilla for the bugs changed since the newest
+    last_change_time in the mirror.
+
+    :Parameters:
+        filename : str
+            SQLite database file
+        page_size : int
+            Bugs per search request
+
+    """
+    def __init__(self, filename, page_size=1000):
+        filename = os.path.expanduser(filename)
+        directory = os.path.dirname(filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.text_factory = str
+        self.connection.executescript(SCHEMA)
+        self.page_size = page_size
+
+    def _get_sync(self, key):
+        row = self.connection.execute(
+            "SELECT value FROM sync WHERE key = ?", (key, )).fetchone()
+        return row[0] if row else None
+
+    def _set_sync(self, key, value):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO sync (key, value) VALUES (?, ?)",
+            (key, value))
+
+    def sync(self, proxy, query, full=False):
+        """ Update the mirror with the bugs changed since the last sync
+
+        :Parameters:
+            proxy : xmlrpclib.ServerProxy
+                Connection to the Bugzilla XML-RPC API
+            query : dict
+                Bug.search parameters selecting the mirrored bugs
+            full : bool
+                Fetch all bugs again and drop the ones that no longer match
+
+        :return: number of received bugs
+        """
+        # a different query selects different bugs
+        query_key = repr(sorted(query.items()))
+        if self._get_sync("query") != query_key:
+            full = True
+        since = None if full else self._get_sync("last_change_time")
+
+        params = dict(query)
+        params["include_fields"] = FIELDS
+        params["limit"] = self.page_size
+        if since:
+            # all bugs changed at this time or later
+            params["last_change_time"] = xmlrpclib.DateTime(since)
+
+        received = []
+        offset = 0
+        while True:
+            params["offset"] = offset
+            bugs = proxy.Bug.search(params)["bugs"]
+            received.extend(bugs)
+            if len(bugs) < self.page_size:
+                break
+            offset += self.page_size
+
+        with self.connection:
+            if full:
+                self.connection.execute("DELETE FROM bugs")
+            newest = since
+            for bug in received:
+                component = bug["component"]
+                if isinstance(component, list):
+                    component = component[0]
+                changed = _time_string(bug["last_change_time"])
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO bugs VALUES (?, ?, ?, ?, ?)",
+                    (bug["id"], component, bug["status"], bug["summary"],
+                     changed))
+                if newest is None or changed > newest:
+                    newest = changed
+            if newest:
+                self._set_sync("last_change_time", newest)
+            self._set_sync("query", query_key)
+
+        log.info("%s sync of the bug mirror received '%i' bugs",
+                 "Full" if full else "Incremental", len(received))
+        return len(received)
+
+    def bugs(self, components=None):
+        """ Return the mirrored bugs ordered by id
+
+        :Parameters:
+            components : [str]
+                Only return bugs of these components, all bugs if None
+
+        """
+        rows = self.connection.execute(
+            "SELECT id, component, status, short_desc, last_change_time "
+            "FROM bugs ORDER BY id")
+        bugs = [MirroredBug(*row) for row in rows]
+        if components is not None:
+            components = set(components)
+            bugs = [bug for bug in bugs if bug.component in components]
+        return bugs
+
+    def __len__(self):
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM bugs").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
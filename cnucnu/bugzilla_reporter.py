@@ -22,6 +22,7 @@ from config import global_config
 from helper import filter_dict
 
 import logging
+import threading
 log = logging.getLogger('cnucnu.bugzilla_reporter')
 
 
@@ -37,6 +38,13 @@ class BugzillaReporter(object):
 
     def __init__(self, config=None):
         self._bz = None
+        # component -> first word of short_desc -> [bug], None until
+        # prefetch_bugs() is called
+        self._bug_index = None
+        # guards _bug_index, the writer thread adds the bugs it creates
+        self._bug_index_lock = threading.Lock()
+        # `cnucnu.bugzilla_writer.BugzillaWriteQueue` for deferred writes
+        self.write_queue = None
 
         if not config:
             config = global_config.bugzilla_config
@@ -67,10 +75,16 @@ class BugzillaReporter(object):
     @property
     def bz(self):
         if not self._bz:
-            rpc_conf = filter_dict(self.config, ["url", "user", "password"])
-            self._bz = Bugzilla(**rpc_conf)
+            self._bz = self.connect()
         return self._bz
 
+    def connect(self):
+        """ Return a new connection to the configured Bugzilla, the XML-RPC
+        proxy must not be shared between threads
+        """
+        rpc_conf = filter_dict(self.config, ["url", "user", "password"])
+        return Bugzilla(**rpc_conf)
+
     def bug_url(self, bug):
         if isinstance(bug, str):
             bug_id = bug
@@ -79,9 +93,123 @@ class BugzillaReporter(object):
 
         return "%s%s" % (self.config['bug url prefix'], bug_id)
 
+    def start_write_queue(self, dry_run=True, plan=False):
+        """ Send all following bug creations and updates from a background
+        thread with the configured rate limit
+
+        :Parameters:
+            plan : bool
+                Only collect the writes in a
+                `cnucnu.bugzilla_writer.BugzillaWritePlan` to send them later
+
+        """
+        from cnucnu.bugzilla_writer import BugzillaWritePlan, \
+            BugzillaWriteQueue
+
+        if plan:
+            self.write_queue = BugzillaWritePlan()
+            return
+        self.write_queue = BugzillaWriteQueue(
+            self, rate=self.config.get("write rate", 1.0),
+            burst=self.config.get("write burst", 5), dry_run=dry_run)
+
+    def close_write_queue(self):
+        """ Wait until all queued writes are sent and return their results
+        """
+        if self.write_queue is None:
+            return []
+        results = self.write_queue.close()
+        log.info("Bugzilla writes: %s", self.write_queue.summary)
+        return results
+
+    def sync_mirror(self, full=False, components=None):
+        """ Update the local bug mirror incrementally and answer later bug
+        lookups from it
+
+        :Parameters:
+            full : bool
+                Fetch all bugs again instead of only the changed ones
+            components : [str]
+                Only use bugs of these components, all bugs if None
+
+        """
+        from cnucnu.bug_mirror import BugMirror
+
+        mirror = BugMirror(self.config["bug mirror"],
+                           self.config.get("prefetch page size", 1000))
+        try:
+            mirror.sync(self.bz._proxy,
+                        {'creator': self.config['user'],
+                         'product': self.config['product']}, full=full)
+            bug_index = {}
+            for bug in mirror.bugs(components):
+                self._index_bug(bug_index, bug)
+        finally:
+            mirror.close()
+        self._bug_index = bug_index
+
+    def prefetch_bugs(self, components=None):
+        """ Load all bugs reported by the configured user with a few paged
+        queries and answer later bug lookups from them
+
+        :Parameters:
+            components : [str]
+                Only load bugs of these components, all bugs if None
+
+        """
+        page_size = self.config.get("prefetch page size", 1000)
+        query = {'bug_status': self.bug_status_open + self.bug_status_closed,
+                 'limit': page_size}
+        if components is not None:
+            query['component'] = list(components)
+        query.update(self.base_query)
+
+        bug_index = {}
+        count = 0
+        offset = 0
+        while True:
+            query['offset'] = offset
+            log.debug("prefetch_bugs: Bugzilla query: %s", query)
+            bugs = self.bz.query(query)
+            for bug in bugs:
+                self._index_bug(bug_index, bug)
+            count += len(bugs)
+            if len(bugs) < page_size:
+                break
+            offset += page_size
+        self._bug_index = bug_index
+        log.info("Prefetched '%i' bugs of '%i' components", count,
+                 len(bug_index))
+
+    @staticmethod
+    def _index_bug(bug_index, bug):
+        components = bug.component
+        if not isinstance(components, list):
+            components = [components]
+        prefix = bug.short_desc.split(" ")[0]
+        for component in components:
+            bug_index.setdefault(component, {}).setdefault(
+                prefix, []).append(bug)
+
+    def _component_bugs(self, component):
+        """ Return all prefetched bugs of `component` in query order """
+        with self._bug_index_lock:
+            prefixes = self._bug_index.get(component, {})
+            bugs = [bug for bugs in prefixes.values() for bug in bugs]
+        bugs.sort(key=lambda bug: bug.bug_id)
+        return bugs
+
     def report_outdated(self, package, dry_run=True):
         if not package.exact_outdated_bug:
             if not package.open_outdated_bug:
+                if self.write_queue:
+                    bug_dict = self.outdated_bug_dict(package)
+                    if bug_dict["short_desc"] in \
+                            self.write_queue.queued_summaries:
+                        log.info("already queued: %s", bug_dict["short_desc"])
+                    else:
+                        self.write_queue.create(package.name, bug_dict)
+                    return ""
                 new_bug, change_status = self.create_outdated_bug(package,
                                                                   dry_run)
                 return self.bug_url(new_bug)
@@ -95,6 +223,11 @@ class BugzillaReporter(object):
                 bug_version = short_desc.split(" ")[0][len(package.name) + 1:]
 
                 if bug_version != package.latest_upstream:
+                    if self.write_queue and open_bug.bug_id in \
+                            self.write_queue.queued_updates:
+                        log.info("update already queued: %s",
+                                 self.bug_url(open_bug))
+                        return ""
                     update = {'summary': self.config["short_desc template"]
                               % package,
                               'comment': {'body':
@@ -102,6 +235,9 @@ class BugzillaReporter(object):
                                           package, 'is_private': False},
                               'ids': [open_bug.bug_id],
                               }
+                    if self.write_queue:
+                        self.write_queue.update(package.name, update)
+                        return ""
                     log.debug("About to update bug '%s' with '%r'" % (
                         open_bug.bug_id, update))
                     res = self.bz._proxy.Bug.update(update)
@@ -114,37 +250,76 @@ class BugzillaReporter(object):
                                                  bug.bug_status))
             return ""
 
-    def create_outdated_bug(self, package, dry_run=True):
+    def outdated_bug_dict(self, package):
         bug_dict = {
             'component': package.name,
             'short_desc': self.config["short_desc template"] % package,
             'description': self.config["description template"] % package
         }
         bug_dict.update(self.new_bug)
+        return bug_dict
+
+    def send_outdated_bug(self, bug_dict, bz=None):
+        """ Create the bug `bug_dict` and set its status
+
+        :Parameters:
+            bz : bugzilla.Bugzilla
+                Connection to use instead of the one of the reporter
+
+        """
+        if bz is None:
+            bz = self.bz
+        new_bug = bz.createbug(**bug_dict)
+        change_status = None
+        log.debug("Created new bug: %r" % new_bug)
+        log.info("Created bug: %s" % self.bug_url(new_bug))
+        if self._bug_index is not None:
+            with self._bug_index_lock:
+                self._index_bug(self._bug_index, new_bug)
+
+        if new_bug.bug_status != self.config['bug status']:
+            change_status = bz._proxy.bugzilla.changeStatus(
+                new_bug.bug_id, self.config['bug status'],
+                self.config['user'], "", "", False, False, 1)
+            log.debug("Changed bug status %r" % change_status)
+        return (new_bug, change_status)
+
+    def create_outdated_bug(self, package, dry_run=True):
+        bug_dict = self.outdated_bug_dict(package)
         if not dry_run:
-            new_bug = self.bz.createbug(**bug_dict)
-            change_status = None
-            log.debug("Created new bug: %r" % new_bug)
-            log.info("Created bug: %s" % self.bug_url(new_bug))
-
-            if new_bug.bug_status != self.config['bug status']:
-                change_status = self.bz._proxy.bugzilla.changeStatus(
-                    new_bug.bug_id, self.config['bug status'],
-                    self.config['user'], "", "", False, False, 1)
-                log.debug("Changed bug status %r" % change_status)
-            return (new_bug, change_status)
+            return self.send_outdated_bug(bug_dict)
         else:
             return (bug_dict, None)
 
     def get_exact_outdated_bug(self, package):
         short_desc_pattern = '%(name)s-%(latest_upstream)s ' % package
-        query = {'component': package.name,
+        return self.find_bug(package.name, short_desc_pattern)
+
+    def find_bug(self, component, short_desc_pattern):
+        """ Return a bug of `component` whose short_desc starts with
+        `short_desc_pattern` or None
+
+        :Parameters:
+            short_desc_pattern : str
+                First word of the short_desc followed by a space
+
+        """
+        if self._bug_index is not None:
+            with self._bug_index_lock:
+                prefixes = self._bug_index.get(component, {})
+                bugs = list(prefixes.get(short_desc_pattern[:-1], []))
+            for bug in bugs:
+                if bug.short_desc.startswith(short_desc_pattern):
+                    return bug
+            return None
+
+        query = {'component': component,
                  'bug_status': self.bug_status_open + self.bug_status_closed,
                  'short_desc': short_desc_pattern,
                  'short_desc_type': 'substring'}
 
         query.update(self.base_query)
-        logging.debug("get_exact_outdated_bug: Bugzilla query: %s", query)
+        logging.debug("find_bug: Bugzilla query: %s", query)
         bugs = self.bz.query(query)
         if bugs:
             # TODO if more than one bug, manual intervention might be required
@@ -159,6 +334,12 @@ class BugzillaReporter(object):
         return None
 
     def get_open_outdated_bug(self, package):
+        if self._bug_index is not None:
+            for bug in self._component_bugs(package.name):
+                if bug.bug_status == self.config['bug status']:
+                    return bug
+            return None
+
         q = {'component': [package.name],
              'bug_status': [self.config['bug status']]
              }
@@ -0,0 +1,222 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8 foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+""" :author: Till Maas
+    :contact: opensource@till.name
+    :license: GPLv2+
+"""
+__docformat__ = "restructuredtext"
+
+import logging
+import pprint
+import Queue
+import threading
+import time
+
+log = logging.getLogger('cnucnu.bugzilla_writer')
+
+
+class TokenBucket(object):
+    """ Allow `rate` operations per second on average and bursts of up to
+    `burst` operations, a rate of 0 disables the limit
+    """
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.updated = time.time()
+
+    def acquire(self):
+        """ Block until an operation is allowed """
+        if not self.rate:
+            return
+        while True:
+            now = time.time()
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            time.sleep((1 - self.tokens) / self.rate)
+
+
+class WriteResult(object):
+    """ Outcome of one Bugzilla call made by the write queue """
+    def __init__(self, action, names, request, result=None, error=None):
+        self.action = action
+        self.names = names
+        self.request = request
+        self.result = result
+        self.error = error
+
+    def __str__(self):
+        if self.error:
+            return "%s failed for %s: %s" % (self.action,
+                                             ", ".join(self.names),
+                                             self.error)
+        return "%s %s" % (self.action, ", ".join(self.names))
+
+
+class BugzillaWriteQueue(object):
+    """ Queue of bug creations and updates that a background thread sends to
+    Bugzilla, so the package checks never wait for Bugzilla.
+
+    The writer sends at most `rate` requests per second. Every update is
+    sent on its own, because the summary and comment of an update are made
+    for its package. With `dry_run` the requests are printed instead of
+    sent.
+
+    :Parameters:
+        reporter : `cnucnu.bugzilla_reporter.BugzillaReporter`
+            Reporter with the Bugzilla connection and config
+        rate : float
+            Requests per second, 0 for no limit
+        burst : int
+            Requests that may be sent at once after an idle period
+        dry_run : bool
+            Print the requests instead of sending them
+
+    """
+    def __init__(self, reporter, rate=1.0, burst=5, dry_run=True):
+        self.reporter = reporter
+        self.bucket = TokenBucket(rate, burst)
+        self.dry_run = dry_run
+
+        self.queue = Queue.Queue()
+        self.results = []
+        # summaries of queued bug creations
+        self.queued_summaries = set()
+        # ids of bugs with queued updates
+        self.queued_updates = set()
+        # connection of the writer thread, created there
+        self.bz = None
+
+        self.thread = threading.Thread(target=self._run,
+                                       name="bugzilla-writer")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def create(self, name, bug_dict):
+        """ Queue the creation of the bug `bug_dict` for package `name` """
+        self.queued_summaries.add(bug_dict["short_desc"])
+        self.queue.put(("create", name, bug_dict))
+
+    def update(self, name, update):
+        """ Queue the Bug.update call `update` for package `name` """
+        self.queued_updates.update(update["ids"])
+        self.queue.put(("update", name, update))
+
+    def close(self):
+        """ Send all queued requests and return the results """
+        self.queue.put(None)
+        self.thread.join()
+        return self.results
+
+    def _run(self):
+        while True:
+            operation = self.queue.get()
+            if operation is None:
+                return
+            action, name, request = operation
+            if action == "create":
+                self._send(self._create, "created", [name], request)
+            else:
+                self._send(self._update, "updated", [name], request)
+
+    def _send(self, method, action, names, request):
+        if self.dry_run:
+            print "Would send for %s:\n%s" % (", ".join(names),
+                                              pprint.pformat(request))
+            self.results.append(WriteResult("would be " + action, names,
+                                            request))
+            return
+        self.bucket.acquire()
+        try:
+            result = method(request)
+        except Exception, e:
+            log.exception("Bugzilla request for '%s' failed",
+                          ", ".join(names))
+            self.results.append(WriteResult(action, names, request,
+                                            error=e))
+        else:
+            self.results.append(WriteResult(action, names, request,
+                                            result=result))
+
+    def _connection(self):
+        if self.bz is None:
+            self.bz = self.reporter.connect()
+        return self.bz
+
+    def _create(self, bug_dict):
+        new_bug, change_status = self.reporter.send_outdated_bug(
+            bug_dict, self._connection())
+        return self.reporter.bug_url(new_bug)
+
+    def _update(self, update):
+        log.debug("About to update bugs '%s' with '%r'" % (update["ids"],
+                                                           update))
+        res = self._connection()._proxy.Bug.update(update)
+        log.debug("Result from bug update: %r" % res)
+        return ", ".join(self.reporter.bug_url(str(bug_id)) for bug_id in
+                         update["ids"])
+
+    @property
+    def summary(self):
+        created = sum(1 for r in self.results
+                      if r.action.endswith("created") and not r.error)
+        updated = sum(len(r.request["ids"]) for r in self.results
+                      if r.action.endswith("updated") and not r.error)
+        failed = sum(1 for r in self.results if r.error)
+        if self.dry_run:
+            return "dry run: %i bugs would be created, %i bugs updated" % (
+                created, updated)
+        return "%i bugs created, %i bugs updated, %i requests failed" % (
+            created, updated, failed)
+
+
+class BugzillaWritePlan(object):
+    """ Collect the bug creations and updates of a run instead of sending
+    them, so the writes of several runs can be sent from one place later.
+
+    It offers the methods of `BugzillaWriteQueue` used by
+    `cnucnu.bugzilla_reporter.BugzillaReporter`.
+    """
+    def __init__(self):
+        # (action, name, request) in the order they were planned
+        self.operations = []
+        self.queued_summaries = set()
+        self.queued_updates = set()
+
+    def create(self, name, bug_dict):
+        self.queued_summaries.add(bug_dict["short_desc"])
+        self.operations.append(("create", name, bug_dict))
+
+    def update(self, name, update):
+        self.queued_updates.update(update["ids"])
+        self.operations.append(("update", name, update))
+
+    def close(self):
+        return [WriteResult("planned to be %sd" % action, [name], request)
+                for (action, name, request) in self.operations]
+
+    @property
+    def summary(self):
+        created = sum(1 for o in self.operations if o[0] == "create")
+        return "planned: %i bugs to create, %i bugs to update" % (
+            created, len(self.operations) - created)
@@ -30,7 +30,7 @@ import simplemediawiki
 from cnucnu.package_list import Package, PackageList, Repository
 from cnucnu.bugzilla_reporter import BugzillaReporter
 from cnucnu.helper import pprint
-from cnucnu.scm import SCM
+from cnucnu.scm import get_scm
 from cnucnu.errors import UpstreamVersionRetrievalError, PackageNotFoundError
 
 try:
@@ -138,7 +138,7 @@ class CheckShell(cmd.Cmd):
         self.update_prompt()
         self.config = config
         self._br = None
-        self.scm = SCM()
+        self.scm = get_scm(**config.config["scm"])
         self.we = WikiEditor(config=config.config)
         self.messages = []
 
@@ -160,6 +160,13 @@ class CheckShell(cmd.Cmd):
             except Exception, e:
                 print "Cannot query bugzilla, faulty/missing config?", repr(e),
                 dict(e), str(e)
+            else:
+                if bugzilla_config.get("bug mirror"):
+                    try:
+                        self._br.sync_mirror()
+                    except Exception, e:
+                        print "Cannot sync the bug mirror, querying bugzilla "\
+                            "directly:", str(e)
         return self._br
 
     def update_prompt(self):
@@ -194,9 +201,7 @@ class CheckShell(cmd.Cmd):
         print self.package.html
 
     def complete_inspect(self, text, line, begidx, endidx):
-        package_names = [p.name for p in self.package_list if
-                         p.name.startswith(text)]
-        return package_names
+        return self.package_list.names_with_prefix(text)
 
     def do_inspect(self, args):
         try:
@@ -36,6 +36,14 @@ bugzilla:
     version: rawhide
     keywords: FutureFeature,Triaged
     bug status: NEW
+    # bugs per query when loading all reported bugs before the checks
+    prefetch page size: 1000
+    # local copy of all reported bugs, updated incrementally, empty to query
+    # all bugs on every run
+    bug mirror: ~/.cache/cnucnu/bugs.sqlite
+    # bug creations and updates per second, 0 for no limit
+    write rate: 1.0
+    write burst: 5
     explanation url: 'https://fedoraproject.org/wiki/Upstream_release_monitoring'
 
     short_desc template: "%%(name)s-%%(latest_upstream)s is available"
@@ -59,10 +67,80 @@ bugzilla:
 repo:
     path: 'http://kojipkgs.fedoraproject.org/mash/rawhide/source/SRPMS'
     name: Fedora Rawhide
+    # repodata: read repodata/ directly, repoquery: run /usr/bin/repoquery
+    backend: repodata
+    # parsed metadata is kept here until the repository changes
+    cache_dir: ~/.cache/cnucnu/repodata
 
 scm:
+    # http: download the sources files from view_scm_url, mirror: read them
+    # from a local dist-git mirror in mirror_path
+    backend: http
     view_scm_url: https://pkgs.fedoraproject.org/cgit/%(name)s.git/plain/sources
     cainfo: "fedora-server-ca.cert"
+    # sources files are downloaded again only if they changed
+    cache_dir: ~/.cache/cnucnu/sources
+    # tree: <mirror_path>/<name>/sources files, git: bare repositories
+    # <mirror_path>/<name>.git, sources are read from mirror_branch
+    mirror_path: ""
+    mirror_layout: tree
+    mirror_branch: master
+
+http cache:
+    # conditional request cache for upstream pages, empty to disable
+    directory: ~/.cache/cnucnu/http
+    # bytes, least recently used entries are removed above this size
+    max_size: 268435456
+    # seconds until a cached page is downloaded again unconditionally
+    ttl: 604800
+
+fetcher:
+    # transfers in flight while prefetching upstream pages
+    max_connections: 20
+    max_host_connections: 4
+    # bytes, larger upstream responses are aborted, 0 for no limit
+    max_body_size: 16777216
+
+hosts:
+    # requests started per second and upstream host, 0 for no limit
+    rate: 2.0
+    # consecutive connection failures after which a host is not contacted
+    # for circuit_time seconds
+    failure_threshold: 3
+    circuit_time: 3600
+    # seconds, the transfer timeout follows timeout_factor times the average
+    # transfer time of the host within min_timeout and max_timeout
+    connect_timeout: 10
+    min_timeout: 30
+    max_timeout: 120
+    timeout_factor: 10
+
+pkgdb:
+    # packages of ignored owners are looked up again after ttl seconds
+    cache_dir: ~/.cache/cnucnu/pkgdb
+    ttl: 86400
+    # concurrent requests
+    threads: 8
+    page_size: 500
+
+state:
+    # results of previous runs to skip unchanged packages, empty to disable
+    filename: ~/.cache/cnucnu/state.sqlite
+    # seconds to skip a package whose upstream information could not be
+    # retrieved, doubled after every further failure up to the maximum
+    failure_backoff: 86400
+    max_failure_backoff: 2592000
+    # writes per transaction
+    commit_interval: 500
+
+scheduler:
+    # seconds between two checks of a package, packages are checked
+    # checks_per_release times per expected time between two releases
+    min_interval: 86400
+    max_interval: 2592000
+    checks_per_release: 4
+    # maximum packages to check per run, 0 for no limit
+    budget: 0
 
 package list:
     mediawiki:
@@ -0,0 +1,106 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8 foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+""" :author: Till Maas
+    :contact: opensource@till.name
+    :license: GPLv2+
+"""
+__docformat__ = "restructuredtext"
+
+import logging
+import threading
+
+import pycurl
+
+log = logging.getLogger('cnucnu.curl_pool')
+
+
+class CurlPool(object):
+    """ Pool of reusable pycurl.Curl handles.
+
+    Released handles keep their connections open, so later requests to the
+    same host reuse them. All handles share the DNS cache, the TLS session
+    cache and cookies through one pycurl.CurlShare.
+    """
+    def __init__(self):
+        self.share = pycurl.CurlShare()
+        self.share.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_DNS)
+        self.share.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_SSL_SESSION)
+        self.share.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_COOKIE)
+
+        self.lock = threading.Lock()
+        self.free = []
+
+        self.transfers = 0
+        self.opened = 0
+        self.reused = 0
+
+    def acquire(self):
+        """ Return a handle with default options that is used by no one else
+        until it is released
+        """
+        with self.lock:
+            if self.free:
+                c = self.free.pop()
+            else:
+                c = pycurl.Curl()
+                c.setopt(pycurl.SHARE, self.share)
+        # drop options of the previous transfer but keep its connections and
+        # the share
+        c.reset()
+        # enable the cookie engine
+        c.setopt(pycurl.COOKIEFILE, "")
+        return c
+
+    def release(self, c, performed=True):
+        """ Return `c` to the pool
+
+        :Parameters:
+            performed : bool
+                Whether `c` was used for a transfer since it was acquired
+        """
+        with self.lock:
+            if performed:
+                connects = c.getinfo(pycurl.NUM_CONNECTS)
+                self.transfers += 1
+                self.opened += connects
+                if connects == 0:
+                    self.reused += 1
+            self.free.append(c)
+
+    def close(self):
+        with self.lock:
+            for c in self.free:
+                c.close()
+            self.free = []
+
+    @property
+    def summary(self):
+        return "%i transfers, %i reused a connection, %i connections "\
+            "opened" % (self.transfers, self.reused, self.opened)
+
+
+_default_pool = None
+
+
+def get_default_pool():
+    """ Return the pool used for all HTTP requests of this process """
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = CurlPool()
+    return _default_pool
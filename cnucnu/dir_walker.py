@@ -0,0 +1,118 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8 foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+""" :author: Till Maas
+    :contact: opensource@till.name
+    :license: GPLv2+
+"""
+__docformat__ = "restructuredtext"
+
+import logging
+
+from cnucnu.helper import get_html, latest_subdir, split_glob
+
+log = logging.getLogger('cnucnu.dir_walker')
+
+
+class DirectoryWalker(object):
+    """ Expand globbed directories in URLs like `cnucnu.helper.expand_subdirs`
+    but retrieve every directory listing only once.
+
+    Packages below the same mirror tree share the listings of their parent
+    directories and the latest subdirectory found for each glob.
+    """
+    def __init__(self):
+        # url prefix -> directory listing or the exception raised while
+        # retrieving it
+        self.listings = {}
+        # (url prefix, glob) -> latest subdir or None
+        self.latest = {}
+
+    def _latest(self, url, url_prefix, glob_str):
+        key = (url_prefix, glob_str)
+        if key not in self.latest:
+            listing = self.listings[url_prefix]
+            if isinstance(listing, Exception):
+                raise listing
+            self.latest[key] = latest_subdir(url, listing, glob_str)
+        return self.latest[key]
+
+    def expand(self, url, glob_char="*"):
+        """ Expand all globbed directories in `url`, retrieving missing
+        listings one after another
+        """
+        parts = split_glob(url, glob_char)
+        while parts:
+            url_prefix, glob_str, url_suffix = parts
+            if url_prefix not in self.listings:
+                try:
+                    self.listings[url_prefix] = get_html(url_prefix)
+                except Exception, e:
+                    self.listings[url_prefix] = e
+                    raise
+            latest = self._latest(url, url_prefix, glob_str)
+            if latest is None:
+                break
+            url = "%s%s/%s" % (url_prefix, latest, url_suffix)
+            parts = split_glob(url, glob_char)
+        return url
+
+    def expand_many(self, urls, fetcher, glob_char="*"):
+        """ Expand all `urls` level by level, retrieving the missing listings
+        of each level concurrently.
+
+        :Parameters:
+            urls : [str]
+                URLs to expand
+            fetcher : `cnucnu.fetcher.MultiFetcher`
+                Fetcher used to retrieve directory listings
+
+        :return: dict mapping each URL to the expanded URL, URLs whose
+            listings could not be retrieved map to themselves
+        """
+        expanded = dict((url, url) for url in urls)
+        todo = list(expanded.keys())
+        level = 0
+        while todo:
+            level += 1
+            parts = {}
+            for url in todo:
+                url_parts = split_glob(expanded[url], glob_char)
+                if url_parts:
+                    parts[url] = url_parts
+
+            missing = set(p[0] for p in parts.values()) - set(self.listings)
+            log.info("Retrieving '%i' directory listings for level %i",
+                     len(missing), level)
+            for prefix, (data, error) in fetcher.fetch(missing).items():
+                self.listings[prefix] = error or data
+
+            todo = []
+            for url, (url_prefix, glob_str, url_suffix) in parts.items():
+                try:
+                    latest = self._latest(expanded[url], url_prefix,
+                                          glob_str)
+                except Exception, e:
+                    log.debug("Cannot expand '%s': %s", url, e)
+                    expanded[url] = url
+                    continue
+                if latest is not None:
+                    expanded[url] = "%s%s/%s" % (url_prefix, latest,
+                                                 url_suffix)
+                    todo.append(url)
+        return expanded
@@ -29,5 +29,11 @@ class CnuCnuError(Exception):
 class UpstreamVersionRetrievalError(CnuCnuError):
     Name = "Upstream Version Retrieval Error"
 
+class ResponseTooLargeError(UpstreamVersionRetrievalError):
+    Name = "Upstream response too large"
+
+class HostUnavailableError(UpstreamVersionRetrievalError):
+    Name = "Upstream host unavailable"
+
 class PackageNotFoundError(CnuCnuError):
     Name = "Package not found in repository"
@@ -0,0 +1,199 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8 foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+""" :author: Till Maas
+    :contact: opensource@till.name
+    :license: GPLv2+
+"""
+__docformat__ = "restructuredtext"
+
+import collections
+import logging
+import time
+
+import pycurl
+
+from cnucnu.curl_pool import get_default_pool
+from cnucnu.helper import BodyBuffer, setup_curl
+from cnucnu.host_policy import get_default_policy, url_host
+from cnucnu.http_cache import get_default_cache
+
+log = logging.getLogger('cnucnu.fetcher')
+
+
+class MultiFetcher(object):
+    """ Retrieve many URLs concurrently with a pycurl.CurlMulti handle.
+
+    :Parameters:
+        max_connections : int
+            Maximum number of transfers in flight at the same time
+        max_host_connections : int
+            Maximum number of transfers in flight to the same host
+        cache : `cnucnu.http_cache.HTTPCache`
+            Cache for conditional requests, defaults to the configured one
+        pool : `cnucnu.curl_pool.CurlPool`
+            Pool to take the handles from, defaults to the shared one
+        max_body_size : int
+            Maximum size of a response body in bytes, 0 for no limit
+        cainfo : str
+            File with the CA certificates to verify servers with instead of
+            the system ones
+        policy : `cnucnu.host_policy.HostPolicy`
+            Request rate, timeouts and circuit breaker per host, defaults to
+            the configured one
+
+    The CurlMulti handle is kept between calls to `fetch`, so its
+    connections can be reused by later calls.
+    """
+    def __init__(self, max_connections=20, max_host_connections=4,
+                 cache=None, pool=None, max_body_size=0, cainfo="",
+                 policy=None):
+        self.max_connections = max(1, int(max_connections))
+        self.max_host_connections = max(1, int(max_host_connections))
+        self.max_body_size = int(max_body_size or 0)
+        self.cainfo = cainfo
+        if cache is None:
+            cache = get_default_cache()
+        self.cache = cache
+        if pool is None:
+            pool = get_default_pool()
+        self.pool = pool
+        if policy is None:
+            policy = get_default_policy()
+        self.policy = policy
+        self.multi = pycurl.CurlMulti()
+
+    def _start(self, multi, handle, url):
+        res = BodyBuffer(url, self.max_body_size)
+        setup_curl(handle, url, res, self.policy)
+        if self.cainfo:
+            handle.setopt(pycurl.CAINFO, self.cainfo)
+        handle.transfer = self.cache.transfer(url)
+        if handle.transfer:
+            handle.transfer.setup(handle)
+        handle.url = url
+        handle.res = res
+        self.policy.started(url)
+        multi.add_handle(handle)
+
+    def _next_url(self, pending, host_count, rejected):
+        """ Pop the first pending URL whose host is below its limit and may
+        be contacted now. URLs of unavailable hosts are moved to `rejected`
+        with their error.
+        """
+        now = time.time()
+        index = 0
+        while index < len(pending):
+            url = pending[index]
+            error = self.policy.error(url, now)
+            if error:
+                del pending[index]
+                rejected.append((url, error))
+                continue
+            if host_count[url_host(url)] < self.max_host_connections and \
+                    not self.policy.delay(url, now):
+                del pending[index]
+                return url
+            index += 1
+        return None
+
+    def fetch(self, urls, callback=None):
+        """ Retrieve all `urls`.
+
+        :Parameters:
+            urls : [str]
+                URLs to retrieve, duplicates are fetched only once
+            callback : callable
+                Called with `url`, `data` and `error` after each transfer
+
+        :return: dict mapping each URL to a tuple of the retrieved data and
+            the pycurl.error, `cnucnu.errors.ResponseTooLargeError` or
+            `cnucnu.errors.HostUnavailableError` that occured or None
+        """
+        pending = collections.deque(sorted(set(urls)))
+        results = {}
+        if not pending:
+            return results
+
+        multi = self.multi
+        free = [self.pool.acquire() for i in range(
+            min(self.max_connections, len(pending)))]
+        host_count = collections.defaultdict(int)
+        active = 0
+
+        while pending or active:
+            rejected = []
+            while free and pending:
+                url = self._next_url(pending, host_count, rejected)
+                if url is None:
+                    break
+                self._start(multi, free.pop(), url)
+                host_count[url_host(url)] += 1
+                active += 1
+            for url, error in rejected:
+                log.debug("Not fetching '%s': %s", url, error)
+                results[url] = (None, error)
+                if callback:
+                    callback(url, None, error)
+
+            while True:
+                ret, num_handles = multi.perform()
+                if ret != pycurl.E_CALL_MULTI_PERFORM:
+                    break
+
+            while True:
+                num_queued, ok_list, err_list = multi.info_read()
+                finished = [(c, None) for c in ok_list]
+                finished.extend([(c, c.res.check_error(
+                    pycurl.error(errno, errmsg)))
+                    for (c, errno, errmsg) in err_list])
+                for c, error in finished:
+                    multi.remove_handle(c)
+                    url = c.url
+                    data = c.res.getvalue()
+                    c.res = None
+                    if error:
+                        log.debug("Failed to fetch '%s': %s", url, error)
+                        self.policy.failed(url, error,
+                                           c.getinfo(pycurl.CONNECT_TIME))
+                        data = None
+                    else:
+                        self.policy.succeeded(url,
+                                              c.getinfo(pycurl.TOTAL_TIME))
+                        if c.transfer:
+                            data = c.transfer.finish(c, data)
+                    results[url] = (data, error)
+                    host_count[url_host(url)] -= 1
+                    active -= 1
+                    # return the handle to reset it for the next transfer
+                    self.pool.release(c)
+                    free.append(self.pool.acquire())
+                    if callback:
+                        callback(url, data, error)
+                if num_queued == 0:
+                    break
+
+            if active:
+                multi.select(1.0)
+            elif pending:
+                # only URLs of hosts that were contacted too recently are left
+                time.sleep(min(self.policy.delay(url) for url in pending))
+
+        for c in free:
+            self.pool.release(c, performed=False)
+        return results
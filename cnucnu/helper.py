@@ -34,17 +34,17 @@ __html_regex = re.compile(r'\bhref\s*=\s*["\']([^"\'/]+)/["\']', re.I)
 __text_regex = re.compile(r'^d.+\s(\S+)\s*$', re.I | re.M)
 
 
-def expand_subdirs(url, glob_char="*"):
-    """ Expand dirs containing glob_char in the given URL with the latest
-        Example URL: http://www.example.com/foo/*/
+def split_glob(url, glob_char="*"):
+    """ Split `url` at the first directory containing `glob_char`
 
-        The globbing char can be bundled with other characters enclosed within
-        the same slashes in the URL like "/rel*/".
+    :return: tuple of the URL until the slash before the globbed directory,
+        the globbed directory and everything after the slash after it or None
+        if `url` does not contain a globbed directory
     """
     glob_pattern = "/([^/]*%s[^/]*)/" % re.escape(glob_char)
     glob_match = re.search(glob_pattern, url)
     if not glob_match:
-        return url
+        return None
     glob_str = glob_match.group(1)
 
     # url until first slash before glob_match
@@ -53,25 +53,191 @@ def expand_subdirs(url, glob_char="*"):
     # everything after the slash after glob_match
     url_suffix = url[glob_match.end():]
 
+    return (url_prefix, glob_str, url_suffix)
+
+
+__glob_regexes = {}
+
+
+def glob_regex(glob_str):
+    """ Return the compiled regex for the shell pattern `glob_str`
+
+    Unlike `fnmatch.fnmatch`, all patterns stay compiled for the whole run.
+    """
+    try:
+        return __glob_regexes[glob_str]
+    except KeyError:
+        regex = re.compile(fnmatch.translate(glob_str))
+        __glob_regexes[glob_str] = regex
+        return regex
+
+
+def latest_subdir(url, dir_listing, glob_str):
+    """ Return the latest subdir in `dir_listing` matching `glob_str` or None
+    if there is none
+    """
+    if not dir_listing:
+        return None
+    subdirs = []
+    regex = url.startswith("ftp://") and __text_regex or __html_regex
+    glob_match = glob_regex(glob_str).match
+    for match in regex.finditer(dir_listing):
+        subdir = match.group(1)
+        if subdir not in (".", "..") and glob_match(subdir):
+            subdirs.append(subdir)
+    if not subdirs:
+        return None
+    return upstream_max(subdirs)
+
+
+def expand_subdirs(url, glob_char="*"):
+    """ Expand dirs containing glob_char in the given URL with the latest
+        Example URL: http://www.example.com/foo/*/
+
+        The globbing char can be bundled with other characters enclosed within
+        the same slashes in the URL like "/rel*/".
+    """
+    parts = split_glob(url, glob_char)
+    if not parts:
+        return url
+    url_prefix, glob_str, url_suffix = parts
+
     if url_prefix != "":
         dir_listing = get_html(url_prefix)
-        if not dir_listing:
+        latest = latest_subdir(url, dir_listing, glob_str)
+        if latest is None:
             return url
-        subdirs = []
-        regex = url.startswith("ftp://") and __text_regex or __html_regex
-        for match in regex.finditer(dir_listing):
-            subdir = match.group(1)
-            if subdir not in (".", "..") and fnmatch.fnmatch(subdir, glob_str):
-                subdirs.append(subdir)
-        if not subdirs:
-            return url
-        latest = upstream_max(subdirs)
 
         url = "%s%s/%s" % (url_prefix, latest, url_suffix)
         return expand_subdirs(url, glob_char)
     return url
 
 
+USER_AGENT = "Fedora Upstream Release Monitoring "\
+    "(https://fedoraproject.org/wiki/Upstream_release_monitoring)"
+
+
+def default_max_body_size():
+    """ Return the configured maximum size of a response body in bytes,
+    0 means unlimited
+    """
+    from cnucnu.config import global_config
+    return int(global_config.config["fetcher"].get("max_body_size") or 0)
+
+
+class BodyBuffer(object):
+    """ Collect a response body in chunks and join them only once.
+
+    The transfer is aborted as soon as the body grows above `max_size`
+    bytes, if `max_size` is not 0.
+    """
+    def __init__(self, url, max_size=0):
+        self.url = url
+        self.max_size = max_size
+        self.chunks = []
+        self.size = 0
+        self.exceeded = False
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.max_size and self.size > self.max_size:
+            self.exceeded = True
+            # returning a different length than received aborts the transfer
+            return 0
+        self.chunks.append(chunk)
+
+    def getvalue(self):
+        return "".join(self.chunks)
+
+    def check_error(self, error):
+        """ Return the error to raise for the pycurl.error `error` that aborted
+        this transfer
+        """
+        import pycurl
+        from cnucnu.errors import ResponseTooLargeError
+
+        if self.exceeded or error.args[0] == pycurl.E_FILESIZE_EXCEEDED:
+            return ResponseTooLargeError(
+                "%s: response body larger than %i bytes" % (self.url,
+                                                            self.max_size))
+        return error
+
+
+def setup_curl(c, url, body, policy=None):
+    """ Set the options used for all upstream requests on the Curl handle `c`
+
+    :Parameters:
+        c : pycurl.Curl
+            Handle to configure
+        url : str
+            URL to retrieve
+        body : `BodyBuffer`
+            Buffer for the response body
+        policy : `cnucnu.host_policy.HostPolicy`
+            Policy with the timeouts for the host, defaults to the configured
+            one
+
+    """
+    import pycurl
+
+    c.setopt(pycurl.URL, url.encode("ascii"))
+
+    c.setopt(pycurl.WRITEFUNCTION, body.write)
+    if body.max_size:
+        # abort early if the server announces a larger body
+        c.setopt(pycurl.MAXFILESIZE, body.max_size)
+    # let the server compress the response, it is decompressed by curl
+    c.setopt(pycurl.ENCODING, "gzip, deflate")
+    c.setopt(pycurl.FOLLOWLOCATION, 1)
+    c.setopt(pycurl.MAXREDIRS, 10)
+    c.setopt(pycurl.USERAGENT, USER_AGENT)
+    set_timeouts(c, url, policy)
+
+
+def set_timeouts(c, url, policy=None):
+    """ Set the timeouts of the host of `url` on the Curl handle `c` """
+    import pycurl
+    from cnucnu.host_policy import get_default_policy
+
+    if policy is None:
+        policy = get_default_policy()
+    connect_timeout, timeout = policy.timeouts(url)
+    c.setopt(pycurl.CONNECTTIMEOUT, connect_timeout)
+    c.setopt(pycurl.TIMEOUT, timeout)
+
+
+def perform_transfer(c, url, res, transfer=None, policy=None):
+    """ Retrieve `url` with the prepared Curl handle `c` obeying the host
+    policy and return the response body
+
+    :Parameters:
+        res : `BodyBuffer`
+            Buffer set up as WRITEFUNCTION of `c`
+        transfer : `cnucnu.http_cache.CachedTransfer`
+            Conditional request set up on `c` or None
+        policy : `cnucnu.host_policy.HostPolicy`
+            Policy for the host of `url`, defaults to the configured one
+
+    """
+    import pycurl
+    from cnucnu.host_policy import get_default_policy
+
+    if policy is None:
+        policy = get_default_policy()
+    policy.check(url)
+    policy.wait(url)
+    try:
+        c.perform()
+    except pycurl.error, e:
+        policy.failed(url, e, c.getinfo(pycurl.CONNECT_TIME))
+        raise res.check_error(e)
+    policy.succeeded(url, c.getinfo(pycurl.TOTAL_TIME))
+    data = res.getvalue()
+    if transfer:
+        data = transfer.finish(c, data)
+    return data
+
+
 def get_html(url, callback=None, errback=None):
     if url.startswith("ftp://"):
         import urllib
@@ -101,26 +267,22 @@ def get_html(url, callback=None, errback=None):
                 except TypeError:
                     df.addErrback(errback)
         else:
-            import StringIO
-            import pycurl
-
-            res = StringIO.StringIO()
+            from cnucnu.curl_pool import get_default_pool
+            from cnucnu.http_cache import get_default_cache
 
-            c = pycurl.Curl()
-            c.setopt(pycurl.URL, url.encode("ascii"))
+            res = BodyBuffer(url, default_max_body_size())
 
-            c.setopt(pycurl.WRITEFUNCTION, res.write)
-            c.setopt(pycurl.FOLLOWLOCATION, 1)
-            c.setopt(pycurl.MAXREDIRS, 10)
-            c.setopt(
-                pycurl.USERAGENT,
-                "Fedora Upstream Release Monitoring "
-                "(https://fedoraproject.org/wiki/Upstream_release_monitoring)")
-            c.setopt(pycurl.CONNECTTIMEOUT, 10)
-            c.setopt(pycurl.TIMEOUT, 30)
+            pool = get_default_pool()
+            c = pool.acquire()
+            setup_curl(c, url, res)
+            transfer = get_default_cache().transfer(url)
+            if transfer:
+                transfer.setup(c)
 
-            c.perform()
-            c.close()
+            try:
+                data = perform_transfer(c, url, res, transfer)
+            finally:
+                pool.release(c)
 
             # this causes a hangug if reactor.run() was already called once
             #df = getPage(url)
@@ -128,8 +290,6 @@ def get_html(url, callback=None, errback=None):
             #df.addCallback(lambda ignore: reactor.stop())
             #reactor.run()
 
-            data = res.getvalue()
-            res.close()
             return data
 
 
@@ -139,9 +299,65 @@ def rpm_cmp(v1, v2):
     return diff
 
 
+__rpm_segment_regex = re.compile(r"[0-9]+|[a-zA-Z]+|~|\^")
+__rpm_caret = []
+
+
+def rpm_supports_caret():
+    """ Return whether the installed rpm orders versions with a caret, which
+    rpm supports since 4.15. Older versions treat it as a separator.
+    """
+    if not __rpm_caret:
+        try:
+            __rpm_caret.append(rpm_cmp("1^1", "1") == 1)
+        except ImportError:
+            __rpm_caret.append(True)
+    return __rpm_caret[0]
+
+
+def rpm_version_key(version):
+    """ Return a sort key that orders versions like `rpm_cmp`
+
+    Like rpmvercmp(), separators are ignored and the version is split into
+    numeric and alphabetic segments. Numeric segments are newer than
+    alphabetic ones and a tilde sorts before everything, even the end of
+    the version, while a caret sorts only before other segments if the
+    installed rpm supports it.
+    """
+    caret = rpm_supports_caret()
+    key = []
+    for segment in __rpm_segment_regex.findall(version):
+        if segment == "~":
+            key.append((0,))
+        elif segment == "^":
+            if caret:
+                key.append((2,))
+        elif segment.isdigit():
+            key.append((4, int(segment)))
+        else:
+            key.append((3, segment))
+    # end of version
+    key.append((1,))
+    return tuple(key)
+
+
+def max_by_key(list, key):
+    """ Return the last of the greatest items in `list` according to `key`,
+    like sorting `list` and taking the last item, but in O(n). The key is
+    computed only once for repeated items.
+    """
+    keys = dict((item, key(item)) for item in set(list))
+    latest = list[0]
+    latest_key = keys[latest]
+    for item in list[1:]:
+        item_key = keys[item]
+        if item_key >= latest_key:
+            latest, latest_key = item, item_key
+    return latest
+
+
 def rpm_max(list):
-    list.sort(cmp=rpm_cmp)
-    return list[-1]
+    return max_by_key(list, rpm_version_key)
 
 
 def upstream_cmp(v1, v2):
@@ -237,9 +453,25 @@ def get_rc(release):
         return ("", "")
 
 
+def upstream_version_key(version):
+    """ Return a sort key that orders upstream versions like `upstream_cmp`
+
+    The key consists of the `rpm_version_key` of the base version and the
+    release candidate status, which ranks a release after all of its
+    release candidates.
+    """
+    v, rc, rcn = split_rc(version)
+    if rc:
+        # rc strings compare alphabetically, e.g. rc > pre > beta > alpha,
+        # and a missing rc number is older than any rc number
+        rc_key = (0, rc.lower(), rcn != "", rcn and int(rcn) or 0)
+    else:
+        rc_key = (1,)
+    return (rpm_version_key(v), rc_key)
+
+
 def upstream_max(list):
-    list.sort(cmp=upstream_cmp)
-    return list[-1]
+    return max_by_key(list, upstream_version_key)
 
 
 def cmp_upstream_repo(upstream_v, repo_vr):
@@ -256,11 +488,22 @@ def filter_dict(d, key_list):
     return dict([v for v in d.items() if v[0] in key_list])
 
 
-def secure_download(url, cainfo=""):
+def secure_download(url, cainfo="", cache=None):
+    """ Download `url` verifying the TLS certificate of the server
+
+    :Parameters:
+        cainfo : str
+            File with the CA certificates to use instead of the system ones
+        cache : `cnucnu.http_cache.HTTPCache`
+            Cache for conditional requests, defaults to the configured one
+
+    """
     import pycurl
-    import StringIO
+    from cnucnu.curl_pool import get_default_pool
+    from cnucnu.http_cache import get_default_cache
 
-    c = pycurl.Curl()
+    pool = get_default_pool()
+    c = pool.acquire()
     c.setopt(pycurl.URL, url.encode("ascii"))
 
     # -k / --insecure
@@ -276,18 +519,28 @@ def secure_download(url, cainfo=""):
     if cainfo:
         c.setopt(pycurl.CAINFO, cainfo)
 
-    res = StringIO.StringIO()
+    res = BodyBuffer(url, default_max_body_size())
 
     c.setopt(pycurl.WRITEFUNCTION, res.write)
+    if res.max_size:
+        c.setopt(pycurl.MAXFILESIZE, res.max_size)
+    c.setopt(pycurl.ENCODING, "gzip, deflate")
 
     # follow up to 10 http location: headers
     c.setopt(pycurl.FOLLOWLOCATION, 1)
     c.setopt(pycurl.MAXREDIRS, 10)
-
-    c.perform()
-    c.close()
-    data = res.getvalue()
-    res.close()
+    set_timeouts(c, url)
+
+    if cache is None:
+        cache = get_default_cache()
+    transfer = cache.transfer(url)
+    if transfer:
+        transfer.setup(c)
+
+    try:
+        data = perform_transfer(c, url, res, transfer)
+    finally:
+        pool.release(c)
 
     return data
 
@@ -0,0 +1,228 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8 foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+""" :author: Till Maas
+    :contact: opensource@till.name
+    :license: GPLv2+
+"""
+__docformat__ = "restructuredtext"
+
+import logging
+import threading
+import time
+import urlparse
+
+from cnucnu.errors import HostUnavailableError
+
+log = logging.getLogger('cnucnu.host_policy')
+
+# pycurl error numbers that mean the host is not reachable
+CONNECTION_ERRORS = set([
+    6,   # CURLE_COULDNT_RESOLVE_HOST
+    7,   # CURLE_COULDNT_CONNECT
+    35,  # CURLE_SSL_CONNECT_ERROR
+])
+# only a connection failure if the connection was not established yet
+OPERATION_TIMEDOUT = 28
+
+
+def url_host(url):
+    """ Return the host part of `url` that requests are grouped by """
+    return urlparse.urlsplit(url).netloc.lower()
+
+
+class HostState(object):
+    def __init__(self):
+        # moving average of the transfer time of successful requests
+        self.latency = None
+        self.failures = 0
+        self.open_until = 0
+        self.last_start = 0
+
+
+class HostPolicy(object):
+    """ Per-host request rate, timeouts and circuit breaker.
+
+    Requests to the same host are started at most `rate` times per second.
+    The transfer timeout of a host follows the average time of its
+    successful transfers, so slow hosts get more time but no host less than
+    `min_timeout`. After `failure_threshold` consecutive connection failures,
+    requests to the host fail immediately with `HostUnavailableError` for
+    `circuit_time` seconds. Afterwards one request is tried again.
+
+    :Parameters:
+        rate : float
+            Requests per second and host, 0 for no limit
+        failure_threshold : int
+            Consecutive connection failures that open the circuit
+        circuit_time : int
+            Seconds to fail fast after the circuit opened
+        connect_timeout : int
+            Maximum seconds to connect
+        min_timeout : int
+            Minimum seconds for a whole transfer, used for unknown hosts
+        max_timeout : int
+            Maximum seconds for a whole transfer
+        timeout_factor : float
+            Multiple of the average transfer time to allow for a transfer
+
+    """
+    def __init__(self, rate=2.0, failure_threshold=3, circuit_time=3600,
+                 connect_timeout=10, min_timeout=30, max_timeout=120,
+                 timeout_factor=10):
+        self.rate = rate
+        self.failure_threshold = failure_threshold
+        self.circuit_time = circuit_time
+        self.connect_timeout = connect_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_factor = timeout_factor
+
+        self.lock = threading.Lock()
+        self.hosts = {}
+        self.rejected = 0
+
+    def _state(self, url):
+        host = url_host(url)
+        if host not in self.hosts:
+            self.hosts[host] = HostState()
+        return self.hosts[host]
+
+    def error(self, url, now=None):
+        """ Return the `HostUnavailableError` for `url` if the circuit of its
+        host is open, else None
+        """
+        if now is None:
+            now = time.time()
+        with self.lock:
+            state = self._state(url)
+            if state.open_until <= now:
+                return None
+            self.rejected += 1
+            return HostUnavailableError(
+                "%s: %i consecutive connection failures, not retried for "
+                "%i s" % (url, state.failures, state.open_until - now))
+
+    def check(self, url):
+        """ Raise `HostUnavailableError` if the circuit of the host of `url`
+        is open
+        """
+        error = self.error(url)
+        if error:
+            raise error
+
+    def delay(self, url, now=None):
+        """ Return the seconds until a request to the host of `url` may be
+        started
+        """
+        if not self.rate:
+            return 0
+        if now is None:
+            now = time.time()
+        with self.lock:
+            state = self._state(url)
+            return max(0, state.last_start + 1.0 / self.rate - now)
+
+    def started(self, url, now=None):
+        with self.lock:
+            self._state(url).last_start = now or time.time()
+
+    def wait(self, url):
+        """ Block until a request to the host of `url` may be started
+
+        The start time is reserved under the lock, so concurrent threads get
+        consecutive slots of the host.
+        """
+        with self.lock:
+            state = self._state(url)
+            now = time.time()
+            start = now
+            if self.rate:
+                start = max(now, state.last_start + 1.0 / self.rate)
+            state.last_start = start
+        if start > now:
+            time.sleep(start - now)
+
+    def timeouts(self, url):
+        """ Return the connect and the total timeout for `url` """
+        with self.lock:
+            latency = self._state(url).latency
+        if latency is None:
+            total = self.min_timeout
+        else:
+            total = min(self.max_timeout, max(self.min_timeout,
+                                              latency * self.timeout_factor))
+        return (int(min(self.connect_timeout, total)), int(total))
+
+    def succeeded(self, url, seconds):
+        with self.lock:
+            state = self._state(url)
+            if state.latency is None:
+                state.latency = seconds
+            else:
+                state.latency = 0.7 * state.latency + 0.3 * seconds
+            state.failures = 0
+            state.open_until = 0
+
+    def failed(self, url, error, connect_time=0):
+        """ Record the failure `error` of a request to `url`, only errors
+        before the connection was established count for the circuit breaker
+
+        :Parameters:
+            connect_time : float
+                CONNECT_TIME of the failed transfer, 0 if it did not connect
+
+        """
+        args = getattr(error, "args", ())
+        if not args:
+            return
+        if args[0] in CONNECTION_ERRORS or \
+                (args[0] == OPERATION_TIMEDOUT and not connect_time):
+            self.connection_failed(url)
+
+    def connection_failed(self, url):
+        """ Record that the host of `url` could not be reached """
+        with self.lock:
+            state = self._state(url)
+            state.failures += 1
+            if state.failures >= self.failure_threshold:
+                state.open_until = time.time() + self.circuit_time
+                log.warning("Not contacting '%s' for %i s after %i "
+                            "connection failures", url_host(url),
+                            self.circuit_time, state.failures)
+
+    @property
+    def summary(self):
+        open_hosts = [host for host, state in self.hosts.items()
+                      if state.open_until > time.time()]
+        return "%i hosts, %i unavailable, %i requests failed fast" % (
+            len(self.hosts), len(open_hosts), self.rejected)
+
+
+_default_policy = None
+
+
+def get_default_policy():
+    """ Return the policy configured in the 'hosts' section of the global
+    config
+    """
+    global _default_policy
+    if _default_policy is None:
+        from cnucnu.config import global_config
+        _default_policy = HostPolicy(**global_config.config["hosts"])
+    return _default_policy
@@ -0,0 +1,276 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8 foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+""" On-disk cache for conditional HTTP requests (ETag / Last-Modified)
+
+    :author: Till Maas
+    :contact: opensource@till.name
+    :license: GPLv2+
+"""
+__docformat__ = "restructuredtext"
+
+import cPickle as pickle
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+
+log = logging.getLogger('cnucnu.http_cache')
+
+
+class HTTPCache(object):
+    """ Store response bodies together with their validators.
+
+    Every URL is stored in its own file below `directory`. Entries that were
+    not validated by the server for `ttl` seconds are not used anymore. When
+    the cache grows above `max_size` bytes, the least recently used entries
+    are removed.
+
+    The modification time of a file is the time its entry was last validated
+    and the access time the time of its last use, so revalidating or using an
+    entry does not rewrite its body.
+
+    :Parameters:
+        directory : str
+            Cache directory, an empty value disables the cache
+        max_size : int
+            Maximum size of all cache files in bytes
+        ttl : int
+            Seconds after which an entry is not revalidated anymore but
+            downloaded again, 0 to revalidate entries forever
+
+    """
+    def __init__(self, directory="", max_size=256 * 1024 * 1024,
+                 ttl=7 * 24 * 3600):
+        self.directory = directory and os.path.expanduser(directory)
+        self.max_size = int(max_size)
+        self.ttl = int(ttl)
+
+        self.lock = threading.Lock()
+        # filename -> (last use, size), filled on first use
+        self._files = None
+        self._size = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def _filename(self, url):
+        return os.path.join(self.directory, hashlib.sha1(url).hexdigest())
+
+    def _load_index(self):
+        if self._files is not None:
+            return
+        self._files = {}
+        self._size = 0
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        for name in os.listdir(self.directory):
+            filename = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            self._files[filename] = (stat.st_atime, stat.st_size)
+            self._size += stat.st_size
+
+    def _touch(self, filename, validated):
+        """ Set the time of the last use of `filename` to now and the time of
+        its last validation to `validated`
+        """
+        now = time.time()
+        try:
+            os.utime(filename, (now, validated))
+        except OSError:
+            pass
+        if filename in self._files:
+            self._files[filename] = (now, self._files[filename][1])
+
+    def _remove_from_index(self, filename):
+        if filename in self._files:
+            self._size -= self._files.pop(filename)[1]
+
+    def _remove(self, filename):
+        try:
+            os.unlink(filename)
+        except OSError:
+            pass
+        self._remove_from_index(filename)
+
+    def evict(self):
+        """ Remove least recently used entries until the cache is not larger
+        than `max_size`
+        """
+        with self.lock:
+            self._load_index()
+            if self._size <= self.max_size:
+                return
+            by_use = sorted(self._files.items(), key=lambda f: f[1][0])
+            for filename, (last_use, size) in by_use:
+                if self._size <= self.max_size:
+                    break
+                log.debug("Evicting '%s' from HTTP cache", filename)
+                self._remove(filename)
+
+    def lookup(self, url):
+        """ Return the cache entry for `url` or None
+
+        :return: dict with the keys url, etag, last_modified, validated and
+            body
+        """
+        if not self.enabled:
+            return None
+        filename = self._filename(url)
+        with self.lock:
+            self._load_index()
+            if filename not in self._files:
+                self.misses += 1
+                return None
+            try:
+                validated = os.stat(filename).st_mtime
+                with open(filename, "rb") as cache_file:
+                    entry = pickle.load(cache_file)
+            except (OSError, IOError, EOFError, pickle.UnpicklingError), e:
+                log.warning("Removing broken HTTP cache entry for '%s': %s",
+                            url, e)
+                self._remove(filename)
+                self.misses += 1
+                return None
+            entry["validated"] = validated
+            if entry["url"] != url or (
+                    self.ttl and validated + self.ttl < time.time()):
+                self._remove(filename)
+                self.misses += 1
+                return None
+            self._touch(filename, validated)
+        return entry
+
+    def store(self, url, etag, last_modified, body):
+        """ Store `body` with its validators, entries without validators are
+        useless and therefore not stored
+        """
+        if not self.enabled or not (etag or last_modified):
+            return
+        # validated is the modification time of the file
+        entry = {"url": url,
+                 "etag": etag,
+                 "last_modified": last_modified,
+                 "body": body}
+        filename = self._filename(url)
+        with self.lock:
+            self._load_index()
+            fd, tmpname = tempfile.mkstemp(dir=self.directory)
+            with os.fdopen(fd, "wb") as cache_file:
+                pickle.dump(entry, cache_file, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmpname, filename)
+            self._remove_from_index(filename)
+            size = os.path.getsize(filename)
+            self._files[filename] = (time.time(), size)
+            self._size += size
+        self.evict()
+
+    def revalidated(self, entry):
+        """ Mark `entry` as confirmed by the server (HTTP 304) """
+        now = time.time()
+        entry["validated"] = now
+        self.hits += 1
+        with self.lock:
+            self._touch(self._filename(entry["url"]), now)
+
+    def transfer(self, url):
+        """ Return a `CachedTransfer` for `url` or None if the cache is
+        disabled or `url` is no HTTP URL
+        """
+        if not self.enabled or not url.startswith(("http://", "https://")):
+            return None
+        return CachedTransfer(self, url)
+
+
+class CachedTransfer(object):
+    """ Conditional request for a single URL on a pycurl.Curl handle """
+    def __init__(self, cache, url):
+        self.cache = cache
+        self.url = url
+        self.entry = cache.lookup(url)
+        self.header_lines = []
+
+    def _header(self, line):
+        if line.startswith("HTTP/"):
+            # new response after a redirect
+            self.header_lines = []
+        self.header_lines.append(line)
+
+    def header(self, name):
+        """ Return the value of the last header `name` of the response """
+        name = name.lower() + ":"
+        value = None
+        for line in self.header_lines:
+            if line.lower().startswith(name):
+                value = line[len(name):].strip()
+        return value
+
+    def setup(self, c):
+        """ Add validators of the cached entry to the request """
+        import pycurl
+
+        headers = []
+        if self.entry:
+            if self.entry["etag"]:
+                headers.append("If-None-Match: %s" % self.entry["etag"])
+            if self.entry["last_modified"]:
+                headers.append("If-Modified-Since: %s" %
+                               self.entry["last_modified"])
+        c.setopt(pycurl.HTTPHEADER, headers)
+        c.setopt(pycurl.HEADERFUNCTION, self._header)
+
+    def finish(self, c, body):
+        """ Return the response body after `c` performed the request
+
+        The cached body is returned if the server reported that it did not
+        change, a new body is stored in the cache.
+        """
+        import pycurl
+
+        status = c.getinfo(pycurl.RESPONSE_CODE)
+        if status == 304 and self.entry:
+            log.debug("'%s' not modified, using cached body", self.url)
+            self.cache.revalidated(self.entry)
+            return self.entry["body"]
+        if status == 200:
+            self.cache.store(self.url, self.header("ETag"),
+                             self.header("Last-Modified"), body)
+        return body
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    """ Return the cache configured in the 'http cache' section of the global
+    config
+    """
+    global _default_cache
+    if _default_cache is None:
+        from cnucnu.config import global_config
+        _default_cache = HTTPCache(**global_config.config["http cache"])
+    return _default_cache
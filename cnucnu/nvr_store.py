@@ -0,0 +1,239 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8 foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+""" :author: Till Maas
+    :contact: opensource@till.name
+    :license: GPLv2+
+"""
+__docformat__ = "restructuredtext"
+
+import array
+import bisect
+import re
+
+from cnucnu.helper import glob_regex
+
+WILDCARD_REGEX = re.compile("[*?[]")
+
+
+def intern_string(string):
+    """ Return the interned `string`, unicode strings are encoded as UTF-8
+    first because only byte strings can be interned
+    """
+    if isinstance(string, unicode):
+        string = string.encode("utf-8")
+    return intern(string)
+
+
+class StringTable(object):
+    """ Distinct strings, each stored once and referenced by its index """
+    def __init__(self):
+        self.strings = []
+        self.index = {}
+
+    def add(self, string):
+        try:
+            return self.index[string]
+        except KeyError:
+            string = intern_string(string)
+            self.index[string] = len(self.strings)
+            self.strings.append(string)
+            return self.index[string]
+
+    def __getitem__(self, index):
+        return self.strings[index]
+
+
+class NVRStore(object):
+    """ Read-only mapping of package names to (version, release) tuples.
+
+    The names are interned and kept in a sorted list. Versions and releases
+    repeat a lot, so they are stored once in string tables and referenced
+    from two array columns parallel to the names. Lookups use binary search.
+
+    :Parameters:
+        nvr_dict : dict
+            Mapping of package names to (version, release) tuples
+
+    """
+    def __init__(self, nvr_dict={}):
+        self.versions = StringTable()
+        self.releases = StringTable()
+
+        names = sorted(nvr_dict.keys())
+        self.names = [intern_string(name) for name in names]
+        self.version_column = array.array(
+            "I", (self.versions.add(nvr_dict[name][0]) for name in names))
+        self.release_column = array.array(
+            "I", (self.releases.add(nvr_dict[name][1]) for name in names))
+        # only needed while building the store
+        self.versions.index = None
+        self.releases.index = None
+
+    def _position(self, name):
+        position = bisect.bisect_left(self.names, name)
+        if position < len(self.names) and self.names[position] == name:
+            return position
+        return None
+
+    def __getitem__(self, name):
+        position = self._position(name)
+        if position is None:
+            raise KeyError(name)
+        return (self.versions[self.version_column[position]],
+                self.releases[self.release_column[position]])
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def __contains__(self, name):
+        return self._position(name) is not None
+
+    has_key = __contains__
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    iterkeys = __iter__
+
+    def keys(self):
+        """ Return all names in sorted order """
+        return list(self.names)
+
+    def iteritems(self):
+        for position, name in enumerate(self.names):
+            yield (name, (self.versions[self.version_column[position]],
+                          self.releases[self.release_column[position]]))
+
+    def items(self):
+        return list(self.iteritems())
+
+    def prefix_range(self, prefix):
+        """ Return the start and end position of the names starting with
+        `prefix` in `names`
+        """
+        start = bisect.bisect_left(self.names, prefix)
+        if not prefix:
+            return (start, len(self.names))
+        # the first string after all strings starting with prefix
+        end_prefix = prefix[:-1] + chr(ord(prefix[-1]) + 1) \
+            if ord(prefix[-1]) < 255 else None
+        if end_prefix is None:
+            end = len(self.names)
+            while end > start and not self.names[end - 1].startswith(prefix):
+                end -= 1
+        else:
+            end = bisect.bisect_left(self.names, end_prefix, start)
+        return (start, end)
+
+    def prefix(self, prefix):
+        """ Return the sorted names starting with `prefix` """
+        start, end = self.prefix_range(prefix)
+        return self.names[start:end]
+
+    def match(self, pattern):
+        """ Return the sorted names matching the shell pattern `pattern`,
+        like `fnmatch.filter` but only names starting with the literal
+        prefix of `pattern` are tested
+        """
+        wildcard = WILDCARD_REGEX.search(pattern)
+        if not wildcard:
+            return [pattern] if pattern in self else []
+        match = glob_regex(pattern).match
+        start, end = self.prefix_range(pattern[:wildcard.start()])
+        return [name for name in self.names[start:end] if match(name)]
+
+    def match_many(self, patterns):
+        """ Return a dict mapping every pattern of `patterns` to its sorted
+        matching names
+        """
+        return dict((pattern, self.match(pattern)) for pattern in
+                    set(patterns))
+
+
+def deep_size(obj, seen=None):
+    """ Return the memory used by `obj` and all objects it references """
+    import sys
+
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.iteritems():
+            size += deep_size(key, seen) + deep_size(value, seen)
+    elif isinstance(obj, (list, tuple, set)):
+        for item in obj:
+            size += deep_size(item, seen)
+    elif hasattr(obj, "__dict__"):
+        size += deep_size(obj.__dict__, seen)
+    return size
+
+
+if __name__ == '__main__':
+    # Memory benchmark with a synthetic repository like rawhide
+    import fnmatch
+    import random
+    import time
+
+    random.seed(0)
+    nvr_dict = {}
+    for number in range(20000):
+        name = "package-%05i" % number
+        version = "%i.%i" % (random.randint(0, 5), random.randint(0, 30))
+        release = "%i.fc21" % random.randint(1, 10)
+        nvr_dict[name] = (version, release)
+
+    dict_size = deep_size(nvr_dict)
+    store = NVRStore(nvr_dict)
+    store_size = deep_size(store)
+    print "%i packages" % len(nvr_dict)
+    print "dict:     %9i bytes" % dict_size
+    print "NVRStore: %9i bytes (%.0f%%)" % (store_size,
+                                            100.0 * store_size / dict_size)
+
+    # Wildcard expansion benchmark with 30k names
+    prefixes = ["perl-", "python-", "rubygem-", "php-", "ghc-", "nodejs-",
+                "golang-", "R-", "mingw32-", "texlive-"]
+    names = ["%s%s%05i" % (random.choice(prefixes + [""]),
+                           random.choice("abcdefghijklmnopqrstuvwxyz"),
+                           number)
+             for number in range(30000)]
+    store = NVRStore(dict((name, ("1", "1")) for name in names))
+    patterns = ["%s%s*" % (prefix, letter) for prefix in prefixes
+                for letter in "abcdef"] + ["*-a0000?", "python-[xyz]*"]
+
+    start = time.time()
+    expected = dict((pattern, sorted(fnmatch.filter(names, pattern)))
+                    for pattern in patterns)
+    filter_time = time.time() - start
+    start = time.time()
+    matched = store.match_many(patterns)
+    match_time = time.time() - start
+    assert matched == expected
+    print "%i patterns on %i names" % (len(patterns), len(names))
+    print "fnmatch.filter: %.3f s" % filter_time
+    print "match_many:     %.3f s" % match_time
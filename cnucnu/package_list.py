@@ -23,12 +23,15 @@
 __docformat__ = "restructuredtext"
 
 # python default modules
+import bisect
 import fnmatch
+import logging
 import re
 # sre_constants contains re exceptions
 import sre_constants
 import string
 import subprocess
+import threading
 
 #extra modules
 import pycurl
@@ -42,19 +45,46 @@ import cnucnu.errors as cc_errors
 from cnucnu import helper
 from cnucnu.helper import cmp_upstream_repo, get_html, expand_subdirs, \
     upstream_max
+from cnucnu.nvr_store import NVRStore
+from cnucnu.pkgdb_owners import OwnerResolver
+from cnucnu.regex_registry import RegexRegistry, default_registry
+from cnucnu.repodata import RepodataReader
+from cnucnu.run_cache import RunCache
 from cnucnu.scm import SCM
 from cnucnu.wiki import MediaWiki
 
+log = logging.getLogger('cnucnu.package_list')
+
 
 class Repository:
-    def __init__(self, name="", path=""):
+    def __init__(self, name="", path="", backend="", cache_dir=None,
+                 package_names=None):
+        """ Repository with the package versions to compare with upstream
+
+        :Parameters:
+            backend : str
+                "repodata" to read the repository metadata directly or
+                "repoquery" to run /usr/bin/repoquery
+            cache_dir : str
+                Directory to cache the parsed repository metadata
+            package_names : [str]
+                Only query these packages, all packages if None
+
+        """
+        c = global_config.config["repo"]
         if not (name and path):
-            c = global_config.config["repo"]
             name = c["name"]
             path = c["path"]
+        if not backend:
+            backend = c.get("backend", "repodata")
+        if cache_dir is None:
+            cache_dir = c.get("cache_dir", "")
 
         self.name = name
         self.path = path
+        self.backend = backend
+        self.cache_dir = cache_dir
+        self.package_names = package_names
         self.repoid = "cnucnu-%s" % "".join(
             c for c in name if c in string.letters)
 
@@ -65,10 +95,15 @@ class Repository:
     @property
     def nvr_dict(self):
         if not self._nvr_dict:
-            self._nvr_dict = self.repoquery()
+            self._nvr_dict = NVRStore(
+                self.repoquery(self.package_names or []))
         return self._nvr_dict
 
     def repoquery(self, package_names=[]):
+        if self.backend == "repodata":
+            reader = RepodataReader(self.path, cache_dir=self.cache_dir)
+            return reader.nvr_dict(package_names)
+
         # TODO: get rid of repofrompath message even with --quiet
         cmdline = ["/usr/bin/repoquery",
                    "--quiet",
@@ -120,11 +155,19 @@ class Package(object):
         self.package_list = package_list
 
         self._html = None
+        self._fetch_error = None
         self._latest_upstream = None
         self._upstream_versions = None
         self._repo_version = None
         self._repo_release = None
         self._rpm_diff = None
+        self._invalidate_bug_caches()
+
+    def _invalidate_bug_caches(self):
+        # (latest_upstream, bug) of the last lookup
+        self._exact_outdated_bug = None
+        # [bug] or None if not looked up yet
+        self._open_outdated_bug = None
 
     def _invalidate_caches(self):
         self._latest_upstream = None
@@ -159,13 +202,21 @@ class Package(object):
 
     def set_html(self, html):
         self._html = html
+        self._fetch_error = None
         self._invalidate_caches()
 
     def get_html(self):
-        if not self._html:
+        if self._html is None:
             try:
-                self.__url = expand_subdirs(self.url)
-                html = get_html(self.url)
+                if self._fetch_error:
+                    # error from a previous prefetch
+                    raise self._fetch_error
+                if self.run_cache:
+                    self.__url = self.run_cache.dir_walker.expand(self.url)
+                    html = self.run_cache.get_page(self.url, get_html)
+                else:
+                    self.__url = expand_subdirs(self.url)
+                    html = get_html(self.url)
             # TODO: get_html should raise a generic retrieval error
             except IOError:
                 raise cc_errors.UpstreamVersionRetrievalError(
@@ -180,11 +231,40 @@ class Package(object):
 
     html = property(get_html, set_html)
 
+    def set_upstream_page(self, html, url):
+        """ Store `html` that was retrieved outside of `get_html` from `url`,
+        the upstream URL with all globbed directories expanded.
+        """
+        self.__url = url
+        self.html = html
+
+    @property
+    def run_cache(self):
+        if self.package_list:
+            return self.package_list.run_cache
+        return None
+
+    @property
+    def regexes(self):
+        if self.package_list:
+            return self.package_list.regexes
+        return default_registry
+
     @property
     def upstream_versions(self):
         if not self._upstream_versions:
+            html = self.html
+            run_cache = self.run_cache
+            if run_cache:
+                shared = run_cache.get_versions((self.url, self.regex))
+                if shared:
+                    self._upstream_versions = shared
+                    self._latest_upstream = None
+                    self._rpm_diff = None
+                    return self._upstream_versions
             try:
-                upstream_versions = re.findall(self.regex, self.html)
+                upstream_versions = self.regexes.compile(
+                    self.regex).findall(html)
             except sre_constants.error:
                 raise cc_errors.UpstreamVersionRetrievalError(
                     "%s: invalid regular expression" % self.name)
@@ -202,6 +282,8 @@ class Package(object):
                     "%(regex)s" % self)
 
             self._upstream_versions = upstream_versions
+            if run_cache:
+                run_cache.versions[(self.url, self.regex)] = upstream_versions
 
             # invalidate sub caches
             self._latest_upstream = None
@@ -212,7 +294,15 @@ class Package(object):
     @property
     def latest_upstream(self):
         if not self._latest_upstream:
-            self._latest_upstream = upstream_max(self.upstream_versions)
+            upstream_versions = self.upstream_versions
+            run_cache = self.run_cache
+            key = (self.url, self.regex)
+            if run_cache and key in run_cache.latest:
+                self._latest_upstream = run_cache.latest[key]
+            else:
+                self._latest_upstream = upstream_max(upstream_versions)
+                if run_cache:
+                    run_cache.latest[key] = self._latest_upstream
 
             # invalidate _rpm_diff cache
             self._rpm_diff = None
@@ -266,11 +356,18 @@ class Package(object):
 
     @property
     def exact_outdated_bug(self):
-        return self.br.get_exact_outdated_bug(self)
+        latest_upstream = self.latest_upstream
+        if not self._exact_outdated_bug or \
+                self._exact_outdated_bug[0] != latest_upstream:
+            self._exact_outdated_bug = (latest_upstream,
+                                        self.br.get_exact_outdated_bug(self))
+        return self._exact_outdated_bug[1]
 
     @property
     def open_outdated_bug(self):
-        return self.br.get_open_outdated_bug(self)
+        if self._open_outdated_bug is None:
+            self._open_outdated_bug = [self.br.get_open_outdated_bug(self)]
+        return self._open_outdated_bug[0]
 
     def report_outdated(self, dry_run=True):
         if self.nagging:
@@ -283,7 +380,11 @@ class Package(object):
                     "%(name)s U:%(latest_upstream)s R:%(repo_version)s" % self
                 return None
 
-            return self.br.report_outdated(self, dry_run)
+            try:
+                return self.br.report_outdated(self, dry_run)
+            finally:
+                # bugs may have been created or changed
+                self._invalidate_bug_caches()
         else:
             print "Nagging disabled for package: %s" % str(self)
             return None
@@ -291,7 +392,7 @@ class Package(object):
 
 class PackageList:
     def __init__(self, repo=Repository(), scm=SCM(), br=BugzillaReporter(),
-                 mediawiki=False, packages=None):
+                 mediawiki=False, packages=None, package_names=None):
         """ A list of packages to be checked.
 
         :Parameters:
@@ -304,10 +405,16 @@ class PackageList:
                 page defined in the dict.
             packages : [cnucnu.Package]
                 List of packages to populate the package_list with
+            package_names : [str]
+                Only use the lines of the mediawiki page for these packages,
+                including wildcard lines matching them. All lines if None.
 
         """
+        self.package_names = package_names
         self.ignore_owners = []
         self._ignore_packages = None
+        self._ignore_thread = None
+        self.run_cache = RunCache()
 
         if not mediawiki:
             mediawiki = global_config.config["package list"]["mediawiki"]
@@ -330,14 +437,26 @@ class PackageList:
             repo.package_list = self
             package_line_regex = re.compile(
                 '^\s+\\*\s+(\S+)\s+(.+?)\s+(\S+)\s*$')
+            package_lines = []
             for package_data in helper.match_interval(
                 page_text, package_line_regex,
                     "== List Of Packages ==", "<!-- END LIST OF PACKAGES -->"):
                 (name, regex, url) = package_data
-                # fnmatch.filter() is very slow, therefore check first if any
-                # wildcard chars exist
+                if package_names is not None and \
+                        not fnmatch.filter(package_names, name):
+                    continue
+                package_lines.append(package_data)
+
+            # expand all wildcard names in one pass over the name index of
+            # the repository
+            wildcard_names = [name for (name, regex, url) in package_lines
+                              if "*" in name or "?" in name or "[" in name]
+            if wildcard_names:
+                wildcard_matches = repo.nvr_dict.match_many(wildcard_names)
+
+            for (name, regex, url) in package_lines:
                 if "*" in name or "?" in name or "[" in name:
-                    matched_names = fnmatch.filter(repo.nvr_dict.keys(), name)
+                    matched_names = wildcard_matches[name]
                     if len(matched_names) == 0:
                         # Add non-matching name to trigger an error/warning
                         # later FIXME: Properly report bad names
@@ -349,36 +468,168 @@ class PackageList:
                         Package(name, regex, url, repo, scm, br,
                                 package_list=self))
 
-        self.packages = packages
-        self.append = self.packages.append
-        self.__len__ = self.packages.__len__
+        self.packages = []
+        # name -> [Package], wildcard lines may add a name several times
+        self.by_name = {}
+        # sorted distinct names for prefix lookups, built on first use
+        self._sorted_names = None
+        for package in packages or []:
+            self.append(package)
+
+        self.regexes = RegexRegistry()
+        self.invalid_regexes = self.compile_regexes()
+
+    def compile_regexes(self):
+        """ Compile the regexes of all packages in one pass and report all
+        invalid ones
+
+        :return: dict mapping every invalid regex to the names of the
+            packages using it
+        """
+        invalid = self.regexes.compile_all(p.regex for p in self.packages)
+        invalid_regexes = {}
+        for package in self.packages:
+            if package.regex in invalid:
+                invalid_regexes.setdefault(package.regex, []).append(
+                    package.name)
+        for regex, names in sorted(invalid_regexes.items()):
+            log.error("Invalid regular expression '%s' (%s) used by: %s",
+                      regex, invalid[regex], ", ".join(names))
+        log.info("Regexes: %s", self.regexes.summary)
+        return invalid_regexes
+
+    def prefetch_html(self, fetcher, packages=None):
+        """ Retrieve the upstream pages of `packages` concurrently and store
+        them in each package before any version comparison happens.
+
+        Globbed directories are expanded level by level first. URLs that
+        cannot be expanded or that do not use HTTP are left for
+        `Package.get_html`.
+
+        :Parameters:
+            fetcher : `cnucnu.fetcher.MultiFetcher`
+                Fetcher used to retrieve the pages
+            packages : [`Package`]
+                Packages to prefetch, defaults to all packages of the list
+
+        """
+        if packages is None:
+            packages = self.packages
+
+        packages = [p for p in packages if p._html is None and
+                    p.url.startswith(("http://", "https://"))]
+        expanded = self.run_cache.dir_walker.expand_many(
+            [p.url for p in packages if "*" in p.url], fetcher)
+
+        by_url = {}
+        for package in packages:
+            url = expanded.get(package.url, package.url)
+            if "*" in url:
+                continue
+            by_url.setdefault(url, []).append(package)
+
+        def store(url, data, error):
+            if error:
+                self.run_cache.add_error(url, error, len(by_url[url]))
+            else:
+                self.run_cache.add_page(url, data, len(by_url[url]))
+            for package in by_url[url]:
+                if error:
+                    package._fetch_error = error
+                else:
+                    package.set_upstream_page(data, url)
+
+        log.info("Prefetching '%i' upstream URLs", len(by_url))
+        fetcher.fetch(by_url.keys(), callback=store)
+
+    def _resolve_ignore_packages(self):
+        if self.package_names is not None:
+            self._ignore_packages = self._ignored_package_names()
+        else:
+            resolver = OwnerResolver(**global_config.config["pkgdb"])
+            self._ignore_packages = resolver.resolve(self.ignore_owners)
+            log.info("pkgdb: %s", resolver.summary)
+
+    def prefetch_ignore_packages(self):
+        """ Start resolving the packages of the ignored owners in the
+        background, so `ignore_packages` does not block later
+        """
+        if self._ignore_packages is None and self._ignore_thread is None:
+            self._ignore_thread = threading.Thread(
+                target=self._resolve_ignore_packages,
+                name="ignore-packages")
+            self._ignore_thread.daemon = True
+            self._ignore_thread.start()
 
     @property
     def ignore_packages(self):
+        if self._ignore_thread is not None:
+            self._ignore_thread.join()
+            self._ignore_thread = None
         if self._ignore_packages is None:
-            pkgdb = pkgdb2client.PkgDB()
-            ignore_packages = []
-            for owner in self.ignore_owners:
-                try:
-                    # raises PkgDBException if owner is no point of contact for
-                    # any package
-                    pkgs = pkgdb.get_packages(poc=owner)["packages"]
-                    p_names = [p["name"] for p in pkgs]
-                    ignore_packages.extend(p_names)
-                except pkgdb2client.PkgDBException:
-                    pass
-            ignore_packages = set(ignore_packages)
-            self._ignore_packages = ignore_packages
+            self._resolve_ignore_packages()
         return self._ignore_packages
 
+    def _ignored_package_names(self):
+        """ Return the packages of `package_names` owned by an ignored owner,
+        without listing all packages of every ignored owner
+        """
+        ignore_packages = set()
+        if not self.ignore_owners:
+            return ignore_packages
+        pkgdb = pkgdb2client.PkgDB()
+        for package in self.packages:
+            try:
+                # raises PkgDBException for unknown packages
+                pkgs = pkgdb.get_package(package.name, branches="master",
+                                         acls=False)["packages"]
+            except pkgdb2client.PkgDBException:
+                continue
+            for p in pkgs:
+                if p["point_of_contact"] in self.ignore_owners:
+                    ignore_packages.add(package.name)
+        return ignore_packages
+
+    def append(self, package):
+        self.packages.append(package)
+        if package.name in self.by_name:
+            self.by_name[package.name].append(package)
+        else:
+            self.by_name[package.name] = [package]
+            if self._sorted_names is not None:
+                bisect.insort(self._sorted_names, package.name)
+
+    def __len__(self):
+        return len(self.packages)
+
+    def names_with_prefix(self, prefix):
+        """ Return the sorted distinct names of all packages starting with
+        `prefix`
+        """
+        if self._sorted_names is None:
+            self._sorted_names = sorted(self.by_name)
+        start = bisect.bisect_left(self._sorted_names, prefix)
+        end = start
+        while end < len(self._sorted_names) and \
+                self._sorted_names[end].startswith(prefix):
+            end += 1
+        return self._sorted_names[start:end]
+
+    def get_many(self, names):
+        """ Return a dict mapping each of `names` found in the list to all
+        packages with this name
+        """
+        return dict((name, self.by_name[name]) for name in names
+                    if name in self.by_name)
+
     def __getitem__(self, key):
         if isinstance(key, int):
             return self.packages[key]
         elif isinstance(key, str):
-            for p in self.packages:
-                if p.name == key:
-                    return p
-            raise KeyError("Package %s not found" % key)
+            try:
+                return self.by_name[key][0]
+            except KeyError:
+                raise KeyError("Package %s not found" % key)
 
     def get(self, key, default=None):
         try:
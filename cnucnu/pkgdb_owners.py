@@ -0,0 +1,168 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8 foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+""" :author: Till Maas
+    :contact: opensource@till.name
+    :license: GPLv2+
+"""
+__docformat__ = "restructuredtext"
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from multiprocessing.pool import ThreadPool
+
+log = logging.getLogger('cnucnu.pkgdb_owners')
+
+
+class OwnerResolver(object):
+    """ Resolve the packages of pkgdb points of contact.
+
+    Owners are looked up concurrently. The package names of each owner are
+    stored as JSON below `cache_dir` and reused until they are older than
+    `ttl` seconds. Owners whose lookup failed are logged and left out.
+
+    :Parameters:
+        cache_dir : str
+            Directory for the cached results, empty to disable the cache
+        ttl : int
+            Seconds until the packages of an owner are looked up again
+        threads : int
+            Concurrent pkgdb requests
+        page_size : int
+            Packages requested per page
+
+    """
+    def __init__(self, cache_dir="", ttl=86400, threads=8, page_size=500):
+        self.cache_dir = cache_dir and os.path.expanduser(cache_dir)
+        self.ttl = ttl
+        self.threads = threads
+        self.page_size = page_size
+
+        self.lookups = 0
+        self.cached = 0
+        self.failed = 0
+
+    def _cache_filename(self, owner):
+        return os.path.join(self.cache_dir, "owner-%s.json" %
+                            hashlib.sha1(owner).hexdigest())
+
+    def _load(self, owner):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._cache_filename(owner), "rb") as cache_file:
+                data = json.load(cache_file)
+        except (IOError, ValueError):
+            return None
+        if data.get("owner") != owner or \
+                time.time() - data.get("time", 0) > self.ttl:
+            return None
+        return data["packages"]
+
+    def _store(self, owner, packages):
+        if not self.cache_dir:
+            return
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        fd, tmpname = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(fd, "wb") as cache_file:
+            json.dump({"owner": owner, "time": time.time(),
+                       "packages": packages}, cache_file)
+        os.rename(tmpname, self._cache_filename(owner))
+
+    def _get_page(self, owner, page):
+        """ Return the result of one page of packages of `owner` """
+        import pkgdb2client
+
+        # PkgDB objects keep a session, so each thread uses its own one
+        pkgdb = pkgdb2client.PkgDB()
+        try:
+            return pkgdb.get_packages(poc=owner, page=page,
+                                      limit=self.page_size)
+        except pkgdb2client.PkgDBException:
+            # raised if owner is no point of contact for any package, on a
+            # later page it is an error that must not be cached as a partial
+            # package list
+            if page > 1:
+                raise
+            return {"packages": [], "page_total": 1}
+
+    def _lookup(self, owner, pool):
+        first = self._get_page(owner, 1)
+        pages = [first]
+        page_total = first.get("page_total", 1)
+        if page_total > 1:
+            pages.extend(pool.map(lambda page: self._get_page(owner, page),
+                                  range(2, page_total + 1)))
+        packages = [p["name"] for result in pages
+                    for p in result["packages"]]
+        self._store(owner, packages)
+        return packages
+
+    def _try_lookup(self, owner, pool):
+        """ Return the packages of `owner` or None if its lookup failed """
+        try:
+            return self._lookup(owner, pool)
+        except Exception, e:
+            log.error("Cannot resolve the packages of owner '%s', not "
+                      "ignoring them (%s)", owner, e)
+            return None
+
+    def resolve(self, owners):
+        """ Return the set of packages of all `owners` """
+        packages = set()
+        missing = []
+        for owner in set(owners):
+            cached = self._load(owner)
+            if cached is None:
+                missing.append(owner)
+            else:
+                self.cached += 1
+                packages.update(cached)
+
+        if missing:
+            log.info("Looking up the packages of '%i' owners in pkgdb",
+                     len(missing))
+            # owners and their additional pages use separate pools, so page
+            # requests never wait for a free owner thread
+            owner_pool = ThreadPool(min(self.threads, len(missing)))
+            page_pool = ThreadPool(self.threads)
+            try:
+                for result in owner_pool.map(
+                        lambda owner: self._try_lookup(owner, page_pool),
+                        missing):
+                    if result is None:
+                        self.failed += 1
+                        continue
+                    self.lookups += 1
+                    packages.update(result)
+            finally:
+                owner_pool.close()
+                page_pool.close()
+                owner_pool.join()
+                page_pool.join()
+        return packages
+
+    @property
+    def summary(self):
+        return "%i owners looked up, %i from the cache, %i failed" % (
+            self.lookups, self.cached, self.failed)
@@ -0,0 +1,97 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8 foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+""" :author: Till Maas
+    :contact: opensource@till.name
+    :license: GPLv2+
+"""
+__docformat__ = "restructuredtext"
+
+import re
+# sre_constants contains re exceptions
+import sre_constants
+import time
+
+
+class RegexRegistry(object):
+    """ Compiled regular expressions shared by all packages.
+
+    The re module only caches a small number of compiled patterns, which is
+    not enough for thousands of distinct package regexes. The registry keeps
+    every pattern compiled, or the error from compiling it, for the whole
+    run.
+    """
+    def __init__(self):
+        # pattern -> compiled pattern
+        self.compiled = {}
+        # pattern -> sre_constants.error
+        self.errors = {}
+
+        self.compile_time = 0.0
+        self.lookups = 0
+        self.hits = 0
+
+    def compile(self, pattern):
+        """ Return the compiled `pattern`
+
+        :raises sre_constants.error: if `pattern` is invalid
+        """
+        self.lookups += 1
+        try:
+            compiled = self.compiled[pattern]
+            self.hits += 1
+            return compiled
+        except KeyError:
+            pass
+        if pattern in self.errors:
+            self.hits += 1
+            raise self.errors[pattern]
+
+        start = time.time()
+        try:
+            compiled = re.compile(pattern)
+        except sre_constants.error, e:
+            self.errors[pattern] = e
+            raise
+        finally:
+            self.compile_time += time.time() - start
+        self.compiled[pattern] = compiled
+        return compiled
+
+    def compile_all(self, patterns):
+        """ Compile all `patterns` in one pass
+
+        :return: dict mapping every invalid pattern to its error
+        """
+        invalid = {}
+        for pattern in set(patterns):
+            try:
+                self.compile(pattern)
+            except sre_constants.error, e:
+                invalid[pattern] = e
+        return invalid
+
+    @property
+    def summary(self):
+        return "%i patterns compiled in %.3f s, %i invalid, %i of %i "\
+            "lookups shared a compiled pattern" % (
+                len(self.compiled), self.compile_time, len(self.errors),
+                self.hits, self.lookups)
+
+
+default_registry = RegexRegistry()
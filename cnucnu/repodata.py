@@ -0,0 +1,266 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8 foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+""" Read source package versions directly from yum repository metadata
+
+    :author: Till Maas
+    :contact: opensource@till.name
+    :license: GPLv2+
+"""
+__docformat__ = "restructuredtext"
+
+import bz2
+import cPickle as pickle
+import glob
+import gzip
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import xml.etree.cElementTree as ElementTree
+
+from cnucnu.helper import rpm_version_key
+
+log = logging.getLogger('cnucnu.repodata')
+
+REPO_NS = "{http://linux.duke.edu/metadata/repo}"
+COMMON_NS = "{http://linux.duke.edu/metadata/common}"
+
+
+def _download(url, fileobj):
+    """ Write the contents of `url` to `fileobj` without keeping them in
+    memory
+    """
+    import pycurl
+    from cnucnu.curl_pool import get_default_pool
+
+    pool = get_default_pool()
+    c = pool.acquire()
+    try:
+        c.setopt(pycurl.URL, url.encode("ascii"))
+        c.setopt(pycurl.WRITEFUNCTION, fileobj.write)
+        c.setopt(pycurl.FOLLOWLOCATION, 1)
+        c.setopt(pycurl.MAXREDIRS, 10)
+        c.setopt(pycurl.FAILONERROR, 1)
+        c.perform()
+    finally:
+        pool.release(c)
+
+
+def _open_decompressed(filename):
+    """ Open `filename` for reading and decompress it on the fly according to
+    its extension
+    """
+    if filename.endswith(".gz"):
+        return gzip.open(filename, "rb")
+    elif filename.endswith(".bz2"):
+        return bz2.BZ2File(filename, "rb")
+    elif filename.endswith(".xz"):
+        # only available with backports.lzma on Python 2
+        try:
+            import lzma
+        except ImportError:
+            from backports import lzma
+        return lzma.LZMAFile(filename, "rb")
+    return open(filename, "rb")
+
+
+class RepodataReader(object):
+    """ Build the name -> (version, release) map of the source packages in a
+    yum repository from its repodata/ directory.
+
+    primary.xml is parsed incrementally, so the whole document is never kept
+    in memory. If the repository only provides primary_db, the SQLite
+    database is queried instead. The result is cached below `cache_dir`
+    keyed by the checksum of the primary metadata, so an unchanged
+    repository is loaded from the cache.
+
+    :Parameters:
+        path : str
+            Local directory or URL of the repository
+        cache_dir : str
+            Directory for cached results, empty to disable the cache
+
+    """
+    def __init__(self, path, cache_dir=""):
+        if path.startswith("file://"):
+            path = path[len("file://"):]
+        self.path = path.rstrip("/")
+        self.cache_dir = cache_dir and os.path.expanduser(cache_dir)
+        self.remote = self.path.startswith(("http://", "https://", "ftp://"))
+
+    def _fetch(self, href, directory):
+        """ Return the name of a local file with the contents of `href`
+        relative to the repository, remote files are downloaded to
+        `directory`
+        """
+        if not self.remote:
+            return os.path.join(self.path, href)
+        filename = os.path.join(directory, os.path.basename(href))
+        with open(filename, "wb") as fileobj:
+            _download("%s/%s" % (self.path, href), fileobj)
+        return filename
+
+    def repomd(self, directory):
+        """ Return a dict mapping the metadata types of the repository to a
+        tuple of their location and checksum
+        """
+        filename = self._fetch("repodata/repomd.xml", directory)
+        tree = ElementTree.parse(filename)
+        metadata = {}
+        for data in tree.getroot().findall(REPO_NS + "data"):
+            location = data.find(REPO_NS + "location").get("href")
+            checksum = data.find(REPO_NS + "checksum").text.strip()
+            metadata[data.get("type")] = (location, checksum)
+        return metadata
+
+    def _cache_filename(self, checksum):
+        repo_hash = hashlib.sha1(self.path).hexdigest()
+        return os.path.join(self.cache_dir,
+                            "repodata-%s-%s" % (repo_hash, checksum))
+
+    def _load_cache(self, checksum):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._cache_filename(checksum), "rb") as cache_file:
+                return pickle.load(cache_file)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def _store_cache(self, checksum, nvr_dict):
+        if not self.cache_dir:
+            return
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        filename = self._cache_filename(checksum)
+        # remove results for older metadata of the same repository
+        for old in glob.glob(self._cache_filename("*")):
+            os.unlink(old)
+        fd, tmpname = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(fd, "wb") as cache_file:
+            pickle.dump(nvr_dict, cache_file, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmpname, filename)
+
+    @staticmethod
+    def _add(latest, name, epoch, version, release):
+        """ Add a package and keep only the latest one for each name
+
+        :Parameters:
+            latest : dict
+                name -> (epoch key, version, release) of the latest package
+                added so far
+
+        """
+        epoch = int(epoch or 0)
+        if name in latest:
+            old_epoch, old_version, old_release = latest[name]
+            if (old_epoch, rpm_version_key(old_version),
+                    rpm_version_key(old_release)) > \
+                    (epoch, rpm_version_key(version),
+                     rpm_version_key(release)):
+                return
+        latest[name] = (epoch, version, release)
+
+    @staticmethod
+    def _nvr_dict(latest):
+        return dict((name, (version, release)) for
+                    name, (epoch, version, release) in latest.iteritems())
+
+    def parse_primary_xml(self, filename):
+        latest = {}
+        package_tag = COMMON_NS + "package"
+        root = None
+        with _open_decompressed(filename) as primary:
+            for event, element in ElementTree.iterparse(
+                    primary, events=("start", "end")):
+                if root is None:
+                    root = element
+                if event != "end" or element.tag != package_tag:
+                    continue
+                if element.findtext(COMMON_NS + "arch") == "src":
+                    version = element.find(COMMON_NS + "version")
+                    self._add(latest, element.findtext(COMMON_NS + "name"),
+                              version.get("epoch"), version.get("ver"),
+                              version.get("rel"))
+                # drop the processed packages from the tree
+                root.clear()
+        return self._nvr_dict(latest)
+
+    def parse_primary_db(self, filename, directory):
+        if not filename.endswith(".sqlite"):
+            database = os.path.join(directory, "primary.sqlite")
+            with _open_decompressed(filename) as compressed:
+                with open(database, "wb") as uncompressed:
+                    shutil.copyfileobj(compressed, uncompressed)
+            filename = database
+
+        latest = {}
+        connection = sqlite3.connect(filename)
+        try:
+            for name, epoch, version, release in connection.execute(
+                    "SELECT name, epoch, version, release FROM packages "
+                    "WHERE arch = 'src'"):
+                self._add(latest, name.encode("utf-8"), epoch,
+                          version.encode("utf-8"), release.encode("utf-8"))
+        finally:
+            connection.close()
+        return self._nvr_dict(latest)
+
+    def nvr_dict(self, package_names=[]):
+        """ Return a dict mapping source package names to a tuple of their
+        version and release
+
+        :Parameters:
+            package_names : [str]
+                Return only these packages, all packages if empty
+
+        """
+        directory = tempfile.mkdtemp(prefix="cnucnu-repodata-")
+        try:
+            metadata = self.repomd(directory)
+            if "primary" in metadata:
+                primary_type = "primary"
+            elif "primary_db" in metadata:
+                primary_type = "primary_db"
+            else:
+                raise IOError("repository '%s' has no primary metadata" %
+                              self.path)
+            location, checksum = metadata[primary_type]
+
+            nvr_dict = self._load_cache(checksum)
+            if nvr_dict is None:
+                log.info("Reading '%s' of '%s'", location, self.path)
+                filename = self._fetch(location, directory)
+                if primary_type == "primary":
+                    nvr_dict = self.parse_primary_xml(filename)
+                else:
+                    nvr_dict = self.parse_primary_db(filename, directory)
+                self._store_cache(checksum, nvr_dict)
+            else:
+                log.info("Using cached metadata '%s' of '%s'", checksum,
+                         self.path)
+        finally:
+            shutil.rmtree(directory)
+
+        if package_names:
+            nvr_dict = dict((name, nvr_dict[name]) for name in package_names
+                            if name in nvr_dict)
+        return nvr_dict
@@ -0,0 +1,94 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8 foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+""" :author: Till Maas
+    :contact: opensource@till.name
+    :license: GPLv2+
+"""
+__docformat__ = "restructuredtext"
+
+from cnucnu.dir_walker import DirectoryWalker
+
+
+class RunCache(object):
+    """ Upstream pages and version results shared by all packages of a run.
+
+    Many packages resolve to the same upstream URL, e.g. packages expanded
+    from a wildcard line or aliases with name prefixes. Each distinct URL is
+    retrieved only once, even if that failed, and packages with the same URL
+    and regex share the extracted versions. Globbed directories are expanded with a shared
+    `cnucnu.dir_walker.DirectoryWalker`.
+    """
+    def __init__(self):
+        self.dir_walker = DirectoryWalker()
+        # expanded url -> html
+        self.pages = {}
+        # expanded url -> exception raised while retrieving it
+        self.errors = {}
+        # (expanded url, regex) -> upstream versions
+        self.versions = {}
+        # (expanded url, regex) -> latest upstream version
+        self.latest = {}
+
+        self.fetches = 0
+        self.saved_fetches = 0
+        self.shared_results = 0
+
+    def add_page(self, url, html, users=1):
+        """ Store `html` retrieved once for `users` packages """
+        self.pages[url] = html
+        self.fetches += 1
+        self.saved_fetches += users - 1
+
+    def add_error(self, url, error, users=1):
+        """ Store the exception `error` of retrieving `url` once for `users`
+        packages
+        """
+        self.errors[url] = error
+        self.fetches += 1
+        self.saved_fetches += users - 1
+
+    def get_page(self, url, fetch):
+        """ Return the page for `url`, call `fetch` with `url` to retrieve it
+        if it was not retrieved before. If that failed, the exception is
+        raised again.
+        """
+        if url in self.pages:
+            self.saved_fetches += 1
+            return self.pages[url]
+        if url in self.errors:
+            self.saved_fetches += 1
+            raise self.errors[url]
+        try:
+            html = fetch(url)
+        except Exception, e:
+            self.add_error(url, e)
+            raise
+        self.add_page(url, html)
+        return html
+
+    def get_versions(self, key):
+        versions = self.versions.get(key)
+        if versions is not None:
+            self.shared_results += 1
+        return versions
+
+    @property
+    def summary(self):
+        return "fetched %i upstream pages, saved %i fetches, shared %i "\
+            "results" % (self.fetches, self.saved_fetches, self.shared_results)
@@ -0,0 +1,114 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8 foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+""" :author: Till Maas
+    :contact: opensource@till.name
+    :license: GPLv2+
+"""
+__docformat__ = "restructuredtext"
+
+import logging
+import time
+
+log = logging.getLogger('cnucnu.scheduler')
+
+
+class Scheduler(object):
+    """ Decide when packages are checked again based on how often their
+    upstream released in the past.
+
+    The expected time between two releases is the median gap between the
+    recorded releases or, if the last release is longer ago, the time since
+    the last release. A package is checked `checks_per_release` times in
+    that period, but not more often than every `min_interval` and at least
+    every `max_interval` seconds.
+
+    :Parameters:
+        state : `cnucnu.state_store.StateStore`
+            Store with the release history and the next check times
+        min_interval : int
+            Minimum seconds between two checks of a package
+        max_interval : int
+            Maximum seconds between two checks of a package
+        checks_per_release : int
+            Checks per expected release period
+        budget : int
+            Maximum packages to check per run, 0 for no limit
+
+    """
+    def __init__(self, state, min_interval=86400, max_interval=30 * 86400,
+                 checks_per_release=4, budget=0):
+        self.state = state
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.checks_per_release = max(1, checks_per_release)
+        self.budget = budget
+
+    def interval(self, release_times, now):
+        """ Return the seconds until the next check of a package whose new
+        releases were seen at `release_times`
+        """
+        if not release_times:
+            return self.min_interval
+        gaps = sorted(b - a for a, b in zip(release_times, release_times[1:]))
+        since_last = now - release_times[-1]
+        if gaps:
+            expected = max(gaps[len(gaps) / 2], since_last)
+        else:
+            expected = since_last
+        interval = expected / self.checks_per_release
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def due(self, packages, now=None):
+        """ Return the packages of `packages` that are due, the most overdue
+        ones first and at most `budget` of them
+        """
+        if now is None:
+            now = time.time()
+        if not self.state.enabled:
+            return list(packages)
+        next_checks = self.state.next_checks()
+        due = []
+        for index, package in enumerate(packages):
+            next_check = next_checks.get(self.state.key(package))
+            if next_check is None or next_check <= now:
+                # never checked packages first, keep the order otherwise
+                due.append((next_check or 0, index, package))
+        due.sort()
+        if self.budget and len(due) > self.budget:
+            log.info("'%i' packages are due, checking '%i' of them",
+                     len(due), self.budget)
+            due = due[:self.budget]
+        # keep the order of the list for the checks
+        due.sort(key=lambda d: d[1])
+        due = [package for (next_check, index, package) in due]
+        log.info("'%i' of '%i' packages are due", len(due), len(packages))
+        return due
+
+    def reschedule(self, package, now=None):
+        """ Store the time of the next check of `package` after it was
+        checked completely
+
+        :return: time of the next check
+        """
+        if now is None:
+            now = time.time()
+        next_check = now + self.interval(self.state.release_times(package),
+                                         now)
+        self.state.set_next_check(package, next_check)
+        return next_check
@@ -19,14 +19,27 @@
 
 # Options: http://curl.haxx.se/libcurl/c/curl_easy_setopt.html
 
+import logging
+import os
+import subprocess
+
 from helper import secure_download
 from config import global_config
+from http_cache import HTTPCache
+
+log = logging.getLogger('cnucnu.scm')
+
+# bare repositories read by one git cat-file process
+GIT_BATCH_SIZE = 100
 
 
 class SCM(object):
     """ cainfo: filename :-/
+
+    `sources` files are cached below `cache_dir` and only downloaded again
+    when the server reports a change for the conditional request.
     """
-    def __init__(self, view_scm_url="", cainfo=""):
+    def __init__(self, view_scm_url="", cainfo="", cache_dir=None):
         defaults = global_config.config["scm"]
 
         if not view_scm_url:
@@ -35,14 +48,46 @@ class SCM(object):
         if not cainfo:
             cainfo = defaults["cainfo"]
 
+        if cache_dir is None:
+            cache_dir = defaults.get("cache_dir", "")
+
         self.view_scm_url = view_scm_url
         self.cainfo = cainfo
+        self.cache = HTTPCache(directory=cache_dir, ttl=0)
+        # url -> sources from prefetch_sources()
+        self._sources = {}
+
+    def prefetch_sources(self, packages, fetcher=None):
+        """ Download the `sources` files of all `packages` concurrently
+
+        :Parameters:
+            fetcher : `cnucnu.fetcher.MultiFetcher`
+                Fetcher to use, defaults to a fetcher using the cache of the
+                SCM
+
+        """
+        if fetcher is None:
+            from cnucnu.fetcher import MultiFetcher
+            fetcher = MultiFetcher(cache=self.cache, cainfo=self.cainfo,
+                                   **global_config.config["fetcher"])
+        urls = set(self.view_scm_url % package for package in packages)
+        urls.difference_update(self._sources)
+        log.info("Prefetching '%i' sources files", len(urls))
+        for url, (data, error) in fetcher.fetch(urls).items():
+            if error:
+                log.debug("Failed to prefetch '%s': %s", url, error)
+            else:
+                self._sources[url] = data
 
     def get_sources(self, package):
-        return secure_download(self.view_scm_url % package, cainfo=self.cainfo)
+        url = self.view_scm_url % package
+        if url in self._sources:
+            return self._sources[url]
+        return secure_download(url, cainfo=self.cainfo, cache=self.cache)
 
-    def get_sourcefiles(self, package):
-        sources = self.get_sources(package)
+    def get_sourcefiles(self, package, sources=None):
+        if sources is None:
+            sources = self.get_sources(package)
         sourcefiles = []
         for line in sources.split("\n"):
             if line != "":
@@ -59,6 +104,191 @@ class SCM(object):
         return False
 
 
+class MirrorSCM(SCM):
+    """ Read `sources` files from a local mirror of dist-git that is updated
+    out-of-band, without any network I/O.
+
+    The source filenames of all packages are read into an index on first
+    use, so `has_upstream_version` is a lookup.
+
+    :Parameters:
+        mirror_path : str
+            Directory with a `<name>/sources` file for every package
+            (layout "tree") or a bare `<name>.git` repository for every
+            package (layout "git")
+        mirror_layout : str
+            "tree" or "git"
+        mirror_branch : str
+            Branch to read `sources` from in bare repositories
+
+    The remaining arguments are passed to `SCM`.
+    """
+    def __init__(self, mirror_path, mirror_layout="tree",
+                 mirror_branch="master", **kwargs):
+        if mirror_layout not in ("tree", "git"):
+            raise ValueError("unknown dist-git mirror layout '%s'" %
+                             mirror_layout)
+        SCM.__init__(self, **kwargs)
+        self.path = os.path.expanduser(mirror_path)
+        self.layout = mirror_layout
+        self.branch = mirror_branch
+        # package name -> [source filename]
+        self._index = None
+
+    def package_names(self):
+        """ Return the names of all packages in the mirror """
+        names = []
+        for entry in os.listdir(self.path):
+            if self.layout == "git":
+                if entry.endswith(".git"):
+                    names.append(entry[:-len(".git")])
+            elif os.path.isfile(os.path.join(self.path, entry, "sources")):
+                names.append(entry)
+        return names
+
+    def read_sources(self, name):
+        """ Return the contents of the `sources` file of package `name` or
+        None if it has none
+        """
+        if self.layout == "tree":
+            try:
+                with open(os.path.join(self.path, name, "sources")) as f:
+                    return f.read()
+            except IOError:
+                return None
+
+        git = subprocess.Popen(
+            ["git", "--git-dir", os.path.join(self.path, name + ".git"),
+             "cat-file", "blob", "%s:sources" % self.branch],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        sources, stderr = git.communicate()
+        if git.returncode != 0:
+            return None
+        return sources
+
+    def branch_commit(self, name):
+        """ Return the commit id of the mirrored branch of package `name`
+        from the refs on disk or None if the branch does not exist
+        """
+        git_dir = os.path.join(self.path, name + ".git")
+        ref = "refs/heads/%s" % self.branch
+        try:
+            with open(os.path.join(git_dir, ref)) as f:
+                return f.read().strip()
+        except IOError:
+            pass
+        try:
+            with open(os.path.join(git_dir, "packed-refs")) as f:
+                for line in f:
+                    fields = line.split()
+                    if len(fields) == 2 and fields[1] == ref:
+                        return fields[0]
+        except IOError:
+            pass
+        return None
+
+    def read_git_sources(self, names):
+        """ Return a dict mapping the names of `names` that have a `sources`
+        file to its contents, using one `git cat-file --batch` process for
+        `GIT_BATCH_SIZE` repositories at a time
+        """
+        commits = []
+        for name in names:
+            commit = self.branch_commit(name)
+            if commit:
+                commits.append((name, commit))
+
+        sources = {}
+        for start in range(0, len(commits), GIT_BATCH_SIZE):
+            batch = commits[start:start + GIT_BATCH_SIZE]
+            try:
+                sources.update(self._cat_file_batch(batch))
+            except (OSError, ValueError, IndexError), e:
+                log.warning("Reading sources files in '%s' with one git "
+                            "process failed, reading them one by one (%s)",
+                            self.path, e)
+                for name, commit in batch:
+                    sources[name] = self.read_sources(name)
+        return sources
+
+    def _cat_file_batch(self, batch):
+        """ Read the `sources` files of the (name, commit) tuples in `batch`
+        with one `git cat-file --batch` process
+        """
+        # all objects of the batch are reachable through the alternates
+        env = dict(os.environ)
+        env["GIT_ALTERNATE_OBJECT_DIRECTORIES"] = os.pathsep.join(
+            os.path.join(self.path, name + ".git", "objects")
+            for name, commit in batch[1:])
+        git = subprocess.Popen(
+            ["git", "--git-dir", os.path.join(self.path, batch[0][0] + ".git"),
+             "cat-file", "--batch"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, env=env)
+        stdout, stderr = git.communicate(
+            "".join("%s:sources\n" % commit for name, commit in batch))
+        if git.returncode != 0:
+            raise OSError("git cat-file exited with %i: %s" % (
+                git.returncode, stderr.strip()))
+
+        sources = {}
+        pos = 0
+        for name, commit in batch:
+            end = stdout.index("\n", pos)
+            header = stdout[pos:end].split()
+            pos = end + 1
+            if header[-1] == "missing":
+                continue
+            size = int(header[2])
+            if header[1] == "blob":
+                sources[name] = stdout[pos:pos + size]
+            pos += size + 1
+        return sources
+
+    @property
+    def index(self):
+        if self._index is None:
+            names = self.package_names()
+            if self.layout == "git":
+                all_sources = self.read_git_sources(names)
+            else:
+                all_sources = dict((name, self.read_sources(name))
+                                   for name in names)
+            index = {}
+            for name, sources in all_sources.items():
+                if sources is not None:
+                    index[name] = SCM.get_sourcefiles(self, {"name": name},
+                                                      sources)
+            log.info("Indexed the sources of '%i' packages in '%s'",
+                     len(index), self.path)
+            self._index = index
+        return self._index
+
+    def prefetch_sources(self, packages, fetcher=None):
+        # everything is on disk, only make sure the index exists
+        self.index
+
+    def get_sources(self, package):
+        return self.read_sources(package["name"]) or ""
+
+    def get_sourcefiles(self, package, sources=None):
+        if sources is None:
+            return self.index.get(package["name"], [])
+        return SCM.get_sourcefiles(self, package, sources)
+
+
+def get_scm(backend="http", mirror_path="", mirror_layout="tree",
+            mirror_branch="master", **kwargs):
+    """ Return the SCM for the `backend` configured in the scm section of the
+    config, the remaining arguments are passed to `SCM`
+    """
+    if backend == "mirror":
+        return MirrorSCM(mirror_path, mirror_layout, mirror_branch, **kwargs)
+    elif backend != "http":
+        raise ValueError("unknown scm backend '%s'" % backend)
+    return SCM(**kwargs)
+
+
 if __name__ == '__main__':
     scm = SCM(**{
         "view_scm_url":
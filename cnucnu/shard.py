@@ -0,0 +1,147 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8 foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+""" :author: Till Maas
+    :contact: opensource@till.name
+    :license: GPLv2+
+"""
+__docformat__ = "restructuredtext"
+
+import hashlib
+import json
+import logging
+import time
+
+log = logging.getLogger('cnucnu.shard')
+
+
+def parse_shard(text):
+    """ Return the tuple (K, N) for the shard specification "K/N" """
+    try:
+        shard, shards = [int(part) for part in text.split("/")]
+    except ValueError:
+        raise ValueError("'%s' is not of the form K/N" % text)
+    if not 1 <= shard <= shards:
+        raise ValueError("shard '%i' is not between 1 and '%i'" % (shard,
+                                                                   shards))
+    return (shard, shards)
+
+
+def in_shard(name, shard, shards):
+    """ Return whether the package `name` belongs to shard `shard` of
+    `shards`, counted from 1
+
+    The shard depends only on the name, so every node assigns the same
+    packages to the same shard.
+    """
+    return int(hashlib.md5(name).hexdigest()[:8], 16) % shards == shard - 1
+
+
+class ShardResult(object):
+    """ Outcome of checking one shard of the package list, saved as JSON
+    file to merge it with the other shards.
+
+    :Parameters:
+        shard : int
+            Number of the shard, counted from 1
+        shards : int
+            Number of shards
+
+    """
+    def __init__(self, shard=1, shards=1):
+        self.shard = shard
+        self.shards = shards
+        self.finished = None
+        self.checked = 0
+        # dicts with the versions of outdated packages
+        self.outdated = []
+        # dicts with the errors of failed packages
+        self.failed = []
+        # Bugzilla writes as (action, name, request)
+        self.plan = []
+
+    def add_outdated(self, package):
+        self.outdated.append({"name": package.name,
+                              "url": package.url,
+                              "repo_version": package.repo_version,
+                              "repo_release": package.repo_release,
+                              "latest_upstream": package.latest_upstream})
+
+    def add_failure(self, package, error):
+        self.failed.append({"name": package.name,
+                            "error_class": type(error).__name__,
+                            "message": str(error)})
+
+    def save(self, filename):
+        self.finished = time.time()
+        with open(filename, "w") as result_file:
+            json.dump(self.__dict__, result_file, indent=1, sort_keys=True)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename) as result_file:
+            data = json.load(result_file)
+        result = cls()
+        result.__dict__.update(data)
+        result.plan = [tuple(operation) for operation in result.plan]
+        return result
+
+
+def merge_results(results):
+    """ Combine the results of the shards of one run into one result
+
+    Results of the same shard are only used once. Bug creations with the
+    same summary and identical updates are only planned once.
+
+    :Parameters:
+        results : [`ShardResult`]
+            Results of the shards, all with the same number of shards
+
+    :return: (merged `ShardResult`, list of the missing shard numbers)
+    """
+    shard_counts = set(result.shards for result in results)
+    if len(shard_counts) != 1:
+        raise ValueError("results of different shard counts: %s" %
+                         ", ".join(str(count) for count in
+                                   sorted(shard_counts)))
+    merged = ShardResult(shard=None, shards=shard_counts.pop())
+
+    seen_shards = set()
+    seen_writes = set()
+    for result in results:
+        if result.shard in seen_shards:
+            log.warning("Ignoring another result of shard '%i/%i'",
+                        result.shard, result.shards)
+            continue
+        seen_shards.add(result.shard)
+        merged.checked += result.checked
+        merged.outdated.extend(result.outdated)
+        merged.failed.extend(result.failed)
+        for action, name, request in result.plan:
+            if action == "create":
+                key = (action, request["short_desc"])
+            else:
+                key = (action, name, json.dumps(request, sort_keys=True))
+            if key not in seen_writes:
+                seen_writes.add(key)
+                merged.plan.append((action, name, request))
+
+    merged.outdated.sort(key=lambda package: package["name"])
+    merged.failed.sort(key=lambda package: package["name"])
+    missing = sorted(set(range(1, merged.shards + 1)) - seen_shards)
+    return (merged, missing)
@@ -0,0 +1,336 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8 foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+""" :author: Till Maas
+    :contact: opensource@till.name
+    :license: GPLv2+
+"""
+__docformat__ = "restructuredtext"
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+
+import cnucnu.errors as cc_errors
+
+log = logging.getLogger('cnucnu.state_store')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS packages (
+    name TEXT,
+    url TEXT,
+    regex TEXT,
+    page_hash TEXT,
+    versions TEXT,
+    latest_upstream TEXT,
+    repo_version TEXT,
+    repo_release TEXT,
+    rpm_diff INTEGER,
+    checked REAL,
+    changed REAL,
+    next_check REAL,
+    nagging INTEGER,
+    PRIMARY KEY (name, url, regex)
+);
+CREATE TABLE IF NOT EXISTS releases (
+    name TEXT,
+    url TEXT,
+    regex TEXT,
+    latest_upstream TEXT,
+    seen REAL
+);
+CREATE INDEX IF NOT EXISTS releases_package ON releases (name, url, regex);
+CREATE TABLE IF NOT EXISTS failures (
+    name TEXT,
+    url TEXT,
+    regex TEXT,
+    error_class TEXT,
+    message TEXT,
+    first_failed REAL,
+    last_failed REAL,
+    count INTEGER,
+    retry_at REAL,
+    PRIMARY KEY (name, url, regex)
+);
+"""
+
+
+def page_hash(html):
+    return hashlib.sha1(html).hexdigest()
+
+
+class StateStore(object):
+    """ Results of previous runs for every package, kept in an SQLite
+    database.
+
+    A package whose upstream page and repository version did not change
+    since it was completely processed does not need to be checked again.
+
+    Packages whose upstream information could not be retrieved are not
+    checked again until a backoff time passed, that starts with
+    `failure_backoff` and doubles with every further failure up to
+    `max_failure_backoff`.
+
+    The writes of a run are committed in batches of `commit_interval`
+    writes and on `close`, so unchanged packages are cheap.
+
+    :Parameters:
+        filename : str
+            SQLite database file, empty to disable the store
+        failure_backoff : int
+            Seconds to skip a package after its first failure
+        max_failure_backoff : int
+            Maximum seconds to skip a failing package
+        commit_interval : int
+            Writes per transaction
+
+    """
+    def __init__(self, filename="", failure_backoff=86400,
+                 max_failure_backoff=30 * 86400, commit_interval=500):
+        self.failure_backoff = failure_backoff
+        self.max_failure_backoff = max_failure_backoff
+        self.commit_interval = max(1, commit_interval)
+        self._uncommitted = 0
+        # keys of the packages with a failure row
+        self._failing = set()
+        self.connection = None
+        if filename:
+            filename = os.path.expanduser(filename)
+            directory = os.path.dirname(filename)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            self.connection = sqlite3.connect(filename)
+            self.connection.text_factory = str
+            self.connection.executescript(SCHEMA)
+            self._upgrade()
+            self._failing = set(self.connection.execute(
+                "SELECT name, url, regex FROM failures"))
+
+        self.unchanged_count = 0
+        self.changed_count = 0
+
+    def _upgrade(self):
+        """ Add columns missing in stores of older versions """
+        columns = [row[1] for row in self.connection.execute(
+            "PRAGMA table_info(packages)")]
+        with self.connection:
+            if "next_check" not in columns:
+                self.connection.execute(
+                    "ALTER TABLE packages ADD COLUMN next_check REAL")
+            if "nagging" not in columns:
+                self.connection.execute(
+                    "ALTER TABLE packages ADD COLUMN nagging INTEGER")
+
+    def _write(self, sql, parameters):
+        """ Execute `sql` in the current transaction and commit it every
+        `commit_interval` writes
+        """
+        self.connection.execute(sql, parameters)
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_interval:
+            self.commit()
+
+    def commit(self):
+        if self.enabled:
+            self.connection.commit()
+        self._uncommitted = 0
+
+    @property
+    def enabled(self):
+        return self.connection is not None
+
+    @staticmethod
+    def key(package):
+        return (package.name, package.raw_url, package.raw_regex)
+
+    def get(self, package):
+        """ Return the stored state of `package` as dict or None """
+        if not self.enabled:
+            return None
+        cursor = self.connection.execute(
+            "SELECT * FROM packages WHERE name = ? AND url = ? AND regex = ?",
+            self.key(package))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        state = dict(zip([d[0] for d in cursor.description], row))
+        state["versions"] = [v.encode("utf-8") for v in
+                             json.loads(state["versions"])]
+        return state
+
+    def restore_unchanged(self, package):
+        """ Restore the results of the previous run into `package` if its
+        upstream page, repository version and nagging setting did not change
+
+        :return: True if `package` is unchanged
+        """
+        state = self.get(package)
+        if state is None or state["page_hash"] != page_hash(package.html) or \
+                state["repo_version"] != package.repo_version or \
+                state["repo_release"] != package.repo_release or \
+                state["nagging"] != int(package.nagging):
+            self.changed_count += 1
+            return False
+
+        package._upstream_versions = state["versions"]
+        package._latest_upstream = state["latest_upstream"]
+        package._rpm_diff = state["rpm_diff"]
+        self._write(
+            "UPDATE packages SET checked = ? WHERE name = ? AND url = ? "
+            "AND regex = ?", (time.time(), ) + self.key(package))
+        self.unchanged_count += 1
+        return True
+
+    def record(self, package):
+        """ Store the results of `package` after it was completely processed
+        """
+        if not self.enabled:
+            return
+        now = time.time()
+        old = self.get(package)
+        changed = now
+        if old and old["latest_upstream"] == package.latest_upstream and \
+                old["repo_version"] == package.repo_version and \
+                old["repo_release"] == package.repo_release:
+            changed = old["changed"]
+        self._write(
+            "INSERT OR REPLACE INTO packages (name, url, regex, page_hash, "
+            "versions, latest_upstream, repo_version, repo_release, "
+            "rpm_diff, checked, changed, next_check, nagging) VALUES "
+            "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            self.key(package) + (
+                page_hash(package.html),
+                json.dumps(package.upstream_versions),
+                package.latest_upstream, package.repo_version,
+                package.repo_release, package.rpm_diff, now, changed,
+                old and old["next_check"], int(package.nagging)))
+        if not old or old["latest_upstream"] != package.latest_upstream:
+            self._write("INSERT INTO releases VALUES (?, ?, ?, ?, ?)",
+                        self.key(package) + (package.latest_upstream, now))
+
+    def release_times(self, package):
+        """ Return the sorted times when a new latest upstream version of
+        `package` was seen
+        """
+        if not self.enabled:
+            return []
+        return [row[0] for row in self.connection.execute(
+            "SELECT seen FROM releases WHERE name = ? AND url = ? AND "
+            "regex = ? ORDER BY seen", self.key(package))]
+
+    def next_checks(self):
+        """ Return a dict mapping the (name, url, regex) key of every stored
+        package to the time of its next check or None
+        """
+        if not self.enabled:
+            return {}
+        return dict(((name, url, regex), next_check) for
+                    (name, url, regex, next_check) in self.connection.execute(
+                        "SELECT name, url, regex, next_check FROM packages"))
+
+    def set_next_check(self, package, next_check):
+        if not self.enabled:
+            return
+        self._write(
+            "UPDATE packages SET next_check = ? WHERE name = ? AND url = ? "
+            "AND regex = ?", (next_check, ) + self.key(package))
+
+    def record_failure(self, package, error, now=None):
+        """ Store that the upstream information of `package` could not be
+        retrieved because of `error` and extend its backoff time
+
+        :return: time of the next retry
+        """
+        if not self.enabled:
+            return None
+        if now is None:
+            now = time.time()
+        row = self.connection.execute(
+            "SELECT first_failed, count FROM failures WHERE name = ? AND "
+            "url = ? AND regex = ?", self.key(package)).fetchone()
+        first_failed, count = row if row else (now, 0)
+        count += 1
+        retry_at = now + min(self.max_failure_backoff,
+                             self.failure_backoff * 2 ** (count - 1))
+        self._write(
+            "INSERT OR REPLACE INTO failures VALUES "
+            "(?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            self.key(package) + (type(error).__name__, error.message,
+                                 first_failed, now, count, retry_at))
+        self._failing.add(self.key(package))
+        return retry_at
+
+    def clear_failure(self, package):
+        """ Forget the failures of `package` after it was checked """
+        if self.key(package) not in self._failing:
+            return
+        self._failing.discard(self.key(package))
+        self._write("DELETE FROM failures WHERE name = ? AND url = ? AND "
+                    "regex = ?", self.key(package))
+
+    def backoff_errors(self, now=None):
+        """ Return a dict mapping the (name, url, regex) key of every package
+        that is not retried yet to its last error
+        """
+        if not self.enabled:
+            return {}
+        if now is None:
+            now = time.time()
+        errors = {}
+        for row in self.connection.execute(
+                "SELECT name, url, regex, error_class, message, retry_at "
+                "FROM failures WHERE retry_at > ?", (now, )):
+            name, url, regex, error_class, message, retry_at = row
+            error_type = getattr(cc_errors, error_class,
+                                 cc_errors.UpstreamVersionRetrievalError)
+            errors[(name, url, regex)] = error_type(
+                "%s (cached failure, retried after %s)" % (
+                    message, time.strftime("%Y-%m-%d %H:%M",
+                                           time.localtime(retry_at))))
+        return errors
+
+    def failures(self, min_age=0, now=None):
+        """ Return the stored failures as dicts, the oldest first
+
+        :Parameters:
+            min_age : int
+                Only return failures that started this many seconds ago
+
+        """
+        if not self.enabled:
+            return []
+        if now is None:
+            now = time.time()
+        cursor = self.connection.execute(
+            "SELECT * FROM failures WHERE first_failed <= ? "
+            "ORDER BY first_failed, name", (now - min_age, ))
+        columns = [d[0] for d in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+    @property
+    def summary(self):
+        return "%i packages unchanged since the last run, %i changed" % (
+            self.unchanged_count, self.changed_count)
+
+    def close(self):
+        if self.enabled:
+            self.commit()
+            self.connection.close()
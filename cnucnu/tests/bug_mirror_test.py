@@ -0,0 +1,121 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8  foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import xmlrpclib
+from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+import sys
+sys.path.insert(0, '../..')
+
+from cnucnu.bug_mirror import BugMirror
+
+
+class QuietRequestHandler(SimpleXMLRPCRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeBugzilla(object):
+    """ Bug.search of a Bugzilla with a few bugs """
+    def __init__(self):
+        self.bugs = {}
+        self.searches = []
+
+    def add(self, bug_id, component, status, summary, changed):
+        self.bugs[bug_id] = {"id": bug_id, "component": [component],
+                             "status": status, "summary": summary,
+                             "last_change_time": xmlrpclib.DateTime(changed)}
+
+    def search(self, params):
+        self.searches.append(params)
+        since = ""
+        if "last_change_time" in params:
+            since = params["last_change_time"].value
+        bugs = [bug for bug_id, bug in sorted(self.bugs.items())
+                if bug["last_change_time"].value >= since]
+        offset = params.get("offset", 0)
+        return {"bugs": bugs[offset:offset + params["limit"]]}
+
+
+class BugMirrorTest(unittest.TestCase):
+    def setUp(self):
+        self.bugzilla = FakeBugzilla()
+        self.server = SimpleXMLRPCServer(("127.0.0.1", 0),
+                                         requestHandler=QuietRequestHandler,
+                                         allow_none=True, logRequests=False)
+        self.server.register_function(self.bugzilla.search, "Bug.search")
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.proxy = xmlrpclib.ServerProxy(
+            "http://127.0.0.1:%i" % self.server.server_address[1])
+
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "bugs.sqlite")
+        self.query = {"creator": "monitor@example.com", "product": "Fedora"}
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def testIncrementalSync(self):
+        self.bugzilla.add(1, "foo", "NEW", "foo-1.0 is available",
+                          "20140101T10:00:00")
+        self.bugzilla.add(2, "bar", "CLOSED", "bar-2.0 is available",
+                          "20140102T10:00:00")
+        self.bugzilla.add(3, "baz", "NEW", "baz-3.0 is available",
+                          "20140103T10:00:00")
+
+        mirror = BugMirror(self.filename, page_size=2)
+        self.assertEqual(mirror.sync(self.proxy, self.query), 3)
+        self.assertEqual(len(mirror), 3)
+        self.assertFalse("last_change_time" in self.bugzilla.searches[0])
+        mirror.close()
+
+        # only the changed bug and the ones changed at the last sync time are
+        # fetched again
+        self.bugzilla.add(1, "foo", "NEW", "foo-1.1 is available",
+                          "20140104T10:00:00")
+        mirror = BugMirror(self.filename, page_size=2)
+        self.assertEqual(mirror.sync(self.proxy, self.query), 2)
+        self.assertEqual(self.bugzilla.searches[-1]["last_change_time"].value,
+                         "20140103T10:00:00")
+        bugs = mirror.bugs(["foo"])
+        self.assertEqual([(b.bug_id, b.bug_status, b.short_desc)
+                          for b in bugs],
+                         [(1, "NEW", "foo-1.1 is available")])
+        self.assertEqual([b.bug_id for b in mirror.bugs()], [1, 2, 3])
+
+        # full resync drops bugs that no longer match
+        del self.bugzilla.bugs[2]
+        self.assertEqual(mirror.sync(self.proxy, self.query, full=True), 2)
+        self.assertEqual([b.bug_id for b in mirror.bugs()], [1, 3])
+        mirror.close()
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(BugMirrorTest)
+    unittest.TextTestRunner(verbosity=2).run(suite)
+    #unittest.main()
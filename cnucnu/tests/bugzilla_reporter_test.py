@@ -0,0 +1,106 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8  foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+import unittest
+
+import sys
+sys.path.insert(0, '../..')
+
+from cnucnu.bugzilla_reporter import BugzillaReporter
+
+CONFIG = {"url": "https://bugzilla.example.com/xmlrpc.cgi",
+          "user": "cnucnu@example.com", "password": "",
+          "product": "Fedora", "version": "rawhide",
+          "bug status": "NEW",
+          "bug url prefix": "https://bugzilla.example.com/show_bug.cgi?id=",
+          "prefetch page size": 2}
+
+
+class FakeBug(object):
+    def __init__(self, bug_id, component, short_desc, bug_status="NEW"):
+        self.bug_id = bug_id
+        self.component = component
+        self.short_desc = short_desc
+        self.bug_status = bug_status
+
+
+class FakeBugzilla(object):
+    """ Answers paged queries from a list of bugs """
+    def __init__(self, bugs):
+        self.bugs = bugs
+        self.queries = []
+
+    def query(self, query):
+        self.queries.append(dict(query))
+        offset = query.get("offset", 0)
+        return self.bugs[offset:offset + query["limit"]]
+
+
+class FakePackage(dict):
+    def __init__(self, name, latest_upstream):
+        dict.__init__(self, name=name, latest_upstream=latest_upstream)
+        self.name = name
+
+
+class BugzillaReporterTest(unittest.TestCase):
+    def reporter(self, bugs):
+        reporter = BugzillaReporter(dict(CONFIG))
+        reporter._bz = FakeBugzilla(bugs)
+        return reporter
+
+    def testPrefetchBugs(self):
+        reporter = self.reporter([
+            FakeBug(1, "foo", "foo-1.0 is available", "CLOSED"),
+            FakeBug(2, "foo", "foo-1.1 is available"),
+            FakeBug(3, "bar", "bar-2.0 is available"),
+            FakeBug(4, ["baz", "qux"], "baz-0.1 is available"),
+            FakeBug(5, "bar", "bar-2.1 is available", "CLOSED")])
+        reporter.prefetch_bugs(["foo", "bar", "baz"])
+        # pages until one is not full
+        self.assertEqual([q["offset"] for q in reporter.bz.queries],
+                         [0, 2, 4])
+        self.assertEqual(reporter.bz.queries[0]["component"],
+                         ["foo", "bar", "baz"])
+
+        # later lookups do not query Bugzilla
+        self.assertEqual(reporter.get_exact_outdated_bug(
+            FakePackage("foo", "1.0")).bug_id, 1)
+        self.assertEqual(reporter.get_exact_outdated_bug(
+            FakePackage("foo", "1.2")), None)
+        self.assertEqual(reporter.get_open_outdated_bug(
+            FakePackage("foo", "1.2")).bug_id, 2)
+        self.assertEqual(reporter.find_bug("qux", "baz-0.1 ").bug_id, 4)
+        self.assertEqual(reporter.get_open_outdated_bug(
+            FakePackage("missing", "1.0")), None)
+        self.assertEqual(len(reporter.bz.queries), 3)
+
+    def testPrefetchFullPages(self):
+        reporter = self.reporter([
+            FakeBug(i, "foo", "foo-1.%i is available" % i) for i in range(4)])
+        reporter.prefetch_bugs()
+        # the last page is empty
+        self.assertEqual([q["offset"] for q in reporter.bz.queries],
+                         [0, 2, 4])
+        self.assertFalse("component" in reporter.bz.queries[0])
+        self.assertEqual(reporter.find_bug("foo", "foo-1.3 ").bug_id, 3)
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(BugzillaReporterTest)
+    unittest.TextTestRunner(verbosity=2).run(suite)
+    #unittest.main()
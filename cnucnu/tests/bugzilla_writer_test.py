@@ -0,0 +1,109 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8  foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+
+import time
+import unittest
+
+import sys
+sys.path.insert(0, '../..')
+
+from cnucnu.bugzilla_writer import BugzillaWritePlan, BugzillaWriteQueue, \
+    TokenBucket
+
+
+class FakeProxy(object):
+    def __init__(self):
+        self.Bug = self
+        self.updates = []
+
+    def update(self, update):
+        self.updates.append(update)
+        return {"bugs": [{"id": bug_id} for bug_id in update["ids"]]}
+
+
+class FakeReporter(object):
+    """ Records the requests instead of sending them to Bugzilla """
+    def __init__(self):
+        self.bz = self
+        self._proxy = FakeProxy()
+        self.created = []
+
+    def connect(self):
+        return self
+
+    def send_outdated_bug(self, bug_dict, bz=None):
+        self.created.append(bug_dict)
+        return (str(len(self.created)), None)
+
+    def bug_url(self, bug_id):
+        return "https://bugzilla.example.com/show_bug.cgi?id=%s" % bug_id
+
+
+class BugzillaWriteQueueTest(unittest.TestCase):
+    def testQueue(self):
+        reporter = FakeReporter()
+        queue = BugzillaWriteQueue(reporter, rate=0, dry_run=False)
+        queue.create("foo", {"short_desc": "foo-1.0 is available"})
+        queue.update("bar", {"summary": "bar-2.0 is available",
+                             "ids": [42]})
+        self.assertEqual(queue.queued_updates, set([42]))
+        results = queue.close()
+        self.assertEqual(reporter.created,
+                         [{"short_desc": "foo-1.0 is available"}])
+        self.assertEqual(reporter._proxy.updates,
+                         [{"summary": "bar-2.0 is available", "ids": [42]}])
+        self.assertEqual([(r.action, r.names) for r in results],
+                         [("created", ["foo"]), ("updated", ["bar"])])
+        self.assertEqual(queue.summary, "1 bugs created, 1 bugs updated, "
+                         "0 requests failed")
+
+    def testDryRun(self):
+        reporter = FakeReporter()
+        queue = BugzillaWriteQueue(reporter, dry_run=True)
+        queue.create("foo", {"short_desc": "foo-1.0 is available"})
+        results = queue.close()
+        self.assertEqual(reporter.created, [])
+        self.assertEqual(results[0].request,
+                         {"short_desc": "foo-1.0 is available"})
+
+    def testPlan(self):
+        plan = BugzillaWritePlan()
+        plan.create("foo", {"short_desc": "foo-1.0 is available"})
+        plan.update("bar", {"summary": "bar-2.0 is available", "ids": [42]})
+        self.assertEqual(plan.queued_summaries, set(["foo-1.0 is available"]))
+        self.assertEqual([(r.action, r.names) for r in plan.close()],
+                         [("planned to be created", ["foo"]),
+                          ("planned to be updated", ["bar"])])
+        self.assertEqual(plan.summary,
+                         "planned: 1 bugs to create, 1 bugs to update")
+
+    def testTokenBucket(self):
+        bucket = TokenBucket(rate=100, burst=2)
+        start = time.time()
+        for i in range(6):
+            bucket.acquire()
+        # two tokens are available at once, four have to be waited for
+        self.assertTrue(time.time() - start >= 0.035)
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(
+        BugzillaWriteQueueTest)
+    unittest.TextTestRunner(verbosity=2).run(suite)
+    #unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8  foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+import os
+import shutil
+import tempfile
+import unittest
+
+import sys
+sys.path.insert(0, '../..')
+
+import pycurl
+
+from cnucnu.curl_pool import CurlPool
+
+
+class CurlPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "page")
+        with open(self.filename, "w") as f:
+            f.write("content")
+        self.pool = CurlPool()
+
+    def tearDown(self):
+        self.pool.close()
+        shutil.rmtree(self.directory)
+
+    def perform(self, c, **options):
+        body = []
+        c.setopt(pycurl.URL, "file://" + self.filename)
+        c.setopt(pycurl.WRITEFUNCTION, body.append)
+        for option, value in options.items():
+            c.setopt(getattr(pycurl, option), value)
+        c.perform()
+        return "".join(body)
+
+    def testReuse(self):
+        c = self.pool.acquire()
+        self.assertEqual(self.perform(c, NOBODY=1), "")
+        self.pool.release(c)
+
+        # the same handle without the options of the previous transfer
+        reused = self.pool.acquire()
+        self.assertTrue(reused is c)
+        self.assertEqual(self.perform(reused), "content")
+        self.pool.release(reused)
+        self.assertEqual(self.pool.transfers, 2)
+
+    def testConcurrentHandles(self):
+        handles = [self.pool.acquire() for i in range(3)]
+        self.assertEqual(len(set(id(c) for c in handles)), 3)
+        for c in handles:
+            self.pool.release(c, performed=False)
+        # unused handles are not counted as transfers
+        self.assertEqual((len(self.pool.free), self.pool.transfers), (3, 0))
+
+        self.pool.close()
+        self.assertEqual(self.pool.free, [])
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(CurlPoolTest)
+    unittest.TextTestRunner(verbosity=2).run(suite)
+    #unittest.main()
@@ -0,0 +1,120 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8  foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+import unittest
+
+import sys
+sys.path.insert(0, '../..')
+
+from cnucnu import dir_walker
+from cnucnu.dir_walker import DirectoryWalker
+
+
+def listing(*subdirs):
+    return "".join('<a href="%s/">%s/</a>\n' % (subdir, subdir)
+                   for subdir in subdirs)
+
+LISTINGS = {
+    "http://example.com/pub/": listing("1.0", "1.2", "2.0", "docs"),
+    "http://example.com/pub/1.2/": listing("1.2.4", "1.2.10"),
+    "http://example.com/pub/2.0/": listing("2.0.1", "2.0.3", "2.0.2"),
+}
+
+
+class FakeFetcher(object):
+    """ Answers fetches from `LISTINGS` and records the requested URLs,
+    missing listings fail
+    """
+    def __init__(self):
+        self.requests = []
+
+    def fetch(self, urls):
+        urls = sorted(urls)
+        self.requests.append(urls)
+        results = {}
+        for url in urls:
+            if url in LISTINGS:
+                results[url] = (LISTINGS[url], None)
+            else:
+                results[url] = (None, IOError("%s: 404" % url))
+        return results
+
+
+class DirectoryWalkerTest(unittest.TestCase):
+    def setUp(self):
+        self.requests = []
+        self.get_html = dir_walker.get_html
+        dir_walker.get_html = self.fake_get_html
+
+    def tearDown(self):
+        dir_walker.get_html = self.get_html
+
+    def fake_get_html(self, url):
+        self.requests.append(url)
+        if url not in LISTINGS:
+            raise IOError("%s: 404" % url)
+        return LISTINGS[url]
+
+    def testExpand(self):
+        walker = DirectoryWalker()
+        self.assertEqual(walker.expand("http://example.com/pub/*/*/"),
+                         "http://example.com/pub/2.0/2.0.3/")
+        self.assertEqual(walker.expand("http://example.com/pub/1.*/*/"),
+                         "http://example.com/pub/1.2/1.2.10/")
+        self.assertEqual(walker.expand("http://example.com/pub/*/"),
+                         "http://example.com/pub/2.0/")
+        # every listing is retrieved once
+        self.assertEqual(self.requests, ["http://example.com/pub/",
+                                         "http://example.com/pub/2.0/",
+                                         "http://example.com/pub/1.2/"])
+
+    def testExpandFailure(self):
+        walker = DirectoryWalker()
+        for i in range(2):
+            self.assertRaises(IOError, walker.expand,
+                              "http://example.com/missing/*/")
+        self.assertEqual(self.requests, ["http://example.com/missing/"])
+
+    def testExpandMany(self):
+        walker = DirectoryWalker()
+        fetcher = FakeFetcher()
+        expanded = walker.expand_many(["http://example.com/pub/*/*/",
+                                       "http://example.com/pub/1.*/*/",
+                                       "http://example.com/missing/*/"],
+                                      fetcher)
+        self.assertEqual(expanded, {
+            "http://example.com/pub/*/*/": "http://example.com/pub/2.0/2.0.3/",
+            "http://example.com/pub/1.*/*/": "http://example.com/pub/1.2/1.2.10/",
+            # cannot be expanded
+            "http://example.com/missing/*/": "http://example.com/missing/*/"})
+        # level by level, each listing once
+        self.assertEqual(fetcher.requests, [
+            ["http://example.com/missing/", "http://example.com/pub/"],
+            ["http://example.com/pub/1.2/", "http://example.com/pub/2.0/"],
+            []])
+
+        # listings are shared with later expansions
+        self.assertEqual(walker.expand("http://example.com/pub/2.*/*/"),
+                         "http://example.com/pub/2.0/2.0.3/")
+        self.assertEqual(self.requests, [])
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(DirectoryWalkerTest)
+    unittest.TextTestRunner(verbosity=2).run(suite)
+    #unittest.main()
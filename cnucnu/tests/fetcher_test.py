@@ -0,0 +1,105 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8  foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+import os
+import shutil
+import tempfile
+import unittest
+
+import sys
+sys.path.insert(0, '../..')
+
+import pycurl
+
+from cnucnu.curl_pool import CurlPool
+from cnucnu.errors import ResponseTooLargeError
+from cnucnu.fetcher import MultiFetcher
+from cnucnu.host_policy import HostPolicy
+from cnucnu.http_cache import HTTPCache
+
+
+class MultiFetcherTest(unittest.TestCase):
+    """ Fetches local files through file:// URLs instead of upstream pages
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.pool = CurlPool()
+
+    def tearDown(self):
+        self.pool.close()
+        shutil.rmtree(self.directory)
+
+    def url(self, name, content=None):
+        """ Return the URL of the file `name`, written with `content` unless
+        it is None
+        """
+        filename = os.path.join(self.directory, name)
+        if content is not None:
+            with open(filename, "w") as f:
+                f.write(content)
+        return "file://" + filename
+
+    def fetcher(self, **kwargs):
+        return MultiFetcher(cache=HTTPCache(), pool=self.pool,
+                            policy=HostPolicy(rate=0), **kwargs)
+
+    def testFetch(self):
+        urls = [self.url("page-%i" % i, "content %i" % i) for i in range(10)]
+        missing = self.url("missing")
+        fetched = []
+
+        def callback(url, data, error):
+            fetched.append(url)
+
+        results = self.fetcher(max_connections=3).fetch(
+            urls + [missing, urls[0]], callback=callback)
+        # every URL once, duplicates are fetched only once
+        self.assertEqual(sorted(fetched), sorted(urls + [missing]))
+        for i, url in enumerate(urls):
+            self.assertEqual(results[url], ("content %i" % i, None))
+        # the failure only affects its own URL
+        data, error = results[missing]
+        self.assertEqual(data, None)
+        self.assertTrue(isinstance(error, pycurl.error))
+        self.assertEqual(self.pool.transfers, 11)
+
+    def testFetchNothing(self):
+        self.assertEqual(self.fetcher().fetch([]), {})
+
+    def testMaxBodySize(self):
+        small = self.url("small", "x" * 100)
+        large = self.url("large", "x" * 100000)
+        results = self.fetcher(max_body_size=1000).fetch([small, large])
+        self.assertEqual(results[small], ("x" * 100, None))
+        data, error = results[large]
+        self.assertEqual(data, None)
+        self.assertTrue(isinstance(error, ResponseTooLargeError))
+
+    def testReuse(self):
+        fetcher = self.fetcher(max_connections=2)
+        url = self.url("page", "content")
+        self.assertEqual(fetcher.fetch([url]), {url: ("content", None)})
+        self.assertEqual(fetcher.fetch([url]), {url: ("content", None)})
+        # all handles went back to the pool
+        self.assertEqual(len(self.pool.free), 1)
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(MultiFetcherTest)
+    unittest.TextTestRunner(verbosity=2).run(suite)
+    #unittest.main()
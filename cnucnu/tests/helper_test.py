@@ -17,12 +17,16 @@
 #    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
 # }}}
 
+import random
 import unittest
 
 import sys
 sys.path.insert(0, '../..')
 
-from cnucnu.helper import upstream_cmp, upstream_max, split_rc, cmp_upstream_repo, get_rc, get_html, expand_subdirs
+import pycurl
+
+from cnucnu.errors import ResponseTooLargeError
+from cnucnu.helper import upstream_cmp, upstream_max, split_rc, cmp_upstream_repo, get_rc, get_html, expand_subdirs, rpm_supports_caret, rpm_version_key, upstream_version_key, BodyBuffer
 
 class HelperTest(unittest.TestCase):
 
@@ -158,10 +162,81 @@ class HelperTest(unittest.TestCase):
 #
 #        self.assertEqual(data1, data2)
 
+    def test_rpm_version_key(self):
+        def rpm_key_cmp(v1, v2):
+            return cmp(rpm_version_key(v1), rpm_version_key(v2))
+
+        self.assertEqual(rpm_key_cmp("1.0", "1.0"), 0)
+        self.assertEqual(rpm_key_cmp("1.0", "1.0.1"), -1)
+        self.assertEqual(rpm_key_cmp("1.10", "1.9"), 1)
+        self.assertEqual(rpm_key_cmp("1.01", "1.1"), 0)
+        self.assertEqual(rpm_key_cmp("1.0a", "1.0"), 1)
+        self.assertEqual(rpm_key_cmp("1a", "1.a"), 0)
+        self.assertEqual(rpm_key_cmp("2.0", "2_0"), 0)
+        self.assertEqual(rpm_key_cmp("a", "1"), -1)
+        self.assertEqual(rpm_key_cmp("1.0~rc1", "1.0"), -1)
+        self.assertEqual(rpm_key_cmp("1.0~rc1", "1.0~rc2"), -1)
+        if rpm_supports_caret():
+            self.assertEqual(rpm_key_cmp("1.0^git1", "1.0"), 1)
+            self.assertEqual(rpm_key_cmp("1.0^git1", "1.0.1"), -1)
+        else:
+            self.assertEqual(rpm_key_cmp("1.0^git1", "1.0.git1"), 0)
+
+    def test_upstream_version_key_order(self):
+        """ upstream_version_key orders like upstream_cmp for random pairs of
+        versions
+        """
+        rng = random.Random(0)
+        chars = "0123456789.-_~^abzAZ"
+        rc_strings = ["rc", "RC", "pre", "beta", "alpha", "dev"]
+
+        def random_version():
+            version = "".join(rng.choice(chars)
+                              for i in range(rng.randint(0, 8)))
+            if rng.random() < 0.4:
+                version += rng.choice(["", ".", "-"]) + \
+                    rng.choice(rc_strings) + rng.choice(["", "1", "02", "10"])
+            return version
+
+        for i in range(2000):
+            v1 = random_version()
+            v2 = random_version()
+            self.assertEqual(
+                cmp(upstream_version_key(v1), upstream_version_key(v2)),
+                upstream_cmp(v1, v2), "%r %r" % (v1, v2))
+
     def test_snapshot_version_with_dash(self):
        # first newer
         self.assertEqual(upstream_cmp("1.8.23-20100128-r1100", "1.8.23-20091230-r1079"), 1)
 
+    def test_body_buffer(self):
+        body = BodyBuffer("http://example.com/", max_size=10)
+        self.assertEqual(body.write("12345"), None)
+        self.assertEqual(body.write("67890"), None)
+        self.assertEqual(body.getvalue(), "1234567890")
+        error = pycurl.error(pycurl.E_COULDNT_CONNECT, "refused")
+        self.assertTrue(body.check_error(error) is error)
+
+    def test_body_buffer_too_large(self):
+        body = BodyBuffer("http://example.com/", max_size=10)
+        body.write("12345")
+        # aborts the transfer
+        self.assertEqual(body.write("678901"), 0)
+        self.assertEqual(body.getvalue(), "12345")
+        error = body.check_error(pycurl.error(pycurl.E_WRITE_ERROR, "abort"))
+        self.assertTrue(isinstance(error, ResponseTooLargeError))
+
+        # announced by the server
+        body = BodyBuffer("http://example.com/", max_size=10)
+        error = body.check_error(pycurl.error(pycurl.E_FILESIZE_EXCEEDED,
+                                              "too large"))
+        self.assertTrue(isinstance(error, ResponseTooLargeError))
+
+    def test_body_buffer_unlimited(self):
+        body = BodyBuffer("http://example.com/")
+        body.write("x" * 100000)
+        self.assertEqual(body.size, 100000)
+
 
 if __name__ == "__main__":
     suite = unittest.TestLoader().loadTestsFromTestCase(HelperTest)
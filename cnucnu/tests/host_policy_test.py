@@ -0,0 +1,118 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8  foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+
+import threading
+import time
+import unittest
+
+import sys
+sys.path.insert(0, '../..')
+
+import pycurl
+
+from cnucnu.errors import HostUnavailableError
+from cnucnu.host_policy import HostPolicy
+
+
+class HostPolicyTest(unittest.TestCase):
+    def setUp(self):
+        self.policy = HostPolicy(rate=2.0, failure_threshold=3,
+                                 circuit_time=60, connect_timeout=10,
+                                 min_timeout=30, max_timeout=120,
+                                 timeout_factor=10)
+        self.url = "http://example.com/releases/"
+
+    def testCircuitBreaker(self):
+        connect_error = pycurl.error(pycurl.E_COULDNT_CONNECT, "refused")
+        for i in range(2):
+            self.policy.failed(self.url, connect_error)
+        self.policy.check(self.url)
+
+        self.policy.failed(self.url, connect_error)
+        self.assertRaises(HostUnavailableError, self.policy.check,
+                          "http://EXAMPLE.com/other/")
+        # other hosts are not affected
+        self.policy.check("http://example.org/releases/")
+        self.assertEqual(self.policy.error(self.url, time.time() + 61), None)
+
+    def testHTTPErrorsKeepCircuitClosed(self):
+        http_error = pycurl.error(pycurl.E_HTTP_RETURNED_ERROR, "404")
+        for i in range(5):
+            self.policy.failed(self.url, http_error)
+        self.policy.check(self.url)
+
+    def testTransferTimeoutKeepsCircuitClosed(self):
+        timeout = pycurl.error(pycurl.E_OPERATION_TIMEOUTED, "timeout")
+        for i in range(5):
+            # connected, but the transfer took too long
+            self.policy.failed(self.url, timeout, connect_time=0.2)
+        self.policy.check(self.url)
+        for i in range(3):
+            self.policy.failed(self.url, timeout, connect_time=0)
+        self.assertRaises(HostUnavailableError, self.policy.check, self.url)
+
+    def testSuccessResetsFailures(self):
+        timeout = pycurl.error(pycurl.E_OPERATION_TIMEOUTED, "timeout")
+        self.policy.failed(self.url, timeout)
+        self.policy.failed(self.url, timeout)
+        self.policy.succeeded(self.url, 0.1)
+        self.policy.failed(self.url, timeout)
+        self.policy.check(self.url)
+
+    def testRate(self):
+        now = time.time()
+        self.assertEqual(self.policy.delay(self.url, now), 0)
+        self.policy.started(self.url, now)
+        self.assertAlmostEqual(self.policy.delay(self.url, now), 0.5)
+        self.assertEqual(self.policy.delay("http://example.org/", now), 0)
+        self.assertEqual(self.policy.delay(self.url, now + 0.5), 0)
+
+    def testConcurrentWait(self):
+        policy = HostPolicy(rate=20.0)
+        start = time.time()
+        threads = [threading.Thread(target=policy.wait, args=(self.url, ))
+                   for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # every thread got its own slot, the last one 4 / 20 s later
+        self.assertTrue(time.time() - start >= 0.19)
+        self.assertTrue(policy.hosts["example.com"].last_start - start
+                        >= 0.19)
+
+    def testAdaptiveTimeouts(self):
+        self.assertEqual(self.policy.timeouts(self.url), (10, 30))
+        # fast hosts keep the minimum timeout
+        self.policy.succeeded(self.url, 0.1)
+        self.assertEqual(self.policy.timeouts(self.url), (10, 30))
+        self.policy.succeeded(self.url, 10.0)
+        # 0.7 * 0.1 + 0.3 * 10.0
+        self.assertEqual(self.policy.timeouts(self.url), (10, 30))
+        self.policy.succeeded(self.url, 10.0)
+        # 0.7 * 3.07 + 0.3 * 10.0
+        self.assertEqual(self.policy.timeouts(self.url), (10, 51))
+        self.policy.succeeded(self.url, 60)
+        self.assertEqual(self.policy.timeouts(self.url), (10, 120))
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(HostPolicyTest)
+    unittest.TextTestRunner(verbosity=2).run(suite)
+    #unittest.main()
@@ -0,0 +1,115 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8  foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import sys
+sys.path.insert(0, '../..')
+
+from cnucnu.http_cache import HTTPCache
+
+
+class HTTPCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testDisabled(self):
+        cache = HTTPCache(directory="")
+        cache.store("http://example.com/", '"etag"', None, "body")
+        self.assertEqual(cache.lookup("http://example.com/"), None)
+        self.assertEqual(cache.transfer("http://example.com/"), None)
+
+    def testStoreLookup(self):
+        cache = HTTPCache(directory=self.directory)
+        url = "http://example.com/"
+        cache.store(url, '"etag"', "Sat, 01 Jan 2000 00:00:00 GMT", "body")
+
+        entry = HTTPCache(directory=self.directory).lookup(url)
+        self.assertEqual(entry["etag"], '"etag"')
+        self.assertEqual(entry["last_modified"],
+                         "Sat, 01 Jan 2000 00:00:00 GMT")
+        self.assertEqual(entry["body"], "body")
+
+    def testNoValidators(self):
+        cache = HTTPCache(directory=self.directory)
+        cache.store("http://example.com/", None, None, "body")
+        self.assertEqual(cache.lookup("http://example.com/"), None)
+
+    def testTTL(self):
+        url = "http://example.com/"
+        cache = HTTPCache(directory=self.directory, ttl=60)
+        cache.store(url, '"etag"', None, "body")
+        self.assertNotEqual(cache.lookup(url), None)
+
+        cache = HTTPCache(directory=self.directory, ttl=-1)
+        self.assertEqual(cache.lookup(url), None)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def testNoTTL(self):
+        url = "http://example.com/"
+        cache = HTTPCache(directory=self.directory, ttl=0)
+        cache.store(url, '"etag"', None, "body")
+        # validated long ago
+        os.utime(cache._filename(url), (0, 0))
+        self.assertEqual(cache.lookup(url)["body"], "body")
+
+    def testRevalidatedKeepsBody(self):
+        url = "http://example.com/"
+        cache = HTTPCache(directory=self.directory, ttl=60)
+        cache.store(url, '"etag"', None, "body")
+        filename = cache._filename(url)
+        # validated 50 seconds ago
+        os.utime(filename, (time.time(), time.time() - 50))
+        inode = os.stat(filename).st_ino
+        cache.revalidated(cache.lookup(url))
+        # the file was not rewritten, only its validation time changed
+        self.assertEqual(os.stat(filename).st_ino, inode)
+        self.assertNotEqual(HTTPCache(directory=self.directory,
+                                      ttl=30).lookup(url), None)
+
+    def testEvictLeastRecentlyUsed(self):
+        cache = HTTPCache(directory=self.directory)
+        for i in range(3):
+            cache.store("http://example.com/%i" % i, '"etag"', None,
+                        "x" * 1000)
+            # make sure each entry has a different time of last use
+            os.utime(cache._filename("http://example.com/%i" % i),
+                     (i, time.time()))
+        cache._files = None
+        # use first entry
+        cache.lookup("http://example.com/0")
+
+        cache.max_size = cache._size - 1
+        cache.evict()
+        self.assertNotEqual(cache.lookup("http://example.com/0"), None)
+        self.assertEqual(cache.lookup("http://example.com/1"), None)
+        self.assertNotEqual(cache.lookup("http://example.com/2"), None)
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(HTTPCacheTest)
+    unittest.TextTestRunner(verbosity=2).run(suite)
+    #unittest.main()
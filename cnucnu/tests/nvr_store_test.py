@@ -0,0 +1,86 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8  foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+
+import fnmatch
+import random
+import unittest
+
+import sys
+sys.path.insert(0, '../..')
+
+from cnucnu.nvr_store import NVRStore
+
+NVR_DICT = {"cnucnu": ("0.1", "1.fc21"),
+            "python-foo": ("1.2", "3.fc21"),
+            "python-bar": ("1.2", "1.fc21"),
+            "python": ("2.7.6", "1.fc21"),
+            "pythonfoo": ("1", "1.fc21"),
+            "zsh": ("5.0.5", "1.fc21")}
+
+
+class NVRStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.store = NVRStore(NVR_DICT)
+
+    def test_lookup(self):
+        for name, nvr in NVR_DICT.items():
+            self.assertEqual(self.store[name], nvr)
+            self.assertTrue(name in self.store)
+        self.assertRaises(KeyError, self.store.__getitem__, "missing")
+        self.assertFalse("missing" in self.store)
+        self.assertEqual(self.store.get("missing"), None)
+
+    def test_mapping(self):
+        self.assertEqual(len(self.store), len(NVR_DICT))
+        self.assertEqual(self.store.keys(), sorted(NVR_DICT.keys()))
+        self.assertEqual(dict(self.store.items()), NVR_DICT)
+        self.assertFalse(NVRStore())
+
+    def test_unicode(self):
+        store = NVRStore({u"foo": (u"1.0", u"1.fc21"), "bar": ("2.0", "1")})
+        self.assertEqual(store["foo"], ("1.0", "1.fc21"))
+        self.assertEqual(store[u"foo"], ("1.0", "1.fc21"))
+        self.assertEqual(store.keys(), ["bar", "foo"])
+        self.assertTrue(all(type(name) is str for name in store.keys()))
+
+    def test_prefix(self):
+        self.assertEqual(self.store.prefix("python-"),
+                         ["python-bar", "python-foo"])
+        self.assertEqual(self.store.prefix("python"),
+                         ["python", "python-bar", "python-foo", "pythonfoo"])
+        self.assertEqual(self.store.prefix("perl"), [])
+        self.assertEqual(self.store.prefix(""), sorted(NVR_DICT.keys()))
+
+    def test_match(self):
+        random.seed(0)
+        names = ["".join(random.choice("ab-[") for i in range(
+            random.randint(1, 6))) for number in range(2000)]
+        store = NVRStore(dict((name, ("1", "1")) for name in names))
+        patterns = ["a*", "ab-*", "*-", "?b*", "a[ab]*", "[!a]*", "a-b",
+                    "ab[-]*", "[[]*", "zz*", "*"]
+        matched = store.match_many(patterns)
+        for pattern in patterns:
+            self.assertEqual(matched[pattern],
+                             sorted(set(fnmatch.filter(names, pattern))))
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(NVRStoreTest)
+    unittest.TextTestRunner(verbosity=2).run(suite)
+    #unittest.main()
@@ -22,7 +22,7 @@ import unittest
 import sys
 sys.path.insert(0, '../..')
 
-from cnucnu.package_list import Package, Repository
+from cnucnu.package_list import Package, PackageList, Repository
 
 
 class PackageTest(unittest.TestCase):
@@ -75,7 +75,35 @@ class PackageTest(unittest.TestCase):
         p._html = "cnucnu_test-1.2.3.tar.gz"
         self.assertEqual(p.upstream_versions, ["1.2.3"])
 
+    def testEmptyPage(self):
+        """ An empty prefetched page is not retrieved again """
+        p = Package("cnucnu_test", "DEFAULT", "test_url", Repository())
+        p.set_upstream_page("", "test_url")
+        self.assertEqual(p.html, "")
+
+
+class PackageListTest(unittest.TestCase):
+
+    def testNameIndex(self):
+        repo = Repository()
+        packages = [Package(name, "DEFAULT", "url", repo) for name in
+                    ["python-foo", "python-bar", "perl-foo", "python-foo"]]
+        pl = PackageList(repo=repo, packages=packages[:3])
+        pl.append(packages[3])
+        self.assertEqual(len(pl), 4)
+        self.assertTrue(pl["python-foo"] is packages[0])
+        self.assertRaises(KeyError, pl.__getitem__, "missing")
+        self.assertEqual(pl.names_with_prefix("python-"),
+                         ["python-bar", "python-foo"])
+        pl.append(Package("python-baz", "DEFAULT", "url", repo))
+        self.assertEqual(pl.names_with_prefix("python-b"),
+                         ["python-bar", "python-baz"])
+        self.assertEqual(pl.get_many(["python-foo", "missing"]),
+                         {"python-foo": [packages[0], packages[3]]})
+
 if __name__ == "__main__":
-    suite = unittest.TestLoader().loadTestsFromTestCase(PackageTest)
+    suite = unittest.TestSuite([
+        unittest.TestLoader().loadTestsFromTestCase(PackageTest),
+        unittest.TestLoader().loadTestsFromTestCase(PackageListTest)])
     unittest.TextTestRunner(verbosity=2).run(suite)
     #unittest.main()
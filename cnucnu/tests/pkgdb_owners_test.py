@@ -0,0 +1,92 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8  foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+
+import shutil
+import tempfile
+import unittest
+
+import sys
+sys.path.insert(0, '../..')
+
+from cnucnu.pkgdb_owners import OwnerResolver
+
+PAGES = {"alice": [["a1", "a2"], ["a3"], ["a4"]],
+         "bob": [["b1"]],
+         "carol": [[]],
+         # the second page fails
+         "dave": [["d1"], None]}
+
+
+class FakeOwnerResolver(OwnerResolver):
+    """ Answers page requests from `PAGES` instead of pkgdb """
+    requests = []
+
+    def _get_page(self, owner, page):
+        self.requests.append((owner, page))
+        pages = PAGES[owner]
+        if pages[page - 1] is None:
+            raise IOError("pkgdb error")
+        return {"packages": [{"name": name} for name in pages[page - 1]],
+                "page": page, "page_total": len(pages)}
+
+
+class OwnerResolverTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        FakeOwnerResolver.requests = []
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def testResolve(self):
+        resolver = FakeOwnerResolver(cache_dir=self.cache_dir, threads=2)
+        packages = resolver.resolve(["alice", "bob", "carol", "bob"])
+        self.assertEqual(packages, set(["a1", "a2", "a3", "a4", "b1"]))
+        self.assertEqual(sorted(resolver.requests),
+                         [("alice", 1), ("alice", 2), ("alice", 3),
+                          ("bob", 1), ("carol", 1)])
+
+    def testCache(self):
+        FakeOwnerResolver(cache_dir=self.cache_dir).resolve(["alice", "bob"])
+
+        FakeOwnerResolver.requests = []
+        resolver = FakeOwnerResolver(cache_dir=self.cache_dir)
+        packages = resolver.resolve(["alice", "bob"])
+        self.assertEqual(packages, set(["a1", "a2", "a3", "a4", "b1"]))
+        self.assertEqual(resolver.requests, [])
+        self.assertEqual(resolver.cached, 2)
+
+        # expired
+        resolver = FakeOwnerResolver(cache_dir=self.cache_dir, ttl=-1)
+        resolver.resolve(["bob"])
+        self.assertEqual(resolver.requests, [("bob", 1)])
+
+    def testPartialLookupNotCached(self):
+        resolver = FakeOwnerResolver(cache_dir=self.cache_dir)
+        # only the failing owner is left out
+        self.assertEqual(resolver.resolve(["dave", "bob"]), set(["b1"]))
+        self.assertEqual(resolver._load("dave"), None)
+        self.assertEqual(resolver.summary, "1 owners looked up, 0 from the "
+                         "cache, 1 failed")
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(OwnerResolverTest)
+    unittest.TextTestRunner(verbosity=2).run(suite)
+    #unittest.main()
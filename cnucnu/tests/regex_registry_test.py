@@ -0,0 +1,55 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8  foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+
+import sre_constants
+import unittest
+
+import sys
+sys.path.insert(0, '../..')
+
+from cnucnu.regex_registry import RegexRegistry
+
+
+class RegexRegistryTest(unittest.TestCase):
+
+    def testShareCompiledPattern(self):
+        registry = RegexRegistry()
+        first = registry.compile("foo-([0-9.]+)")
+        self.assertTrue(registry.compile("foo-([0-9.]+)") is first)
+        self.assertEqual(first.findall("foo-1.2 foo-1.3"), ["1.2", "1.3"])
+        self.assertEqual(registry.lookups, 2)
+        self.assertEqual(registry.hits, 1)
+
+    def testInvalidPattern(self):
+        registry = RegexRegistry()
+        self.assertRaises(sre_constants.error, registry.compile, "foo-(")
+        self.assertRaises(sre_constants.error, registry.compile, "foo-(")
+        self.assertEqual(registry.errors.keys(), ["foo-("])
+
+    def testCompileAll(self):
+        registry = RegexRegistry()
+        invalid = registry.compile_all(["a(b)", "a(", "a(b)", "[a"])
+        self.assertEqual(sorted(invalid.keys()), ["[a", "a("])
+        self.assertEqual(registry.compiled.keys(), ["a(b)"])
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(RegexRegistryTest)
+    unittest.TextTestRunner(verbosity=2).run(suite)
+    #unittest.main()
@@ -0,0 +1,135 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8  foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import sys
+sys.path.insert(0, '../..')
+
+from cnucnu.repodata import RepodataReader
+
+REPOMD = """<?xml version="1.0" encoding="UTF-8"?>
+<repomd xmlns="http://linux.duke.edu/metadata/repo">
+  <revision>1400000000</revision>
+  <data type="%(type)s">
+    <checksum type="sha256">%(checksum)s</checksum>
+    <location href="repodata/%(filename)s"/>
+  </data>
+</repomd>
+"""
+
+PACKAGE = """<package type="rpm">
+  <name>%s</name>
+  <arch>%s</arch>
+  <version epoch="%s" ver="%s" rel="%s"/>
+  <summary>Test package</summary>
+</package>
+"""
+
+PACKAGES = [("cnucnu", "src", "0", "0.1", "1.fc21"),
+            ("foo", "src", "0", "1.2", "3.fc21"),
+            ("foo", "src", "0", "1.10", "1.fc21"),
+            ("bar", "noarch", "0", "2.0", "1.fc21"),
+            # the epoch wins over the version
+            ("baz", "src", "1", "1.0", "1.fc21"),
+            ("baz", "src", "0", "2.0", "1.fc21")]
+
+
+class RepodataTest(unittest.TestCase):
+    def setUp(self):
+        self.repo = tempfile.mkdtemp()
+        self.cache_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.repo, "repodata"))
+
+    def tearDown(self):
+        shutil.rmtree(self.repo)
+        shutil.rmtree(self.cache_dir)
+
+    def write_repomd(self, type_, filename, checksum):
+        repomd = open(os.path.join(self.repo, "repodata", "repomd.xml"), "w")
+        repomd.write(REPOMD % {"type": type_, "filename": filename,
+                               "checksum": checksum})
+        repomd.close()
+
+    def write_primary_xml(self, packages, checksum="1"):
+        primary = gzip.open(
+            os.path.join(self.repo, "repodata", "primary.xml.gz"), "wb")
+        primary.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                      '<metadata xmlns="http://linux.duke.edu/metadata/common"'
+                      ' packages="%i">\n' % len(packages))
+        for package in packages:
+            primary.write(PACKAGE % package)
+        primary.write("</metadata>\n")
+        primary.close()
+        self.write_repomd("primary", "primary.xml.gz", checksum)
+
+    def testPrimaryXML(self):
+        self.write_primary_xml(PACKAGES)
+        nvr_dict = RepodataReader(self.repo).nvr_dict()
+        self.assertEqual(nvr_dict, {"cnucnu": ("0.1", "1.fc21"),
+                                    "foo": ("1.10", "1.fc21"),
+                                    "baz": ("1.0", "1.fc21")})
+
+    def testPackageNames(self):
+        self.write_primary_xml(PACKAGES)
+        nvr_dict = RepodataReader("file://" + self.repo).nvr_dict(
+            ["cnucnu", "missing"])
+        self.assertEqual(nvr_dict, {"cnucnu": ("0.1", "1.fc21")})
+
+    def testPrimaryDB(self):
+        filename = os.path.join(self.repo, "repodata", "primary.sqlite")
+        connection = sqlite3.connect(filename)
+        connection.execute("CREATE TABLE packages "
+                           "(name TEXT, arch TEXT, epoch TEXT, "
+                           "version TEXT, release TEXT)")
+        connection.executemany("INSERT INTO packages VALUES (?, ?, ?, ?, ?)",
+                               PACKAGES)
+        connection.commit()
+        connection.close()
+        self.write_repomd("primary_db", "primary.sqlite", "1")
+
+        nvr_dict = RepodataReader(self.repo).nvr_dict()
+        self.assertEqual(nvr_dict, {"cnucnu": ("0.1", "1.fc21"),
+                                    "foo": ("1.10", "1.fc21"),
+                                    "baz": ("1.0", "1.fc21")})
+
+    def testCache(self):
+        self.write_primary_xml(PACKAGES)
+        reader = RepodataReader(self.repo, cache_dir=self.cache_dir)
+        self.assertEqual(len(reader.nvr_dict()), 3)
+
+        # unchanged checksum, the cached result is used
+        self.write_primary_xml(PACKAGES[:1])
+        self.assertEqual(len(reader.nvr_dict()), 3)
+
+        # new checksum
+        self.write_primary_xml(PACKAGES[:1], checksum="2")
+        self.assertEqual(len(reader.nvr_dict()), 1)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(RepodataTest)
+    unittest.TextTestRunner(verbosity=2).run(suite)
+    #unittest.main()
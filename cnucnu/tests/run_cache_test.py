@@ -0,0 +1,85 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8  foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+import unittest
+
+import sys
+sys.path.insert(0, '../..')
+
+from cnucnu.run_cache import RunCache
+
+
+class CountingFetch(object):
+    """ Fetch function that counts its calls and fails for missing pages """
+    def __init__(self, pages):
+        self.pages = pages
+        self.calls = []
+
+    def __call__(self, url):
+        self.calls.append(url)
+        if url not in self.pages:
+            raise IOError("%s: 404" % url)
+        return self.pages[url]
+
+
+class RunCacheTest(unittest.TestCase):
+    def testGetPage(self):
+        run_cache = RunCache()
+        fetch = CountingFetch({"http://example.com/foo/": "foo-1.0"})
+        for i in range(3):
+            self.assertEqual(run_cache.get_page("http://example.com/foo/",
+                                                fetch), "foo-1.0")
+        self.assertEqual(fetch.calls, ["http://example.com/foo/"])
+        self.assertEqual((run_cache.fetches, run_cache.saved_fetches),
+                         (1, 2))
+
+    def testGetPageFailure(self):
+        run_cache = RunCache()
+        fetch = CountingFetch({})
+        errors = []
+        for i in range(3):
+            try:
+                run_cache.get_page("http://example.com/dead/", fetch)
+            except IOError, e:
+                errors.append(e)
+        # the dead URL is only tried once, later lookups get the same error
+        self.assertEqual(fetch.calls, ["http://example.com/dead/"])
+        self.assertEqual(len(errors), 3)
+        self.assertTrue(errors[0] is errors[2])
+        self.assertEqual((run_cache.fetches, run_cache.saved_fetches),
+                         (1, 2))
+
+    def testPrefetched(self):
+        run_cache = RunCache()
+        fetch = CountingFetch({})
+        run_cache.add_page("http://example.com/foo/", "foo-1.0", users=3)
+        run_cache.add_error("http://example.com/dead/", IOError("404"),
+                            users=2)
+        self.assertEqual(run_cache.get_page("http://example.com/foo/",
+                                            fetch), "foo-1.0")
+        self.assertRaises(IOError, run_cache.get_page,
+                          "http://example.com/dead/", fetch)
+        self.assertEqual(fetch.calls, [])
+        self.assertEqual(run_cache.summary, "fetched 2 upstream pages, saved "
+                         "5 fetches, shared 0 results")
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(RunCacheTest)
+    unittest.TextTestRunner(verbosity=2).run(suite)
+    #unittest.main()
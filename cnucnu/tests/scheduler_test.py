@@ -0,0 +1,108 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8  foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import sys
+sys.path.insert(0, '../..')
+
+from cnucnu.scheduler import Scheduler
+from cnucnu.state_store import StateStore
+
+DAY = 86400
+
+
+class FakePackage(object):
+    """ The attributes of `cnucnu.package_list.Package` used by the store """
+    def __init__(self, name, latest_upstream="1.0"):
+        self.name = name
+        self.raw_url = "http://example.com/%s/" % name
+        self.raw_regex = "DEFAULT"
+        self.html = "%s-%s.tar.gz" % (name, latest_upstream)
+        self.repo_version = "1.0"
+        self.repo_release = "1.fc21"
+        self.upstream_versions = [latest_upstream]
+        self.latest_upstream = latest_upstream
+        self.rpm_diff = 0
+        self.nagging = True
+
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.state = StateStore(os.path.join(self.directory, "state.sqlite"))
+        self.scheduler = Scheduler(self.state, min_interval=DAY,
+                                   max_interval=30 * DAY,
+                                   checks_per_release=4)
+
+    def tearDown(self):
+        self.state.close()
+        shutil.rmtree(self.directory)
+
+    def testInterval(self):
+        now = 1000 * DAY
+        interval = self.scheduler.interval
+        self.assertEqual(interval([], now), DAY)
+        # weekly releases
+        weekly = [now - 21 * DAY, now - 14 * DAY, now - 7 * DAY, now - DAY]
+        self.assertEqual(interval(weekly, now), 7 * DAY / 4.0)
+        # dormant for a year
+        self.assertEqual(interval(weekly[:1], now + 365 * DAY), 30 * DAY)
+        # daily releases
+        daily = [now - 2 * DAY, now - DAY, now]
+        self.assertEqual(interval(daily, now), DAY)
+
+    def testDue(self):
+        packages = [FakePackage(name) for name in "abcd"]
+        now = 1000 * DAY
+        for package in packages[:3]:
+            self.state.record(package)
+        self.state.set_next_check(packages[0], now + DAY)
+        self.state.set_next_check(packages[1], now - DAY)
+        self.state.set_next_check(packages[2], now - 2 * DAY)
+
+        self.assertEqual(self.scheduler.due(packages, now), packages[1:])
+
+        # the most overdue packages within the budget, in list order
+        self.scheduler.budget = 2
+        self.assertEqual(self.scheduler.due(packages, now),
+                         [packages[2], packages[3]])
+
+    def testReschedule(self):
+        package = FakePackage("a")
+        self.state.record(package)
+        next_check = self.scheduler.reschedule(package)
+        self.assertEqual(self.state.next_checks()[self.state.key(package)],
+                         next_check)
+        self.assertEqual(len(self.state.release_times(package)), 1)
+
+        # same version again, no new release
+        self.state.record(package)
+        self.assertEqual(len(self.state.release_times(package)), 1)
+        self.state.record(FakePackage("a", "1.1"))
+        self.assertEqual(len(self.state.release_times(package)), 2)
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(SchedulerTest)
+    unittest.TextTestRunner(verbosity=2).run(suite)
+    #unittest.main()
@@ -0,0 +1,208 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8  foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+import sys
+sys.path.insert(0, '../..')
+
+import cnucnu.fetcher
+from cnucnu import scm as scm_module
+from cnucnu.scm import SCM, MirrorSCM, get_scm
+
+SOURCES = {"foo": "d41d8cd98f00b204e9800998ecf8427e  foo-1.2.tar.gz\n",
+           "bar": "d41d8cd98f00b204e9800998ecf8427e  bar-0.9.tar.bz2\n"
+                  "d41d8cd98f00b204e9800998ecf8427e  bar-data.zip\n"}
+
+
+class FakePackage(dict):
+    def __init__(self, name, latest_upstream):
+        dict.__init__(self, name=name)
+        self.latest_upstream = latest_upstream
+
+
+class FakeFetcher(object):
+    """ Answers fetches from `pages` and records the requested URLs, missing
+    pages fail
+    """
+    def __init__(self, pages={}, **kwargs):
+        self.pages = pages
+        self.kwargs = kwargs
+        self.requests = []
+
+    def fetch(self, urls):
+        urls = sorted(urls)
+        self.requests.append(urls)
+        results = {}
+        for url in urls:
+            if url in self.pages:
+                results[url] = (self.pages[url], None)
+            else:
+                results[url] = (None, IOError("%s: 404" % url))
+        return results
+
+
+class SCMTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.scm = SCM(view_scm_url="https://example.com/%(name)s/sources",
+                       cache_dir=self.directory)
+        self.downloads = []
+        self.secure_download = scm_module.secure_download
+        scm_module.secure_download = self.download
+
+    def tearDown(self):
+        scm_module.secure_download = self.secure_download
+        shutil.rmtree(self.directory)
+
+    def download(self, url, cainfo="", cache=None):
+        self.downloads.append((url, cache))
+        return "d41d8cd98f00b204e9800998ecf8427e  downloaded-1.0.tar.gz\n"
+
+    def testPrefetch(self):
+        fetcher = FakeFetcher({"https://example.com/foo/sources":
+                               SOURCES["foo"]})
+        self.scm.prefetch_sources([{"name": "foo"}, {"name": "bar"},
+                                   {"name": "foo"}], fetcher)
+        self.assertEqual(fetcher.requests,
+                         [["https://example.com/bar/sources",
+                           "https://example.com/foo/sources"]])
+        self.assertEqual(self.scm.get_sourcefiles({"name": "foo"}),
+                         ["foo-1.2.tar.gz"])
+        self.assertEqual(self.downloads, [])
+
+        # prefetched sources are not fetched again
+        self.scm.prefetch_sources([{"name": "foo"}], fetcher)
+        self.assertEqual(fetcher.requests[1:], [[]])
+
+    def testPrefetchFailed(self):
+        fetcher = FakeFetcher()
+        self.scm.prefetch_sources([{"name": "bar"}], fetcher)
+        # downloaded one by one instead
+        self.assertEqual(self.scm.get_sourcefiles({"name": "bar"}),
+                         ["downloaded-1.0.tar.gz"])
+        self.assertEqual(self.downloads,
+                         [("https://example.com/bar/sources", self.scm.cache)])
+
+    def testSourcesCache(self):
+        # sources files have their own cache that is revalidated forever
+        self.assertEqual(self.scm.cache.directory, self.directory)
+        self.assertEqual(self.scm.cache.ttl, 0)
+
+        fetchers = []
+
+        def fetcher(**kwargs):
+            fetchers.append(FakeFetcher(**kwargs))
+            return fetchers[-1]
+
+        multi_fetcher = cnucnu.fetcher.MultiFetcher
+        cnucnu.fetcher.MultiFetcher = fetcher
+        try:
+            self.scm.prefetch_sources([{"name": "foo"}])
+        finally:
+            cnucnu.fetcher.MultiFetcher = multi_fetcher
+        # the default fetcher uses the sources cache, not the page cache
+        self.assertTrue(fetchers[0].kwargs["cache"] is self.scm.cache)
+        self.assertEqual(fetchers[0].requests,
+                         [["https://example.com/foo/sources"]])
+
+
+class MirrorSCMTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def check_scm(self, scm):
+        self.assertEqual(sorted(scm.index), ["bar", "foo"])
+        self.assertEqual(scm.get_sourcefiles({"name": "bar"}),
+                         ["bar-0.9.tar.bz2", "bar-data.zip"])
+        self.assertEqual(scm.get_sourcefiles({"name": "missing"}), [])
+        self.assertEqual(scm.get_sources({"name": "foo"}), SOURCES["foo"])
+        self.assertTrue(scm.has_upstream_version(FakePackage("foo", "1.2")))
+        self.assertFalse(scm.has_upstream_version(FakePackage("foo", "1.3")))
+
+    def testSCMAttributes(self):
+        scm = get_scm(backend="mirror", mirror_path=self.directory,
+                      cache_dir=self.directory)
+        self.assertEqual(scm.cache.directory, self.directory)
+        self.assertEqual(scm._sources, {})
+
+    def testTree(self):
+        for name, sources in SOURCES.items():
+            os.mkdir(os.path.join(self.directory, name))
+            with open(os.path.join(self.directory, name, "sources"),
+                      "w") as sources_file:
+                sources_file.write(sources)
+        os.mkdir(os.path.join(self.directory, "no-sources"))
+        self.check_scm(get_scm(backend="mirror", mirror_path=self.directory))
+
+    def testGit(self):
+        work = tempfile.mkdtemp()
+        try:
+            for name, sources in SOURCES.items():
+                bare = os.path.join(self.directory, name + ".git")
+                subprocess.check_call(["git", "init", "-q", "--bare", bare])
+                clone = os.path.join(work, name)
+                subprocess.check_call(["git", "init", "-q", clone])
+                with open(os.path.join(clone, "sources"),
+                          "w") as sources_file:
+                    sources_file.write(sources)
+                git = ["git", "-C", clone, "-c", "user.name=cnucnu",
+                       "-c", "user.email=cnucnu@example.com"]
+                subprocess.check_call(git + ["add", "sources"])
+                subprocess.check_call(git + ["commit", "-q", "-m", "sources"])
+                subprocess.check_call(git + ["push", "-q", bare,
+                                             "HEAD:refs/heads/master"])
+            # packed refs are read as well
+            subprocess.check_call(["git", "--git-dir", os.path.join(
+                self.directory, "bar.git"), "pack-refs", "--all"])
+            subprocess.check_call(["git", "init", "-q", "--bare", os.path.join(
+                self.directory, "no-branch.git")])
+        finally:
+            shutil.rmtree(work)
+        self.check_scm(MirrorSCM(self.directory, mirror_layout="git"))
+
+        batch_size = scm_module.GIT_BATCH_SIZE
+        scm_module.GIT_BATCH_SIZE = 1
+        try:
+            self.check_scm(MirrorSCM(self.directory, mirror_layout="git"))
+        finally:
+            scm_module.GIT_BATCH_SIZE = batch_size
+
+        # read one by one if git cat-file --batch fails
+        scm = MirrorSCM(self.directory, mirror_layout="git")
+
+        def fail(batch):
+            raise OSError("git cat-file exited with 128")
+        scm._cat_file_batch = fail
+        self.check_scm(scm)
+
+
+if __name__ == "__main__":
+    suite = unittest.TestSuite(
+        [unittest.TestLoader().loadTestsFromTestCase(SCMTest),
+         unittest.TestLoader().loadTestsFromTestCase(MirrorSCMTest)])
+    unittest.TextTestRunner(verbosity=2).run(suite)
+    #unittest.main()
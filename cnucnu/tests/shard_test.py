@@ -0,0 +1,94 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8  foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import sys
+sys.path.insert(0, '../..')
+
+from cnucnu.shard import ShardResult, in_shard, merge_results, parse_shard
+
+
+class FakePackage(object):
+    def __init__(self, name):
+        self.name = name
+        self.url = "http://example.com/%s/" % name
+        self.repo_version = "1.0"
+        self.repo_release = "1.fc21"
+        self.latest_upstream = "1.1"
+
+
+class ShardTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testParseShard(self):
+        self.assertEqual(parse_shard("2/4"), (2, 4))
+        for text in ["0/4", "5/4", "2", "a/b"]:
+            self.assertRaises(ValueError, parse_shard, text)
+
+    def testInShard(self):
+        names = ["package%i" % i for i in range(100)]
+        shards = [[name for name in names if in_shard(name, shard, 3)]
+                  for shard in range(1, 4)]
+        self.assertEqual(sorted(sum(shards, [])), sorted(names))
+        for shard in shards:
+            self.assertTrue(shard)
+
+    def testMerge(self):
+        create = ("create", "foo", {"short_desc": "foo-1.1 is available"})
+        update = ("update", "bar", {"summary": "bar-2.0 is available",
+                                    "ids": [42]})
+        first = ShardResult(1, 3)
+        first.checked = 2
+        first.add_outdated(FakePackage("foo"))
+        first.plan = [create, update]
+        filename = os.path.join(self.directory, "shard-1.json")
+        first.save(filename)
+        first = ShardResult.load(filename)
+
+        second = ShardResult(2, 3)
+        second.checked = 1
+        second.add_failure(FakePackage("baz"), ValueError("404"))
+        second.plan = [create]
+
+        merged, missing = merge_results([first, second, first])
+        self.assertEqual(missing, [3])
+        self.assertEqual(merged.checked, 3)
+        self.assertEqual([p["name"] for p in merged.outdated], ["foo"])
+        self.assertEqual(merged.failed, [{"name": "baz",
+                                          "error_class": "ValueError",
+                                          "message": "404"}])
+        # every bug is only created once
+        self.assertEqual(merged.plan, [create, update])
+
+        self.assertRaises(ValueError, merge_results,
+                          [first, ShardResult(1, 2)])
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(ShardTest)
+    unittest.TextTestRunner(verbosity=2).run(suite)
+    #unittest.main()
@@ -0,0 +1,141 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8  foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import sys
+sys.path.insert(0, '../..')
+
+import cnucnu.errors as cc_errors
+from cnucnu.state_store import StateStore
+
+DAY = 86400
+
+
+class FakePackage(object):
+    """ The attributes of `cnucnu.package_list.Package` used by the store """
+    def __init__(self, html, repo_version="1.0"):
+        self.name = "foo"
+        self.raw_url = "http://example.com/foo/"
+        self.raw_regex = "DEFAULT"
+        self.html = html
+        self.repo_version = repo_version
+        self.repo_release = "1.fc21"
+        self.upstream_versions = ["1.0", "1.1"]
+        self.latest_upstream = "1.1"
+        self.rpm_diff = 1
+        self.nagging = True
+        self._upstream_versions = None
+        self._latest_upstream = None
+        self._rpm_diff = None
+
+
+class StateStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "state.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testRestoreUnchanged(self):
+        store = StateStore(self.filename)
+        package = FakePackage("foo-1.0.tar.gz foo-1.1.tar.gz")
+        self.assertFalse(store.restore_unchanged(package))
+        store.record(package)
+        store.close()
+
+        store = StateStore(self.filename)
+        package = FakePackage("foo-1.0.tar.gz foo-1.1.tar.gz")
+        self.assertTrue(store.restore_unchanged(package))
+        self.assertEqual(package._upstream_versions, ["1.0", "1.1"])
+        self.assertEqual(package._latest_upstream, "1.1")
+        self.assertEqual(package._rpm_diff, 1)
+
+        # new upstream page
+        self.assertFalse(store.restore_unchanged(
+            FakePackage("foo-1.0.tar.gz foo-1.2.tar.gz")))
+        # new version in the repository
+        self.assertFalse(store.restore_unchanged(
+            FakePackage("foo-1.0.tar.gz foo-1.1.tar.gz", "1.1")))
+        # owner added to or removed from the ignored owners
+        package = FakePackage("foo-1.0.tar.gz foo-1.1.tar.gz")
+        package.nagging = False
+        self.assertFalse(store.restore_unchanged(package))
+        self.assertEqual((store.unchanged_count, store.changed_count), (1, 3))
+        store.close()
+
+    def testFailureBackoff(self):
+        store = StateStore(self.filename, failure_backoff=DAY,
+                           max_failure_backoff=3 * DAY)
+        package = FakePackage("")
+        key = store.key(package)
+        error = cc_errors.UpstreamVersionRetrievalError("404")
+        self.assertEqual(store.record_failure(package, error, 0), DAY)
+        self.assertEqual(store.record_failure(package, error, DAY), 3 * DAY)
+        # limited by max_failure_backoff
+        self.assertEqual(store.record_failure(package, error, 3 * DAY),
+                         6 * DAY)
+        store.close()
+
+        store = StateStore(self.filename)
+        cached = store.backoff_errors(5 * DAY)[key]
+        self.assertTrue(isinstance(cached,
+                                   cc_errors.UpstreamVersionRetrievalError))
+        self.assertTrue(cached.message.startswith("404 "))
+        self.assertEqual(store.backoff_errors(6 * DAY), {})
+
+        failure = store.failures(min_age=DAY, now=5 * DAY)[0]
+        self.assertEqual((failure["error_class"], failure["count"],
+                          failure["first_failed"]),
+                         ("UpstreamVersionRetrievalError", 3, 0))
+        self.assertEqual(store.failures(min_age=6 * DAY, now=5 * DAY), [])
+
+        store.clear_failure(package)
+        self.assertEqual(store.failures(), [])
+        store.close()
+
+    def testBatchedWrites(self):
+        store = StateStore(self.filename, commit_interval=2)
+        reader = StateStore(self.filename)
+        package = FakePackage("foo-1.1.tar.gz")
+        store.record(package)
+        # the package and its first release are written in one transaction
+        self.assertNotEqual(reader.get(package), None)
+        store.set_next_check(package, 42)
+        self.assertEqual(reader.get(package)["next_check"], None)
+        store.close()
+        self.assertEqual(reader.get(package)["next_check"], 42)
+        reader.close()
+
+    def testDisabled(self):
+        store = StateStore("")
+        package = FakePackage("")
+        store.record(package)
+        self.assertFalse(store.restore_unchanged(package))
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(StateStoreTest)
+    unittest.TextTestRunner(verbosity=2).run(suite)
+    #unittest.main()
@@ -0,0 +1,152 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8  foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+import os
+import shutil
+import tempfile
+import unittest
+
+import sys
+sys.path.insert(0, '../..')
+
+from twisted.internet import defer
+
+import cnucnu.errors as cc_errors
+from cnucnu.host_policy import HostPolicy
+from cnucnu.scheduler import Scheduler
+from cnucnu.state_store import StateStore
+from cnucnu.twisted_checker import TwistedChecker
+
+
+class FakePackage(dict):
+    """ The parts of `cnucnu.package_list.Package` used by the checker """
+    def __init__(self, name, html=None, upstream_newer=False):
+        dict.__init__(self, name=name, url="http://example.com/%s/" % name,
+                      regex="DEFAULT")
+        self.name = name
+        self.url = self["url"]
+        self.raw_url = self["url"]
+        self.raw_regex = "DEFAULT"
+        self._html = html
+        self.upstream_newer = upstream_newer
+        self.repo_version = "1.0"
+        self.repo_release = "1.fc21"
+        self.upstream_versions = ["1.0"]
+        self.latest_upstream = "1.0"
+        self.rpm_diff = 0
+        self.nagging = True
+
+    @property
+    def html(self):
+        return self._html
+
+    def set_upstream_page(self, html, url):
+        self._html = html
+
+
+class TwistedCheckerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "state.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def checker(self, state, pages):
+        """ Return a checker that answers fetches from `pages` """
+        checker = TwistedChecker(policy=HostPolicy(rate=0), state=state,
+                                 scheduler=Scheduler(state))
+
+        def fetch(url):
+            if pages.get(url) is None:
+                return defer.fail(cc_errors.UpstreamVersionRetrievalError(
+                    "%s: 404" % url))
+            return defer.succeed(pages[url])
+        checker.fetch = fetch
+        return checker
+
+    def testFetchOnce(self):
+        checker = TwistedChecker(policy=HostPolicy(rate=0))
+        requests = []
+
+        def _fetch(url):
+            requests.append(defer.Deferred())
+            return requests[-1]
+        checker._fetch = _fetch
+
+        results = []
+        for i in range(3):
+            checker.fetch("http://example.com/foo/").addCallback(
+                results.append)
+        # later fetches wait for the first one
+        self.assertEqual((len(requests), results), (1, []))
+        requests[0].callback("foo-1.0")
+        self.assertEqual(results, ["foo-1.0"] * 3)
+
+        # and after it finished, they get its result at once
+        checker.fetch("http://example.com/foo/").addCallback(results.append)
+        self.assertEqual((len(requests), results), (1, ["foo-1.0"] * 4))
+        self.assertEqual((checker.run_cache.fetches,
+                          checker.run_cache.saved_fetches), (1, 3))
+
+    def testFetchFailure(self):
+        checker = TwistedChecker(policy=HostPolicy(rate=0))
+        requests = []
+
+        def _fetch(url):
+            requests.append(defer.Deferred())
+            return requests[-1]
+        checker._fetch = _fetch
+
+        errors = []
+        for i in range(2):
+            checker.fetch("http://example.com/dead/").addErrback(
+                errors.append)
+        requests[0].errback(IOError("404"))
+        checker.fetch("http://example.com/dead/").addErrback(errors.append)
+        # the dead URL is only requested once
+        self.assertEqual(len(requests), 1)
+        self.assertEqual([e.value.args for e in errors], [("404", )] * 3)
+        self.assertTrue(isinstance(
+            checker.run_cache.errors["http://example.com/dead/"], IOError))
+
+    def testState(self):
+        state = StateStore(self.filename)
+        checker = self.checker(state, {"http://example.com/foo/": "foo-1.0"})
+        checker.check(FakePackage("foo"))
+        checker.check(FakePackage("bar"))
+        self.assertEqual(state.changed_count, 1)
+        self.assertNotEqual(state.get(FakePackage("foo")), None)
+        self.assertEqual(list(state.backoff_errors()),
+                         [state.key(FakePackage("bar"))])
+        self.assertNotEqual(state.next_checks()[state.key(
+            FakePackage("foo"))], None)
+
+        # unchanged since the last check
+        checker.check(FakePackage("foo"))
+        self.assertEqual((state.unchanged_count, state.changed_count), (1, 1))
+        checker.check(FakePackage("foo"), ignore_state=True)
+        self.assertEqual((state.unchanged_count, state.changed_count), (1, 1))
+        self.assertEqual(checker.reported, [])
+        state.close()
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TwistedCheckerTest)
+    unittest.TextTestRunner(verbosity=2).run(suite)
+    #unittest.main()
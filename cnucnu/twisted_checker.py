@@ -0,0 +1,297 @@
+#!/usr/bin/python
+# vim: fileencoding=utf8 foldmethod=marker
+# {{{ License header: GPLv2+
+#    This file is part of cnucnu.
+#
+#    Cnucnu is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    Cnucnu is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with cnucnu.  If not, see <http://www.gnu.org/licenses/>.
+# }}}
+""" Check packages as coroutines on the Twisted reactor.
+
+    :author: Till Maas
+    :contact: opensource@till.name
+    :license: GPLv2+
+"""
+__docformat__ = "restructuredtext"
+
+import collections
+import logging
+import pprint as pprint_module
+pp = pprint_module.PrettyPrinter(indent=4)
+
+import time
+
+from twisted.internet import defer, error, reactor, task, threads
+from twisted.python import failure
+from twisted.web.client import HTTPClientFactory
+
+import cnucnu.errors as cc_errors
+from cnucnu import helper
+from cnucnu.host_policy import get_default_policy, url_host
+from cnucnu.run_cache import RunCache
+from cnucnu.scheduler import Scheduler
+from cnucnu.state_store import StateStore
+
+log = logging.getLogger('cnucnu.twisted_checker')
+
+
+class PageFactory(HTTPClientFactory):
+    """ HTTPClientFactory that remembers whether a connection was made """
+    connected = False
+
+    def buildProtocol(self, addr):
+        self.connected = True
+        return HTTPClientFactory.buildProtocol(self, addr)
+
+
+def get_page(url, connect_timeout, timeout):
+    """ Like twisted.web.client.getPage with a connect timeout
+
+    :return: the `PageFactory` of the request, its deferred fires with the
+        page
+    """
+    factory = PageFactory(url, agent=helper.USER_AGENT, timeout=timeout,
+                          followRedirect=True, redirectLimit=10)
+    if factory.scheme == "https":
+        from twisted.internet import ssl
+        reactor.connectSSL(factory.host, factory.port, factory,
+                           ssl.ClientContextFactory(), timeout=connect_timeout)
+    else:
+        reactor.connectTCP(factory.host, factory.port, factory,
+                           timeout=connect_timeout)
+    return factory
+
+
+class TwistedChecker(object):
+    """ Check and report outdated packages from a single reactor thread.
+
+    Fetching upstream pages, expanding globbed directories, extracting
+    versions and comparing them with the repository run as coroutines.
+    Repository queries, SCM lookups and Bugzilla calls block and therefore
+    run in the reactor's thread pool, the bug reports one after the other.
+
+    Like the curlmulti engine, packages whose page and repository version
+    did not change since the last run are restored from `state`, and the
+    results and failures of the others are stored there. The state is only
+    used from the reactor thread.
+
+    :Parameters:
+        max_connections : int
+            Maximum number of transfers in flight at the same time
+        max_host_connections : int
+            Maximum number of transfers in flight to the same host
+        max_body_size : int
+            Maximum size of a response body in bytes, 0 for no limit. The
+            size is only checked after the transfer finished.
+        policy : `cnucnu.host_policy.HostPolicy`
+            Request rate, timeouts and circuit breaker per host, defaults to
+            the configured one
+        state : `cnucnu.state_store.StateStore`
+            Results of previous runs, defaults to a disabled store
+        scheduler : `cnucnu.scheduler.Scheduler`
+            Scheduler to reschedule the checked packages with
+
+    """
+    def __init__(self, max_connections=20, max_host_connections=4,
+                 max_body_size=0, policy=None, state=None, scheduler=None):
+        self.max_body_size = int(max_body_size or 0)
+        if policy is None:
+            policy = get_default_policy()
+        self.policy = policy
+        if state is None:
+            state = StateStore()
+        self.state = state
+        if scheduler is None:
+            scheduler = Scheduler(state)
+        self.scheduler = scheduler
+        # outdated packages whose bug report was queued or not needed
+        self.reported = []
+        self.semaphore = defer.DeferredSemaphore(max(1, int(max_connections)))
+        self.host_semaphores = collections.defaultdict(
+            lambda: defer.DeferredSemaphore(max(1, int(max_host_connections))))
+        self.run_cache = RunCache()
+        self.report_lock = defer.DeferredLock()
+        # url -> result of the fetch or list of Deferreds waiting for it
+        self._fetches = {}
+
+    def fetch(self, url):
+        """ Retrieve `url` once, later calls share the result """
+        if url in self._fetches:
+            self.run_cache.saved_fetches += 1
+            result = self._fetches[url]
+            if isinstance(result, list):
+                waiting = defer.Deferred()
+                result.append(waiting)
+                return waiting
+            elif isinstance(result, failure.Failure):
+                return defer.fail(result)
+            return defer.succeed(result)
+
+        self._fetches[url] = waiting_list = []
+
+        def done(result):
+            self._fetches[url] = result
+            if isinstance(result, failure.Failure):
+                self.run_cache.add_error(url, result.value)
+            else:
+                self.run_cache.add_page(url, result)
+            for waiting in waiting_list:
+                waiting.callback(result)
+            return result
+
+        return self._fetch(url).addBoth(done)
+
+    @defer.inlineCallbacks
+    def _fetch(self, url):
+        if url.startswith("ftp://"):
+            data = yield threads.deferToThread(helper.get_html, url)
+            defer.returnValue(data)
+
+        self.policy.check(url)
+        host_semaphore = self.host_semaphores[url_host(url)]
+        yield host_semaphore.acquire()
+        try:
+            # the circuit might have opened while waiting
+            self.policy.check(url)
+            delay = self.policy.delay(url)
+            while delay:
+                yield task.deferLater(reactor, delay, lambda: None)
+                delay = self.policy.delay(url)
+            self.policy.started(url)
+            started = time.time()
+            connect_timeout, timeout = self.policy.timeouts(url)
+            factories = []
+
+            def start():
+                factory = get_page(url.encode("ascii"), connect_timeout,
+                                   timeout)
+                factories.append(factory)
+                return factory.deferred
+
+            try:
+                data = yield self.semaphore.run(start)
+            except (error.ConnectError, error.TimeoutError):
+                # includes DNS lookup failures and refused connections
+                self.policy.connection_failed(url)
+                raise
+            except defer.TimeoutError:
+                # the transfer timeout only counts if it never connected
+                if not factories[0].connected:
+                    self.policy.connection_failed(url)
+                raise
+            self.policy.succeeded(url, time.time() - started)
+        finally:
+            host_semaphore.release()
+        if self.max_body_size and len(data) > self.max_body_size:
+            raise cc_errors.ResponseTooLargeError(
+                "%s: response body larger than %i bytes" % (
+                    url, self.max_body_size))
+        defer.returnValue(data)
+
+    @defer.inlineCallbacks
+    def expand_subdirs(self, url, glob_char="*"):
+        """ Coroutine version of `cnucnu.helper.expand_subdirs` """
+        parts = helper.split_glob(url, glob_char)
+        while parts:
+            url_prefix, glob_str, url_suffix = parts
+            dir_listing = yield self.fetch(url_prefix)
+            latest = helper.latest_subdir(url, dir_listing, glob_str)
+            if latest is None:
+                break
+            url = "%s%s/%s" % (url_prefix, latest, url_suffix)
+            parts = helper.split_glob(url, glob_char)
+        defer.returnValue(url)
+
+    @defer.inlineCallbacks
+    def check(self, package, dry_run=True, ignore_state=False):
+        try:
+            if package._html is None:
+                try:
+                    url = yield self.expand_subdirs(package.url)
+                    html = yield self.fetch(url)
+                except cc_errors.UpstreamVersionRetrievalError:
+                    raise
+                except Exception, e:
+                    raise cc_errors.UpstreamVersionRetrievalError(
+                        "%(name)s: Error while retrieving upstream URL. - "
+                        "%(url)s - %(regex)s" % package + " " + str(e))
+                package.set_upstream_page(html, url)
+
+            if not ignore_state and self.state.restore_unchanged(package):
+                log.info("package '%s' unchanged since the last run",
+                         package.name)
+                self.scheduler.reschedule(package)
+            elif package.upstream_newer:
+                print "package '%s' outdated (%s < %s)" % (
+                    package.name,
+                    package.repo_version,
+                    package.latest_upstream
+                )
+                # one report at a time, the reporter and its Bugzilla
+                # connection are shared by all packages
+                bug_url = yield self.report_lock.run(
+                    threads.deferToThread, package.report_outdated,
+                    dry_run=dry_run)
+                if bug_url:
+                    print bug_url
+                self.reported.append(package)
+            else:
+                self.state.record(package)
+                self.scheduler.reschedule(package)
+            self.state.clear_failure(package)
+        except cc_errors.UpstreamVersionRetrievalError, e:
+            log.error("Failed to fetch upstream information for "
+                      "package '%s' (%s)" % (package.name, e.message))
+            # unavailable hosts are handled by the host policy
+            if not isinstance(e, cc_errors.HostUnavailableError):
+                self.state.record_failure(package, e)
+        except cc_errors.PackageNotFoundError, e:
+            log.error(e)
+        except Exception, e:
+            log.exception("Exception occured while processing "
+                          "package '%s':\n%s" % (package.name,
+                                                 pp.pformat(e)))
+
+    @defer.inlineCallbacks
+    def check_all(self, packages, repo, dry_run=True, ignore_state=False):
+        # load the repository before any comparison blocks the reactor
+        yield threads.deferToThread(lambda: repo.nvr_dict)
+        log.info("Checking '%i' packages", len(packages))
+        yield defer.DeferredList([self.check(p, dry_run, ignore_state)
+                                  for p in packages])
+
+    def run(self, packages, repo, dry_run=True, run_cache=None,
+            ignore_state=False):
+        """ Check all `packages` and return when all checks finished
+
+        :Parameters:
+            run_cache : `cnucnu.run_cache.RunCache`
+                Store for the pages and versions of this run, usually the one
+                of the `cnucnu.package_list.PackageList` of `packages`
+            ignore_state : bool
+                Check packages even if they did not change since the last run
+
+        :return: outdated packages whose bug report was queued or not needed
+        """
+        if run_cache is not None:
+            self.run_cache = run_cache
+
+        def stop(result):
+            reactor.stop()
+            return result
+
+        reactor.callWhenRunning(
+            lambda: self.check_all(packages, repo, dry_run,
+                                   ignore_state).addBoth(stop))
+        reactor.run()
+        return self.reported